@@ -1,17 +1,89 @@
+import os
+import time
+from datetime import datetime
 import boto3
+from boto3.dynamodb.conditions import Key
 
 dynamodb = boto3.resource('dynamodb')
 table = dynamodb.Table('HospitalQueue')
+# One item per HospitalDay ("<hospital>#<date>"), kept up to date by User_Registration_Lambda
+counters = dynamodb.Table(os.environ.get('QUEUE_LENGTH_TABLE', 'HospitalQueueLength'))
+# Sparse index of the registrations not checked out yet, by HospitalDay
+ACTIVE_INDEX = os.environ.get('ACTIVE_QUEUE_INDEX', 'HospitalDayIndex')
 
 def lambda_handler(event, context):
+    if event.get('action') == 'rebuild_counters':
+        return {
+            'statusCode': 200,
+            'body': {'queueLengths': rebuild_counters(event['hospitals'])}
+        }
+
+    if 'hospitals' in event:
+        # One call for every hospital on the page
+        return {
+            'statusCode': 200,
+            'body': {'queueLengths': get_queue_lengths(event['hospitals'])}
+        }
+
     hospital = event['hospital']
-    
-    response = table.query(
-        IndexName='HospitalIndex',
-        KeyConditionExpression=Key('Hospital').eq(hospital)
-    )
-    
     return {
         'statusCode': 200,
-        'body': {'queueLength': len(response['Items'])}
-    }
\ No newline at end of file
+        'body': {'queueLength': get_queue_lengths([hospital])[hospital]}
+    }
+
+def hospital_day(hospital, day=None):
+    """The HospitalDay key User_Registration_Lambda stores, for ``day`` (default today)."""
+    return f"{hospital}#{day or datetime.now().date().isoformat()}"
+
+def get_queue_lengths(hospitals):
+    """Read today's counters of several hospitals with BatchGetItem (100 keys per call)."""
+    hospitals = list(dict.fromkeys(hospitals))
+    by_key = {hospital_day(h): h for h in hospitals}
+    keys = list(by_key)
+    lengths = {}
+    for i in range(0, len(keys), 100):
+        request = {counters.name: {
+            'Keys': [{'HospitalDay': key} for key in keys[i:i + 100]],
+            'ProjectionExpression': 'HospitalDay, QueueLength',
+        }}
+        delay = 0.05
+        while request:
+            response = dynamodb.batch_get_item(RequestItems=request)
+            for item in response['Responses'].get(counters.name, []):
+                lengths[by_key[item['HospitalDay']]] = int(item['QueueLength'])
+            request = response.get('UnprocessedKeys')
+            if request:
+                time.sleep(delay)  # throttled: back off before retrying the rest
+                delay = min(delay * 2, 1)
+
+    # Hospitals without a counter for today yet (no registration so far, or
+    # before the first rebuild)
+    for hospital in hospitals:
+        if hospital not in lengths:
+            lengths[hospital] = count_queue(hospital)
+    return lengths
+
+def count_queue(hospital):
+    """Count today's registrations of a hospital not checked out yet on
+    ACTIVE_INDEX (checkout removes HospitalDay), following every page."""
+    kwargs = {
+        'IndexName': ACTIVE_INDEX,
+        'KeyConditionExpression': Key('HospitalDay').eq(hospital_day(hospital)),
+        'Select': 'COUNT',
+    }
+    count = 0
+    while True:
+        response = table.query(**kwargs)
+        count += response['Count']
+        if 'LastEvaluatedKey' not in response:
+            return count
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def rebuild_counters(hospitals):
+    """Reset today's counters from a full count; run once for queues that predate them."""
+    lengths = {}
+    for hospital in hospitals:
+        lengths[hospital] = count_queue(hospital)
+        counters.put_item(Item={'HospitalDay': hospital_day(hospital), 'Hospital': hospital,
+                                'QueueLength': lengths[hospital]})
+    return lengths
\ No newline at end of file
@@ -1,36 +1,295 @@
+import os
+import time
 import uuid
+from collections import Counter
 import boto3
-from datetime import datetime
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+from datetime import datetime, timedelta
+from triage_queue import TriageQueue, severity_score
 
 dynamodb = boto3.resource('dynamodb')
 table = dynamodb.Table('HospitalQueue')
+# Queue lengths per HospitalDay ("<hospital>#<date>") read by Queue_Check_Lambda
+counters = dynamodb.Table(os.environ.get('QUEUE_LENGTH_TABLE', 'HospitalQueueLength'))
+
+REQUIRED_FIELDS = ('name', 'lastName', 'dob', 'hospital', 'symptoms')
+BATCH_SIZE = 25  # BatchWriteItem limit
+MAX_ATTEMPTS = 5
+
+# Today's waiting patients per hospital, kept while the Lambda container stays
+# warm. Registrations carry HospitalDay ("<hospital>#<date>") until checkout
+# removes it, so ACTIVE_INDEX (HospitalDay, Timestamp) only holds patients
+# still waiting. Every TRIAGE_REFRESH_SECONDS the queue picks up registrations
+# stored by other containers since its newest one; every TRIAGE_RESYNC_SECONDS
+# it is re-read whole, to drop patients checked out by other containers.
+ACTIVE_INDEX = os.environ.get('ACTIVE_QUEUE_INDEX', 'HospitalDayIndex')
+TRIAGE_REFRESH_SECONDS = int(os.environ.get('TRIAGE_REFRESH_SECONDS', 60))
+TRIAGE_RESYNC_SECONDS = int(os.environ.get('TRIAGE_RESYNC_SECONDS', 900))
+triage_queues = {}  # hospital -> {'day', 'queue', 'newest', 'refreshed_at', 'synced_at'}
 
 def lambda_handler(event, body):
-    user_id = str(uuid.uuid4())
-    timestamp = datetime.now().isoformat()
-    
+    if body.get('action') == 'checkout':
+        # Sent by the web app's update_status through its outbox
+        checked_out = checkout(body['userId'])
+        if checked_out is None:
+            # The registration has not arrived yet (a retry can overtake it):
+            # an error status makes the outbox try again later
+            return {
+                'statusCode': 404,
+                'body': {'userId': body['userId'], 'error': 'Unknown userId'}
+            }
+        return {
+            'statusCode': 200,
+            'body': {'userId': body['userId'], 'checkedOut': checked_out}
+        }
+
+    if 'registrations' in body:
+        # Batch mode: bulk imports and outbox backlogs
+        return {
+            'statusCode': 200,
+            'body': {'results': register_batch(body['registrations'])}
+        }
+
     # Process and store user data
+    item = build_item(body, datetime.now().isoformat())
+    user_id = item['UserId']
+    
+    if store_registration(item):
+        queue_patient(item)
+    else:
+        # Already stored by an earlier delivery of this request
+        item = table.get_item(Key={'UserId': user_id})['Item']
+    
+    return {
+        'statusCode': 200,
+        'body': {'userId': user_id, 'queuePosition': item['QueuePosition']}
+    }
+
+def build_item(body, timestamp, batch_queues=None):
     item = {
-        'UserId': user_id,
+        # Retried calls from the web app's outbox reuse the same requestId
+        'UserId': body.get('requestId') or str(uuid.uuid4()),
         'Name': body['name'],
         'LastName': body['lastName'],
         'DoB': body['dob'],
         'Hospital': body['hospital'],
         'Symptoms': body['symptoms'],
+        'Severity': severity_score(body['symptoms']),
         'Timestamp': timestamp,
-        'QueuePosition': calculate_queue_position(body['symptoms'])
-    }
-    
-    table.put_item(Item=item)
-    
-    return {
-        'statusCode': 200,
-        'body': {'userId': user_id, 'queuePosition': item['QueuePosition']}
+        'HospitalDay': hospital_day(body['hospital'], timestamp[:10]),
     }
+    item['QueuePosition'] = calculate_queue_position(item, batch_queues)
+    return item
 
-def calculate_queue_position(symptoms):
-    # Implement your queue position logic here
-    # This is a simplistic example
-    if 'emergency' in symptoms.lower():
-        return 1
-    return 10  # Default position
\ No newline at end of file
+def register_batch(registrations):
+    """Store many registrations with BatchWriteItem; returns one result per input, in order.
+
+    Each result has a status: 'stored', 'duplicate' (this requestId is already
+    stored), 'invalid' or 'failed' (still unprocessed after MAX_ATTEMPTS).
+    BatchWriteItem cannot be conditional, so already stored requestIds are
+    looked up first and queue lengths are added per HospitalDay afterwards. That
+    is not atomic like the single-item path; rebuild_counters in
+    Queue_Check_Lambda corrects any drift.
+    """
+    # One microsecond apart, in input order: arrival ties would otherwise be
+    # broken by the random UserId, and triage order would not follow the batch
+    started = datetime.now()
+    results = [None] * len(registrations)
+    pending = {}  # UserId -> (index, item)
+    batch_queues = {}  # hospital -> TriageQueue of this batch's items, for their positions
+    for i, body in enumerate(registrations):
+        missing = [field for field in REQUIRED_FIELDS if not body.get(field)]
+        if missing:
+            results[i] = {'status': 'invalid', 'error': f"Missing fields: {', '.join(missing)}"}
+            continue
+        timestamp = (started + timedelta(microseconds=i)).isoformat(timespec='microseconds')
+        item = build_item(body, timestamp, batch_queues)
+        if item['UserId'] in pending:
+            results[i] = result(item, 'duplicate')
+        else:
+            pending[item['UserId']] = (i, item)
+
+    for user_id in existing_user_ids(list(pending)):
+        i, item = pending.pop(user_id)
+        results[i] = result(item, 'duplicate')
+
+    stored = Counter()
+    user_ids = list(pending)
+    for start in range(0, len(user_ids), BATCH_SIZE):
+        chunk = [pending[user_id] for user_id in user_ids[start:start + BATCH_SIZE]]
+        unprocessed = write_chunk([item for _, item in chunk])
+        for i, item in chunk:
+            ok = item['UserId'] not in unprocessed
+            results[i] = result(item, 'stored' if ok else 'failed')
+            stored[item['HospitalDay']] += ok
+            if ok:
+                queue_patient(item)
+
+    for day_key, count in stored.items():
+        if count:
+            counters.update_item(Key={'HospitalDay': day_key}, UpdateExpression='ADD QueueLength :n',
+                                 ExpressionAttributeValues={':n': count})
+    return results
+
+def result(item, status):
+    return {'userId': item['UserId'], 'queuePosition': item['QueuePosition'], 'status': status}
+
+def write_chunk(items):
+    """BatchWriteItem up to 25 items, retrying unprocessed ones; returns the UserIds left over."""
+    request = {table.name: [{'PutRequest': {'Item': item}} for item in items]}
+    delay = 0.05
+    for attempt in range(MAX_ATTEMPTS):
+        if attempt:
+            time.sleep(delay)  # throttled: back off before retrying the rest
+            delay = min(delay * 2, 1)
+        request = dynamodb.batch_write_item(RequestItems=request).get('UnprocessedItems')
+        if not request:
+            return set()
+    return {put['PutRequest']['Item']['UserId'] for put in request[table.name]}
+
+def existing_user_ids(user_ids):
+    existing = set()
+    for start in range(0, len(user_ids), 100):
+        request = {table.name: {'Keys': [{'UserId': user_id} for user_id in user_ids[start:start + 100]],
+                                'ProjectionExpression': 'UserId'}}
+        delay = 0.05
+        while request:
+            response = dynamodb.batch_get_item(RequestItems=request)
+            existing.update(item['UserId'] for item in response['Responses'].get(table.name, []))
+            request = response.get('UnprocessedKeys')
+            if request:
+                time.sleep(delay)
+                delay = min(delay * 2, 1)
+    return existing
+
+def store_registration(item):
+    """Put the item and count it in its HospitalDay's queue length, atomically.
+
+    Returns False if an item with the same UserId was already stored.
+    """
+    try:
+        # The resource's client serializes plain Python values itself
+        dynamodb.meta.client.transact_write_items(TransactItems=[
+            {'Put': {
+                'TableName': table.name,
+                'Item': item,
+                'ConditionExpression': 'attribute_not_exists(UserId)',
+            }},
+            {'Update': {
+                'TableName': counters.name,
+                'Key': {'HospitalDay': item['HospitalDay']},
+                'UpdateExpression': 'ADD QueueLength :one',
+                'ExpressionAttributeValues': {':one': 1},
+            }},
+        ])
+    except ClientError as e:
+        reasons = e.response.get('CancellationReasons') or [{}]
+        if reasons[0].get('Code') == 'ConditionalCheckFailed':
+            return False
+        raise
+    return True
+
+def checkout(user_id):
+    """Take a patient out of today's queue; returns False if they were
+    already checked out, None if no registration has that UserId.
+
+    Removing HospitalDay drops the item from ACTIVE_INDEX, and the queue
+    length of the day it registered on goes down in the same transaction.
+    """
+    stored = table.get_item(Key={'UserId': user_id}, ProjectionExpression='Hospital, HospitalDay').get('Item')
+    if stored is None:
+        return None
+    if 'HospitalDay' not in stored:
+        return False
+    try:
+        dynamodb.meta.client.transact_write_items(TransactItems=[
+            {'Update': {
+                'TableName': table.name,
+                'Key': {'UserId': user_id},
+                'UpdateExpression': 'SET CheckedOutAt = :now REMOVE HospitalDay',
+                'ConditionExpression': 'attribute_exists(HospitalDay)',
+                'ExpressionAttributeValues': {':now': datetime.now().isoformat()},
+            }},
+            {'Update': {
+                'TableName': counters.name,
+                'Key': {'HospitalDay': stored['HospitalDay']},
+                'UpdateExpression': 'ADD QueueLength :minus_one',
+                'ExpressionAttributeValues': {':minus_one': -1},
+            }},
+        ])
+    except ClientError as e:
+        reasons = e.response.get('CancellationReasons') or [{}]
+        if reasons[0].get('Code') == 'ConditionalCheckFailed':
+            return False  # already checked out
+        raise
+    loaded = triage_queues.get(stored['Hospital'])
+    if loaded and user_id in loaded['queue']:
+        loaded['queue'].remove(user_id)
+    return True
+
+def calculate_queue_position(item, batch_queues=None):
+    """The patient's position in their hospital's triage queue once stored.
+
+    Nothing is queued here: queue_patient adds the patient after their write
+    succeeds, so a failed or duplicate write leaves no entry behind. In batch
+    mode, ``batch_queues`` holds the batch's earlier items, which are not
+    stored yet but rank ahead of or behind this one all the same.
+    """
+    queue = hospital_queue(item['Hospital'])
+    if item['UserId'] in queue:
+        return queue.rank(item['UserId'])
+    position = queue.position(item['UserId'], item['Severity'], item['Timestamp'])
+    if batch_queues is not None:
+        batch_queue = batch_queues.setdefault(item['Hospital'], TriageQueue())
+        if item['UserId'] not in batch_queue:
+            batch_queue.add(item['UserId'], item['Severity'], item['Timestamp'])
+        position += batch_queue.rank(item['UserId']) - 1
+    return position
+
+def queue_patient(item):
+    """Add a stored registration to its hospital's triage queue."""
+    queue = hospital_queue(item['Hospital'])
+    if item['UserId'] not in queue:
+        queue.add(item['UserId'], item['Severity'], item['Timestamp'])
+
+def hospital_day(hospital, day):
+    return f"{hospital}#{day}"
+
+def hospital_queue(hospital):
+    """Today's triage queue of the hospital's waiting patients."""
+    day = datetime.now().date().isoformat()
+    now = time.monotonic()
+    loaded = triage_queues.get(hospital)
+    if loaded is None or loaded['day'] != day or now - loaded['synced_at'] >= TRIAGE_RESYNC_SECONDS:
+        loaded = {'day': day, 'queue': TriageQueue(), 'newest': None, 'refreshed_at': now, 'synced_at': now}
+        load_active(hospital, loaded)
+        triage_queues[hospital] = loaded
+    elif now - loaded['refreshed_at'] >= TRIAGE_REFRESH_SECONDS:
+        load_active(hospital, loaded, since=loaded['newest'])
+        loaded['refreshed_at'] = now
+    return loaded['queue']
+
+def load_active(hospital, loaded, since=None):
+    """Add the day's waiting patients stored after ``since`` (a Timestamp; None for all)."""
+    condition = Key('HospitalDay').eq(hospital_day(hospital, loaded['day']))
+    if since:
+        condition &= Key('Timestamp').gt(since)
+    kwargs = {
+        'IndexName': ACTIVE_INDEX,
+        'KeyConditionExpression': condition,
+        'ProjectionExpression': 'UserId, Severity, #ts',
+        'ExpressionAttributeNames': {'#ts': 'Timestamp'},
+    }
+    queue = loaded['queue']
+    while True:
+        response = table.query(**kwargs)
+        for stored in response['Items']:
+            if stored['UserId'] not in queue:
+                queue.add(stored['UserId'], int(stored['Severity']), stored['Timestamp'])
+            # Only what was read moves this on: a registration this container
+            # queued itself says nothing about what other containers stored
+            loaded['newest'] = max(loaded['newest'] or '', stored['Timestamp'])
+        if 'LastEvaluatedKey' not in response:
+            break
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
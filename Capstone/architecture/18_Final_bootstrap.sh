@@ -6,6 +6,10 @@ exec 2>&1
 
 echo "Starting bootstrap script..."
 
+# The repository checkout this script runs from (Jenkins runs it from its
+# workspace); modules shared with the Lambdas are copied in from there
+REPO_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")/../.." && pwd)"
+
 # Update and upgrade the system
 sudo apt update && sudo apt upgrade -y
 if [ $? -ne 0 ]; then
@@ -29,7 +33,7 @@ python3 -m venv venv
 source venv/bin/activate
 
 # Install Python packages
-pip install flask gunicorn requests pymysql cryptography boto3
+pip install flask gunicorn requests pymysql cryptography boto3 "uvicorn[standard]" a2wsgi aiohttp aiomysql
 if [ $? -ne 0 ]; then
     echo "Error occurred during Python package installation. Exiting."
     exit 1
@@ -38,27 +42,94 @@ fi
 # Set environment variables
 DB_PASSWORD="your_strong_password_here"
 API_ENDPOINT="https://your-api-gateway-url"
+# Shared by all Gunicorn workers, so a session cookie is valid on any of them
+SECRET_KEY="$(openssl rand -hex 32)"
+# Exported for the python steps below (migrations, slot generation), which
+# read them from their environment; /etc/environment only applies to new logins
+export DB_PASSWORD API_ENDPOINT SECRET_KEY
 
 echo "DB_PASSWORD=${DB_PASSWORD}" | sudo tee -a /etc/environment
 echo "API_ENDPOINT=${API_ENDPOINT}" | sudo tee -a /etc/environment
+echo "SECRET_KEY=${SECRET_KEY}" | sudo tee -a /etc/environment
+
+# sync: Gunicorn gthread workers running app:app
+# async: Uvicorn workers running asgi:app (API Gateway and triage calls on an event loop)
+SERVING_MODE="sync"
 source /etc/environment
 
 # Create Flask application
-cat << EOF > app.py
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session
+cat << 'EOF' > app.py
+from flask import Blueprint, Flask, current_app, render_template, request, jsonify, redirect, url_for, flash, session, Response, stream_with_context
+from markupsafe import Markup
 import requests
 import os
 import pymysql
 import json
-from datetime import datetime, date
-import re
+import hashlib
+import uuid
+from datetime import date
 import logging
 import boto3
 from botocore.exceptions import NoCredentialsError
-
-app = Flask(__name__, static_url_path='/static')
-app.secret_key = os.urandom(24)  # Required for flashing messages
-logging.basicConfig(filename='app.log', level=logging.DEBUG)
+from db_pool import ConnectionPool
+from queue_numbers import QueueNumberAllocator
+from cache import CoalescingCache
+from queue_events import QueueEventBroker, RESYNC
+from outbox import Outbox
+from triage_queue import severity_score
+from wait_times import WaitTimeEstimator
+from validation import Schema, ValidationError, choice, integer, iso_date, phone, text
+from instrumentation import Instrumentation, TimedDictCursor
+from slot_inventory import FreeSlots, SlotGenerator, slot_rules
+
+bp = Blueprint('hospital_queue', __name__)
+
+class Config:
+    """Default settings, from the environment (see create_app for overrides)."""
+    SECRET_KEY = os.environ.get('SECRET_KEY') or os.urandom(24)  # Required for flashing messages
+    DB_HOST = os.environ.get('DB_HOST', 'localhost')
+    DB_PORT = int(os.environ.get('DB_PORT', 3306))
+    DB_USER = os.environ.get('DB_USER', 'hospital_user')
+    DB_PASSWORD = os.environ.get('DB_PASSWORD')
+    DB_NAME = os.environ.get('DB_NAME', 'hospital_queue')
+    API_ENDPOINT = os.environ.get('API_ENDPOINT')
+    LOG_FILE = os.environ.get('LOG_FILE', 'app.log')
+    DEBUG_LOG_SAMPLE_RATE = float(os.environ.get('DEBUG_LOG_SAMPLE_RATE', 0.01))
+    # Daily queue length per hospital and bookings per time slot (unless SLOT_RULES sets one)
+    MAX_QUEUE_LENGTH = int(os.environ.get('MAX_QUEUE_LENGTH', 20))
+    SLOT_CAPACITY = int(os.environ.get('SLOT_CAPACITY', 10))
+    # Connection pool (one per Gunicorn worker). DB_POOL_SIZE=0 disables pooling.
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 5))
+    DB_POOL_MAX_LIFETIME = int(os.environ.get('DB_POOL_MAX_LIFETIME', 3600))
+    QUEUE_EVENTS_POLL_INTERVAL = float(os.environ.get('QUEUE_EVENTS_POLL_INTERVAL', 0.25))
+    QUEUE_EVENTS_CLIENT_BUFFER = int(os.environ.get('QUEUE_EVENTS_CLIENT_BUFFER', 100))
+    OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', 25))
+    WAIT_TIME_ALPHA = float(os.environ.get('WAIT_TIME_ALPHA', 0.1))
+    WAIT_TIME_DEFAULT_MINUTES = float(os.environ.get('WAIT_TIME_DEFAULT_MINUTES', 15))
+    # Averages rebuilt from the database's recent visits this often, so every
+    # worker sees the others' checkouts
+    WAIT_TIME_RELOAD_INTERVAL = float(os.environ.get('WAIT_TIME_RELOAD_INTERVAL', 300))
+    # Free capacity of a day's slots, reloaded per worker every SLOT_CACHE_TTL seconds
+    SLOT_CACHE_TTL = float(os.environ.get('SLOT_CACHE_TTL', 5))
+    # Slots are generated SLOT_DAYS_AHEAD days ahead, checked every
+    # SLOT_GENERATION_INTERVAL seconds, from SLOT_RULES (see slot_inventory.slot_rules)
+    SLOT_DAYS_AHEAD = int(os.environ.get('SLOT_DAYS_AHEAD', 14))
+    SLOT_GENERATION_INTERVAL = float(os.environ.get('SLOT_GENERATION_INTERVAL', 3600))
+    SLOT_RULES = os.environ.get('SLOT_RULES', '{}')
+    # /check_queues: API Gateway is asked at most once per QUEUE_STATUS_TTL
+    # seconds per worker, however many dashboards poll; after that the last
+    # answer is served for up to QUEUE_STATUS_STALE_TTL more while it refreshes.
+    QUEUE_STATUS_TTL = float(os.environ.get('QUEUE_STATUS_TTL', 2))
+    QUEUE_STATUS_STALE_TTL = float(os.environ.get('QUEUE_STATUS_STALE_TTL', 30))
+    PATIENTS_PAGE_SIZE = int(os.environ.get('PATIENTS_PAGE_SIZE', 50))
+    # Templates are compiled once at startup and never re-checked on disk;
+    # pages that only change between deploys are rendered once per worker.
+    # Set both for template development.
+    TEMPLATES_AUTO_RELOAD = os.environ.get('TEMPLATES_AUTO_RELOAD', '').lower() in ('1', 'true', 'yes')
+    RENDER_CACHE = os.environ.get('RENDER_CACHE', 'true').lower() in ('1', 'true', 'yes')
+    # Browser cache lifetime of the rendered index page; revalidated by ETag after that
+    STATIC_PAGE_MAX_AGE = int(os.environ.get('STATIC_PAGE_MAX_AGE', 3600))
 
 # Remove explicit credentials, boto3 will use the IAM role
 s3 = boto3.client('s3')
@@ -69,160 +140,405 @@ hospitals = [
     {'name': 'Hospital C', 'image': 'https://mcit-capstone-hospital-queue-app-test.s3.amazonaws.com/hospital-index-page-images/hospital_c.jpg'}
 ]
 
-# Database configuration
-db_config = {
-    'host': 'localhost',
-    'user': 'hospital_user',
-    'password': os.environ.get('DB_PASSWORD'),
-    'db': 'hospital_queue',
-    'charset': 'utf8mb4',
-    'cursorclass': pymysql.cursors.DictCursor
-}
-
-API_ENDPOINT = os.environ.get('API_ENDPOINT')
+instrumentation = None
+
+def configure(settings):
+    """(Re)build the per-process services from ``settings`` (a Flask config).
+
+    The pool, caches and background workers are module globals shared by
+    every request in the worker, so the last app created in a process is the
+    one they follow.
+    """
+    global instrumentation, db_config, API_ENDPOINT, MAX_QUEUE_LENGTH, SLOT_CAPACITY, DB_POOL_SIZE, db_pool
+    global queue_numbers, queue_events, outbox, wait_times, free_slots, slot_generator, queue_status, PATIENTS_PAGE_SIZE
+    global RENDER_CACHE, rendered
+
+    # JSON-lines log written from a background thread, DEBUG kept for a sample
+    # of requests, and per-route latency and database time on /metrics. Made
+    # once per process (its fork and exit hooks cannot be unregistered) and
+    # pointed at the new settings on each later call.
+    if instrumentation is None:
+        instrumentation = Instrumentation()
+    instrumentation.debug_sample_rate = settings['DEBUG_LOG_SAMPLE_RATE']
+    instrumentation.setup_logging(settings['LOG_FILE'], level=logging.DEBUG)
+
+    db_config = {
+        'host': settings['DB_HOST'],
+        'port': settings['DB_PORT'],
+        'user': settings['DB_USER'],
+        'password': settings['DB_PASSWORD'],
+        'db': settings['DB_NAME'],
+        'charset': 'utf8mb4',
+        'cursorclass': TimedDictCursor
+    }
+    API_ENDPOINT = settings['API_ENDPOINT']
+    MAX_QUEUE_LENGTH = settings['MAX_QUEUE_LENGTH']
+    SLOT_CAPACITY = settings['SLOT_CAPACITY']
+    PATIENTS_PAGE_SIZE = settings['PATIENTS_PAGE_SIZE']
+
+    DB_POOL_SIZE = settings['DB_POOL_SIZE']
+    db_pool = ConnectionPool(
+        lambda: pymysql.connect(**db_config),
+        max_size=DB_POOL_SIZE,
+        timeout=settings['DB_POOL_TIMEOUT'],
+        max_lifetime=settings['DB_POOL_MAX_LIFETIME'],
+    )
+
+    # Per-hospital daily queue numbers, one atomic upsert per allocation. No
+    # blocks: register_patient allocates in its own transaction, and compares
+    # the number with MAX_QUEUE_LENGTH as the count of registrations.
+    queue_numbers = QueueNumberAllocator(get_db_connection)
+
+    # Live queue events for the patient dashboards (/events)
+    queue_events = QueueEventBroker(get_db_connection,
+                                    poll_interval=settings['QUEUE_EVENTS_POLL_INTERVAL'],
+                                    max_buffer=settings['QUEUE_EVENTS_CLIENT_BUFFER'])
+
+    # Registrations are synced to DynamoDB (via API Gateway) from a durable outbox
+    outbox = Outbox(get_db_connection, API_ENDPOINT, batch_size=settings['OUTBOX_BATCH_SIZE'],
+                    batch_paths=('/submit',))
+
+    # Visit lengths learned from check-in and checkout times, in memory per
+    # worker and reloaded from the visit history every WAIT_TIME_RELOAD_INTERVAL
+    wait_times = WaitTimeEstimator(alpha=settings['WAIT_TIME_ALPHA'],
+                                   default_minutes=settings['WAIT_TIME_DEFAULT_MINUTES'],
+                                   reload_interval=settings['WAIT_TIME_RELOAD_INTERVAL'])
+
+    # Time slots for the coming days, from per-hospital rules
+    slot_generator = SlotGenerator(get_db_connection,
+                                   slot_rules([hospital['name'] for hospital in hospitals],
+                                              settings['SLOT_RULES'], capacity=SLOT_CAPACITY),
+                                   days_ahead=settings['SLOT_DAYS_AHEAD'],
+                                   interval=settings['SLOT_GENERATION_INTERVAL'])
+
+    # Free capacity per (hospital, day). Each worker counts its own bookings;
+    # other workers' show up within SLOT_CACHE_TTL seconds, and a stale slot is
+    # still rejected by register_patient's capacity check.
+    free_slots = FreeSlots(load_slot_capacity, ttl=settings['SLOT_CACHE_TTL'],
+                           hospitals=slot_generator.rules)
+
+    queue_status = CoalescingCache(load_queue_status, ttl=settings['QUEUE_STATUS_TTL'],
+                                   stale_ttl=settings['QUEUE_STATUS_STALE_TTL'])
+
+    # Rendered pages and fragments, see render_once
+    RENDER_CACHE = settings['RENDER_CACHE']
+    rendered = {}
+
+def create_app(config=None):
+    """Application factory.
+
+    Settings are Config's (the environment), then those of the Python file
+    named by APP_CONFIG, if set, then ``config``, e.g. create_app({'DB_HOST':
+    '127.0.0.1', 'API_ENDPOINT': 'http://127.0.0.1:8001'}).
+    """
+    app = Flask(__name__, static_url_path='/static')
+    app.config.from_object(Config)
+    app.config.from_envvar('APP_CONFIG', silent=True)
+    app.config.update(config or {})
+    configure(app.config)
+    # Before the blueprint's hooks, so their queries are timed too
+    instrumentation.init_app(app)
+    app.register_blueprint(bp)
+    # Compile every template now instead of on each worker's first request for it
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    return app
 
 def get_db_connection():
-    return pymysql.connect(**db_config)
+    if DB_POOL_SIZE <= 0:
+        return pymysql.connect(**db_config)
+    return db_pool.connection()
 
-# Function to get or reset the counter
-def get_daily_counter():
+def load_visit_history():
+    """The most recent completed visits, oldest first, to warm up wait_times."""
     with get_db_connection() as connection:
         with connection.cursor() as cursor:
-            # Check if we need to reset the counter
-            cursor.execute("SELECT value, date FROM daily_counter WHERE id = 1")
-            result = cursor.fetchone()
-            today = date.today()
-            
-            if result is None or result['date'] != today:
-                # Reset or initialize the counter
-                cursor.execute(
-                    "INSERT INTO daily_counter (id, value, date) VALUES (1, 1, %s) "
-                    "ON DUPLICATE KEY UPDATE value = 1, date = %s",
-                    (today, today)
-                )
-                connection.commit()
-                return 1
-            else:
-                # Increment the counter
-                new_value = result['value'] + 1
-                cursor.execute(
-                    "UPDATE daily_counter SET value = %s WHERE id = 1",
-                    (new_value,)
-                )
-                connection.commit()
-                return new_value
-
-def calculate_estimated_waiting_time(queue_number):
-    # Simple estimation: 15 minutes per person in queue
-    return queue_number * 15
-
-@app.route('/check_session')
+            cursor.execute("""
+                SELECT hospital, appointment_type,
+                       TIMESTAMPDIFF(SECOND, check_in_time, checked_out_at) / 60 AS minutes
+                FROM patients
+                WHERE checked_out_at IS NOT NULL
+                ORDER BY checked_out_at DESC
+                LIMIT 5000
+            """)
+            rows = cursor.fetchall()
+    return [(row['hospital'], row['appointment_type'],
+             float(row['minutes']) if row['minutes'] is not None else None) for row in reversed(rows)]
+
+@bp.before_app_request
+def start_background_workers():
+    # Started lazily in each Gunicorn worker so rows left over from a restart
+    # are delivered even before the next registration.
+    outbox.ensure_started()
+    wait_times.ensure_loaded(load_visit_history)
+    slot_generator.ensure_started()
+
+@bp.route('/check_session')
 def check_session():
     return jsonify(dict(session))
 
-@app.route('/')
-def index():
-    return render_template('index.html', hospitals=hospitals)
+def render_once(template, key=None, **context):
+    """``template`` rendered with ``context`` on first use only, as
+    {'body': bytes, 'etag': str}; later calls with the same ``key`` get that
+    first rendering back. Only for output that depends on nothing but
+    ``key`` until the next deploy, and on a bounded set of keys."""
+    page = rendered.get((template, key)) if RENDER_CACHE else None
+    if page is None:
+        body = render_template(template, **context).encode()
+        page = {'body': body, 'etag': hashlib.sha1(body).hexdigest()}
+        if RENDER_CACHE:
+            rendered[(template, key)] = page
+    return page
+
+HOSPITAL_NAMES = {hospital['name'] for hospital in hospitals}
+
+def render_form(hospital, available_slots=()):
+    # The header (everything above the time slots) only depends on the
+    # hospital; any other name in the URL is rendered but not cached.
+    if hospital in HOSPITAL_NAMES:
+        header = render_once('form_header.html', key=hospital, hospital=hospital)['body'].decode()
+    else:
+        header = render_template('form_header.html', hospital=hospital)
+    return render_template('form.html', header=Markup(header), available_slots=available_slots)
 
-@app.route('/form/<hospital>')
+@bp.route('/')
+def index():
+    page = render_once('index.html', hospitals=hospitals)
+    response = current_app.response_class(page['body'], mimetype='text/html')
+    response.set_etag(page['etag'])
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config['STATIC_PAGE_MAX_AGE']
+    return response.make_conditional(request)
+
+@bp.route('/form/<hospital>')
 def form(hospital):
     available_slots = get_available_slots(hospital)
-    return render_template('form.html', hospital=hospital, available_slots=available_slots)
+    return render_form(hospital, available_slots)
 
 def get_available_slots(hospital):
+    return free_slots.available(hospital, date.today())
+
+def slot_capacity(hospital):
+    """Bookings per time slot: the hospital's slot rule, or SLOT_CAPACITY."""
+    return slot_generator.capacity(hospital, SLOT_CAPACITY)
+
+def load_slot_capacity(hospital, day):
+    # Full slots too: free_slots keeps a bit for every slot of the day.
     with get_db_connection() as connection:
         with connection.cursor() as cursor:
             cursor.execute("""
-                SELECT id, slot_time 
-                FROM time_slots 
-                WHERE date = CURDATE() AND hospital = %s AND booked < 10
-                AND slot_time BETWEEN '18:00' AND '22:00'
-            """, (hospital,))
+                SELECT id, slot_time, %s - booked AS remaining
+                FROM time_slots
+                WHERE date = %s AND hospital = %s
+                ORDER BY slot_time
+            """, (slot_capacity(hospital), day, hospital))
             return cursor.fetchall()
 
-def validate_phone_number(phone_number):
-    pattern = re.compile(r'^\+?1?\d{9,15}$')
-    return pattern.match(phone_number) is not None
-
-def validate_date(date_string):
-    try:
-        datetime.strptime(date_string, '%Y-%m-%d')
-        return True
-    except ValueError:
-        return False
-
-@app.route('/submit', methods=['POST'])
-def submit():
-    logging.debug("Submit route accessed")
-    data = request.form.to_dict()
-    logging.debug(f"Received form data: {data}")
-    
-    try:
-        logging.debug("Attempting to get daily counter")
-        queue_number = get_daily_counter()
-        logging.debug(f"Queue number assigned: {queue_number}")
-        
-        logging.debug("Checking if queue is full")
-        if queue_number > 20:
-            logging.debug("Queue is full, redirecting to index")
-            flash('We are full, please check back later.', 'error')
-            return redirect(url_for('index'))
-        
-        logging.debug("Attempting to book time slot")
-        with get_db_connection() as connection:
+# /submit form; lengths and choices follow the patients table columns
+REGISTRATION_SCHEMA = Schema(
+    hospital=text(100),
+    name=text(100),
+    lastName=text(100),
+    dob=iso_date(past=True),
+    symptoms=text(2000),
+    emergency_contact_name=text(100),
+    emergency_contact_phone=phone(),
+    insurance_provider=text(100, required=False),
+    insurance_policy_number=text(50, required=False),
+    payment_method=choice('cash', 'credit_card', 'insurance'),
+    appointment_type=choice('consultation', 'follow-up', 'emergency'),
+    time_slot=integer(min_value=1),
+)
+
+def queue_snapshot(cursor, hospital, day):
+    """Positions and waiting times of everyone still waiting at a hospital on a day."""
+    return queue_positions(hospital, waiting_patients(cursor, hospital, day))
+
+def waiting_patients(cursor, hospital, day):
+    cursor.execute("""
+        SELECT id, queue_number, appointment_type FROM patients
+        WHERE hospital = %s AND created_at >= %s AND created_at < %s + INTERVAL 1 DAY
+        AND status <> 'checked_out'
+        ORDER BY queue_number
+    """, (hospital, day, day))
+    return list(cursor.fetchall())
+
+def queue_positions(hospital, rows):
+    """queue_snapshot's positions for ``rows`` (id, appointment_type), in queue order."""
+    # Everyone ahead is known here, so each visit counts at its own type's length.
+    waits = wait_times.estimate_queue(hospital, [row['appointment_type'] for row in rows])
+    return {row['id']: {'queue_position': position, 'estimated_waiting_time': wait}
+            for position, (row, wait) in enumerate(zip(rows, waits), start=1)}
+
+class QueueFull(Exception):
+    pass
+
+class SlotUnavailable(Exception):
+    pass
+
+def register_patient(data):
+    """Book the slot, allocate the queue number and insert the patient in one transaction.
+
+    Any failure rolls back all three, so a full queue or a taken slot no longer
+    burns a queue number. The slot row is locked first and the hot
+    queue_counters row last: the queue is read for the event's positions
+    before it (the new patient joins at the end), so the counter lock is only
+    held for the patient, event and outbox INSERTs.
+    """
+    if free_slots.has_capacity(data['hospital'], date.today(), data['time_slot']) is False:
+        raise SlotUnavailable()
+    with get_db_connection() as connection:
+        try:
             with connection.cursor() as cursor:
-                cursor.execute("UPDATE time_slots SET booked = booked + 1 WHERE id = %s", (data['time_slot'],))
+                cursor.execute(
+                    "UPDATE time_slots SET booked = booked + 1 "
+                    "WHERE id = %s AND hospital = %s AND booked < %s",
+                    (data['time_slot'], data['hospital'], slot_capacity(data['hospital'])))
                 if cursor.rowcount == 0:
-                    logging.debug("Time slot no longer available")
-                    flash('The selected time slot is no longer available. Please try again.', 'error')
-                    return redirect(url_for('form', hospital=data['hospital']))
-            
-            logging.debug("Inserting patient data")
-            with connection.cursor() as cursor:
+                    raise SlotUnavailable()
+                today = date.today()
+                waiting = waiting_patients(cursor, data['hospital'], today)
+                # The new patient joins at the back, so their wait is the last
+                # of the queue's estimates, as queue_positions will report it.
+                estimated_waiting_time = wait_times.estimate_queue(
+                    data['hospital'], [row['appointment_type'] for row in waiting] + [data['appointment_type']])[-1]
+
+                queue_number = queue_numbers.allocate(data['hospital'], connection=connection)
+                if queue_number > MAX_QUEUE_LENGTH:
+                    raise QueueFull()
+
+                # The registration Lambda's UserId for the patient, kept so a
+                # checkout can be sent to it
+                registration_id = str(uuid.uuid4())
                 sql = """INSERT INTO patients 
                          (name, last_name, dob, hospital, symptoms, queue_number, time_slot_id, status,
                           emergency_contact_name, emergency_contact_phone, insurance_provider,
-                          insurance_policy_number, payment_method, appointment_type, estimated_waiting_time) 
-                         VALUES (%s, %s, %s, %s, %s, %s, %s, 'in_queue', %s, %s, %s, %s, %s, %s, %s)"""
+                          insurance_policy_number, payment_method, appointment_type, estimated_waiting_time,
+                          registration_id) 
+                         VALUES (%s, %s, %s, %s, %s, %s, %s, 'in_queue', %s, %s, %s, %s, %s, %s, %s, %s)"""
                 cursor.execute(sql, (
                     data['name'], data['lastName'], data['dob'], data['hospital'], data['symptoms'],
                     queue_number, data['time_slot'], data['emergency_contact_name'],
                     data['emergency_contact_phone'], data.get('insurance_provider', ''),
                     data.get('insurance_policy_number', ''), data['payment_method'],
-                    data['appointment_type'], calculate_estimated_waiting_time(queue_number)
+                    data['appointment_type'], estimated_waiting_time,
+                    registration_id
                 ))
+                waiting.append({'id': cursor.lastrowid, 'queue_number': queue_number,
+                                'appointment_type': data['appointment_type']})
+                queue_events.record(cursor, data['hospital'], 'patient_added', {
+                    'patient': {
+                        'id': cursor.lastrowid, 'queue_number': queue_number, 'name': data['name'],
+                        'last_name': data['lastName'], 'hospital': data['hospital'], 'status': 'in_queue',
+                        'appointment_type': data['appointment_type'],
+                        'payment_method': data['payment_method'], 'payment_status': 'pending',
+                    },
+                    'queue_date': today,
+                    'positions': queue_positions(data['hospital'], waiting),
+                })
+                outbox.add(cursor, '/submit', {
+                    'name': data['name'], 'lastName': data['lastName'], 'dob': data['dob'],
+                    'hospital': data['hospital'], 'symptoms': data['symptoms'],
+                    'queueNumber': queue_number,
+                }, key=registration_id)
             connection.commit()
-        logging.debug(f"Patient data inserted successfully. Queue number: {queue_number}")
+        except Exception:
+            connection.rollback()
+            raise
+    outbox.wake()
+    return queue_number
+
+@bp.route('/submit', methods=['POST'])
+def submit():
+    try:
+        # Rejected before a database connection is checked out
+        data = REGISTRATION_SCHEMA.validate(request.form)
+    except ValidationError as e:
+        # Field names and messages only: the form holds patient details
+        logging.debug("Invalid submission: %s", e)
+        for field, message in e.errors.items():
+            flash(f"{field}: {message}", 'error')
+        hospital = request.form.get('hospital')
+        return redirect(url_for('.form', hospital=hospital) if hospital else url_for('.index'))
+    
+    try:
+        queue_number = register_patient(data)
+        free_slots.book(data['hospital'], date.today(), data['time_slot'])
+        logging.debug("Registered patient at %s with queue number %s", data['hospital'], queue_number)
 
-        logging.debug("Storing queue number in session")
         session['queue_number'] = queue_number
         session['hospital'] = data['hospital']
-        
-        logging.debug("Redirecting to patients")
-        return redirect(url_for('patients'))
-    
+        return redirect(url_for('.patients'))
+
+    except QueueFull:
+        logging.debug("Queue full at %s", data['hospital'])
+        flash('We are full, please check back later.', 'error')
+        return redirect(url_for('.index'))
+    except SlotUnavailable:
+        logging.debug("Time slot %s no longer available at %s", data['time_slot'], data['hospital'])
+        free_slots.mark_full(data['hospital'], date.today(), data['time_slot'])
+        flash('The selected time slot is no longer available. Please try again.', 'error')
+        return redirect(url_for('.form', hospital=data['hospital']))
     except Exception as e:
         error_message = f"An unexpected error occurred: {e}"
-        logging.error(error_message)
-        logging.error(f"Exception details: {str(e)}")
-        logging.error(f"Exception type: {type(e).__name__}")
-        logging.error(f"Exception args: {e.args}")
+        logging.exception("Registration failed")
         flash(error_message, 'error')
     
-    logging.debug("Rendering form template")
-    return render_template('form.html', hospital=data['hospital'])
+    return render_form(data['hospital'])
 
-@app.route('/queue_info')
+@bp.route('/queue_info')
 def queue_info():
     queue_number = session.get('queue_number')
     hospital = session.get('hospital')
     if queue_number and hospital:
-        estimated_time = calculate_estimated_waiting_time(queue_number)
-        return render_template('queue_info.html', queue_number=queue_number, hospital=hospital, estimated_time=estimated_time)
+        with get_db_connection() as connection:
+            with connection.cursor() as cursor:
+                waiting = waiting_patients(cursor, hospital, date.today())
+        # queue_number is a stable ticket; the position is counted at read
+        # time, so everyone behind a checkout moves up without renumbering.
+        ahead = [row for row in waiting if row['queue_number'] < queue_number]
+        mine = [row for row in waiting if row['queue_number'] == queue_number]
+        waits = wait_times.estimate_queue(hospital, [row['appointment_type'] for row in ahead + mine])
+        position = len(ahead) + 1
+        estimated_time = waits[-1] if waits else 0
+        return render_template('queue_info.html', queue_number=position, hospital=hospital, estimated_time=estimated_time)
     else:
-        return redirect(url_for('index'))
+        return redirect(url_for('.index'))
+
+# Also run by asgi.py's async /triage
+TRIAGE_QUERY = """
+    SELECT id, name, last_name, symptoms, appointment_type, queue_number, status
+    FROM patients
+    WHERE hospital = %s AND created_at >= CURDATE() AND created_at < CURDATE() + INTERVAL 1 DAY
+    AND status <> 'checked_out'
+"""
+
+def triage_order(rows):
+    """TRIAGE_QUERY rows in triage order, each with its severity and triage_position.
+
+    The rows are read fresh on every request, so a single sort is all it
+    takes: highest severity first, then by queue number (arrival), the same
+    order as triage_queue.TriageQueue.
+    """
+    for row in rows:
+        row['severity'] = severity_score(row['symptoms'], row['appointment_type'])
+    ordered = sorted(rows, key=lambda row: (-row['severity'], row['queue_number'], row['id']))
+    return [dict(row, triage_position=position) for position, row in enumerate(ordered, start=1)]
+
+@bp.route('/triage/<hospital>')
+def triage(hospital):
+    """Today's waiting patients in triage order: most severe first, then by arrival."""
+    try:
+        with get_db_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(TRIAGE_QUERY, (hospital,))
+                rows = cursor.fetchall()
+        return jsonify(triage_order(rows))
+    except Exception as e:
+        current_app.logger.error(f"Error building triage queue: {e}")
+        return jsonify({'error': str(e)}), 500
 
-@app.route('/update_status/<int:patient_id>', methods=['POST'])
+@bp.route('/update_status/<int:patient_id>', methods=['POST'])
 def update_status(patient_id):
     new_status = request.form.get('status')
     if new_status not in ['checked_in', 'in_progress', 'checked_out']:
@@ -233,43 +549,67 @@ def update_status(patient_id):
             with connection.cursor() as cursor:
                 if new_status == 'checked_in':
                     cursor.execute("UPDATE patients SET status = %s, check_in_time = NOW() WHERE id = %s", (new_status, patient_id))
+                elif new_status == 'checked_out':
+                    cursor.execute("UPDATE patients SET status = %s, checked_out_at = NOW() WHERE id = %s", (new_status, patient_id))
                 else:
                     cursor.execute("UPDATE patients SET status = %s WHERE id = %s", (new_status, patient_id))
+                cursor.execute("""
+                    SELECT hospital, appointment_type, DATE(created_at) AS queue_date, registration_id,
+                           TIMESTAMPDIFF(SECOND, check_in_time, checked_out_at) / 60 AS visit_minutes
+                    FROM patients WHERE id = %s
+                """, (patient_id,))
+                patient = cursor.fetchone()
+                if patient:
+                    queue_events.record(cursor, patient['hospital'], 'status_changed', {
+                        'patient': {'id': patient_id, 'status': new_status},
+                        'queue_date': patient['queue_date'],
+                        'positions': queue_snapshot(cursor, patient['hospital'], patient['queue_date']),
+                    })
+                send_checkout = new_status == 'checked_out' and patient and patient['registration_id']
+                if send_checkout:
+                    # Takes the patient out of the registration Lambda's queue
+                    # and queue length (patients from before registration_id
+                    # have none to send)
+                    outbox.add(cursor, '/checkout', {'action': 'checkout', 'userId': patient['registration_id']})
                 connection.commit()
 
-        if new_status == 'checked_out':
-            # Decrement queue numbers and update estimated waiting times for patients still in queue
-            with get_db_connection() as connection:
-                with connection.cursor() as cursor:
-                    cursor.execute("""
-                        UPDATE patients 
-                        SET queue_number = queue_number - 1,
-                            estimated_waiting_time = GREATEST(estimated_waiting_time - 15, 0)
-                        WHERE status = 'in_queue' AND queue_number > (
-                            SELECT queue_number FROM (
-                                SELECT queue_number FROM patients WHERE id = %s
-                            ) AS subquery
-                        )
-                    """, (patient_id,))
-                    connection.commit()
-
+        if send_checkout:
+            outbox.wake()
+        if new_status == 'checked_out' and patient and patient['visit_minutes'] is not None:
+            wait_times.observe(patient['hospital'], patient['appointment_type'], float(patient['visit_minutes']))
         return jsonify({'success': True}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/check_queues')
+# Keep-alive connections to API Gateway for the queue status loads
+api_session = requests.Session()
+
+def queue_status_response(queues):
+    """JSON body and ETag for a queue status, built once per load and shared by every viewer."""
+    body = json.dumps(queues, sort_keys=True).encode()
+    return {'body': body, 'etag': hashlib.sha1(body).hexdigest()}
+
+def load_queue_status():
+    # API call to the Lambda function that reads the queue status from DynamoDB
+    response = api_session.get(f"{API_ENDPOINT}/check_queues", timeout=10)
+    response.raise_for_status()
+    return queue_status_response(response.json())
+
+@bp.route('/check_queues')
 def check_queues():
     try:
-        # Make API call to Lambda function to get queue status from DynamoDB
-        response = requests.get(f"{API_ENDPOINT}/check_queues")
-        queues = response.json()
-        return jsonify(queues)
+        status = queue_status.get()
     except Exception as e:
         error_message = f"Error checking queues: {e}"
-        app.logger.error(error_message)
+        current_app.logger.error(error_message)
         return jsonify({'error': error_message}), 500
+    # Browsers revalidate with If-None-Match and get a 304 while nothing changed
+    response = current_app.response_class(status['body'], mimetype='application/json')
+    response.set_etag(status['etag'])
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
-@app.route('/update_payment_status/<int:patient_id>', methods=['POST'])
+@bp.route('/update_payment_status/<int:patient_id>', methods=['POST'])
 def update_payment_status(patient_id):
     new_payment_status = request.form.get('payment_status')
     if new_payment_status not in ['pending', 'completed', 'not_required']:
@@ -279,12 +619,18 @@ def update_payment_status(patient_id):
         with get_db_connection() as connection:
             with connection.cursor() as cursor:
                 cursor.execute("UPDATE patients SET payment_status = %s WHERE id = %s", (new_payment_status, patient_id))
+                cursor.execute("SELECT hospital FROM patients WHERE id = %s", (patient_id,))
+                patient = cursor.fetchone()
+                if patient:
+                    queue_events.record(cursor, patient['hospital'], 'payment_changed', {
+                        'patient': {'id': patient_id, 'payment_status': new_payment_status},
+                    })
                 connection.commit()
         return jsonify({'success': True}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/test_db')
+@bp.route('/test_db')
 def test_db():
     try:
         with get_db_connection() as connection:
@@ -295,27 +641,2067 @@ def test_db():
     except Exception as e:
         return f"Database connection failed: {str(e)}"
 
-@app.route('/patients')
+@bp.route('/pool_metrics')
+def pool_metrics():
+    return jsonify(db_pool.metrics())
+
+@bp.route('/events')
+def events():
+    """Server-sent queue events for the given hospitals (all hospitals if none).
+
+    Each open dashboard holds one Gunicorn thread and an in-memory buffer;
+    a client that falls QUEUE_EVENTS_CLIENT_BUFFER events behind is told to
+    reload instead.
+    """
+    hospitals = request.args.getlist('hospital')
+
+    def stream():
+        with queue_events.subscribe(hospitals) as subscription:
+            yield ': connected\n\n'
+            while True:
+                events = subscription.wait(timeout=15)
+                if events is RESYNC:
+                    yield 'event: resync\ndata: {}\n\n'
+                elif not events:
+                    yield ': keepalive\n\n'
+                else:
+                    for event in events:
+                        yield f"id: {event['id']}\nevent: queue\ndata: {json.dumps(event)}\n\n"
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@bp.route('/events_metrics')
+def events_metrics():
+    return jsonify(queue_events.metrics())
+
+@bp.route('/outbox_metrics')
+def outbox_metrics():
+    return jsonify(outbox.metrics())
+
+@bp.route('/metrics')
+def metrics():
+    return jsonify(instrumentation.metrics())
+
+@bp.route('/wait_time_metrics')
+def wait_time_metrics():
+    return jsonify(wait_times.metrics())
+
+@bp.route('/cache_metrics')
+def cache_metrics():
+    return jsonify({'available_slots': free_slots.metrics(), 'slot_generator': slot_generator.metrics(),
+                    'queue_status': queue_status.metrics()})
+
+# queue_position: patients still ahead of this ticket (same hospital and day,
+# not checked out), so checkouts need no renumbering. Counted per row from the
+# (hospital, created_at, status, queue_number) index, so it works on any page.
+PATIENT_COLUMNS = """
+    p.id, p.queue_number, p.name, p.last_name, p.hospital, p.status,
+    p.appointment_type, p.payment_method, p.payment_status, DATE(p.created_at) AS queue_date,
+    CASE WHEN p.status <> 'checked_out' THEN (
+        SELECT COUNT(*) FROM patients ahead
+        WHERE ahead.hospital = p.hospital
+        AND ahead.created_at >= DATE(p.created_at)
+        AND ahead.created_at < DATE(p.created_at) + INTERVAL 1 DAY
+        AND ahead.status <> 'checked_out' AND ahead.queue_number <= p.queue_number
+    ) END AS queue_position
+"""
+
+def patients_query(filters, after=None, limit=None):
+    """SELECT for the patient list, filtered by hospital/date/status.
+
+    Rows are ordered by (queue_number, id); ``after`` is the last
+    (queue_number, id) of the previous page, so each page is an index range
+    scan no matter how deep into the list it is.
+    """
+    where, params = [], []
+    if filters.get('hospital'):
+        where.append("p.hospital = %s")
+        params.append(filters['hospital'])
+    if filters.get('date'):
+        where.append("p.created_at >= %s AND p.created_at < %s + INTERVAL 1 DAY")
+        params += [filters['date'], filters['date']]
+    if filters.get('status'):
+        where.append("p.status = %s")
+        params.append(filters['status'])
+    if after:
+        where.append("(p.queue_number > %s OR (p.queue_number = %s AND p.id > %s))")
+        params += [after[0], after[0], after[1]]
+    sql = f"SELECT {PATIENT_COLUMNS} FROM patients p"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY p.queue_number, p.id"
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    return sql, params
+
+def parse_patients_cursor(value):
+    try:
+        queue_number, patient_id = value.split('-')
+        return int(queue_number), int(patient_id)
+    except (AttributeError, ValueError):
+        return None
+
+def waiting_time_adder(cursor):
+    """add(patient): fill in a PATIENT_COLUMNS row's estimated_waiting_time.
+
+    Waits come from queue_snapshot, read once per hospital and day through
+    ``cursor``, so the list shows the same estimates as the live updates.
+    """
+    snapshots = {}
+
+    def add(patient):
+        patient['queue_position'] = int(patient['queue_position'] or 0)
+        key = (patient['hospital'], patient['queue_date'])
+        if key not in snapshots:
+            snapshots[key] = queue_snapshot(cursor, *key)
+        entry = snapshots[key].get(patient['id'])
+        patient['estimated_waiting_time'] = entry['estimated_waiting_time'] if entry else 0
+        return patient
+    return add
+
+@bp.route('/patients')
 def patients():
+    filters = {key: request.args[key] for key in ('hospital', 'date', 'status') if request.args.get(key)}
+    after = parse_patients_cursor(request.args.get('after'))
     try:
         with get_db_connection() as connection:
             with connection.cursor() as cursor:
-                cursor.execute("""
-                    SELECT id, queue_number, name, last_name, hospital, status, 
-                           appointment_type, payment_method, payment_status, estimated_waiting_time
-                    FROM patients 
-                    ORDER BY queue_number
-                """)
+                sql, params = patients_query(filters, after, PATIENTS_PAGE_SIZE + 1)
+                cursor.execute(sql, params)
                 patients = cursor.fetchall()
-        return render_template('patients.html', patients=patients)
+                next_cursor = None
+                if len(patients) > PATIENTS_PAGE_SIZE:
+                    patients = patients[:PATIENTS_PAGE_SIZE]
+                    next_cursor = f"{patients[-1]['queue_number']}-{patients[-1]['id']}"
+                add_waiting_time = waiting_time_adder(cursor)
+                patients = [add_waiting_time(patient) for patient in patients]
+        return render_template('patients.html', patients=patients, filters=filters, next_cursor=next_cursor)
     except Exception as e:
         flash(f"Error retrieving patients: {e}", 'error')
-        return redirect(url_for('index'))
+        return redirect(url_for('.index'))
+
+@bp.route('/patients.json')
+def patients_json():
+    """Stream every matching patient as a JSON array without loading them all.
+
+    Uses a server-side (unbuffered) cursor, so memory stays flat and the first
+    bytes go out as soon as MySQL returns the first row.
+    """
+    filters = {key: request.args[key] for key in ('hospital', 'date', 'status') if request.args.get(key)}
+    sql, params = patients_query(filters)
+
+    def generate():
+        # The unbuffered cursor holds its connection until the last row, so
+        # the queue snapshots are read over a second one.
+        with get_db_connection() as connection, get_db_connection() as snapshot_connection:
+            with connection.cursor(pymysql.cursors.SSDictCursor) as cursor, \
+                    snapshot_connection.cursor() as snapshot_cursor:
+                add_waiting_time = waiting_time_adder(snapshot_cursor)
+                cursor.execute(sql, params)
+                yield '['
+                separator = ''
+                for patient in cursor:
+                    yield separator + json.dumps(add_waiting_time(patient), default=str)
+                    separator = ','
+                yield ']\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+# gunicorn app:app
+app = create_app()
 
 if __name__ == '__main__':
     app.run(debug=True)
 EOF
 
+# Create database connection pool module
+cat << 'EOF' > db_pool.py
+import os
+import threading
+import time
+
+# pymysql.constants.SERVER_STATUS.SERVER_STATUS_IN_TRANS
+SERVER_STATUS_IN_TRANS = 1
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes free within the pool wait timeout."""
+
+
+class PooledConnection:
+    """Wraps a raw DB-API connection and hands it back to the pool on close.
+
+    Supports the same ``with get_db_connection() as connection:`` usage as a
+    plain pymysql connection, so the routes do not need to change.
+    """
+
+    def __init__(self, pool, raw, created_at):
+        self._pool = pool
+        self._raw = raw
+        self.created_at = created_at
+        self.last_used = time.monotonic()
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            pool._release(self)
+
+
+class ConnectionPool:
+    """Bounded, thread-safe and fork-safe pool of database connections.
+
+    - At most ``max_size`` connections are open at any time; callers wait up
+      to ``timeout`` seconds for a free one and get ``PoolTimeout`` otherwise.
+    - Connections idle for longer than ``ping_after`` seconds are pinged on
+      checkout and replaced if the server has gone away.
+    - Connections older than ``max_lifetime`` seconds are closed and reopened.
+    - After a fork (e.g. Gunicorn ``--preload``) the child drops the sockets it
+      inherited from the parent instead of sharing them.
+    """
+
+    def __init__(self, creator, max_size=10, timeout=5.0, max_lifetime=3600, ping_after=5.0):
+        self._creator = creator
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.ping_after = ping_after
+        self._reset_state()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset_state)
+
+    def _reset_state(self):
+        # Sockets inherited across fork() belong to the parent; forget them
+        # without closing so the parent's connections stay usable.
+        self._pid = os.getpid()
+        self._cond = threading.Condition(threading.Lock())
+        self._idle = []
+        self._open = 0
+        self._in_use = 0
+        self._waiters = 0
+        self._stats = {
+            'checkouts': 0,
+            'created': 0,
+            'recycled': 0,
+            'failed_health_checks': 0,
+            'timeouts': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+        }
+
+    def connection(self):
+        """Check out a connection; use it as a context manager or call close()."""
+        if self._pid != os.getpid():
+            self._reset_state()
+
+        start = time.monotonic()
+        deadline = start + self.timeout
+        with self._cond:
+            self._waiters += 1
+            try:
+                while not self._idle and self._open >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout(f"No database connection available after {self.timeout}s "
+                                          f"(pool size {self.max_size})")
+                    self._cond.wait(remaining)
+            finally:
+                self._waiters -= 1
+            conn = self._idle.pop() if self._idle else None
+            self._open += conn is None
+            self._in_use += 1
+            waited = time.monotonic() - start
+            self._stats['checkouts'] += 1
+            self._stats['wait_time_total'] += waited
+            self._stats['wait_time_max'] = max(self._stats['wait_time_max'], waited)
+
+        # Network work (connect, ping) happens outside the lock.
+        try:
+            if conn is not None:
+                conn = self._validate(conn)
+            if conn is None:
+                conn = self._new_connection()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        conn._pool = self
+        return conn
+
+    def _new_connection(self):
+        conn = PooledConnection(self, self._creator(), time.monotonic())
+        with self._cond:
+            self._stats['created'] += 1
+        return conn
+
+    def _validate(self, conn):
+        now = time.monotonic()
+        if now - conn.created_at > self.max_lifetime:
+            self._discard(conn)
+            with self._cond:
+                self._stats['recycled'] += 1
+            return None
+        if now - conn.last_used > self.ping_after and not self._ping(conn._raw):
+            self._discard(conn)
+            with self._cond:
+                self._stats['failed_health_checks'] += 1
+            return None
+        return conn
+
+    @staticmethod
+    def _ping(raw):
+        try:
+            if hasattr(raw, 'ping'):
+                raw.ping(reconnect=False)
+            else:
+                raw.execute('SELECT 1')
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _in_transaction(raw):
+        if hasattr(raw, 'server_status'):
+            return bool(raw.server_status & SERVER_STATUS_IN_TRANS)
+        return getattr(raw, 'in_transaction', True)
+
+    @staticmethod
+    def _discard(conn):
+        try:
+            conn._raw.close()
+        except Exception:
+            pass
+
+    def _release(self, conn):
+        if self._pid != os.getpid():
+            return
+        try:
+            # Never hand the next caller a half-finished transaction.
+            if self._in_transaction(conn._raw):
+                conn._raw.rollback()
+            healthy = True
+        except Exception:
+            healthy = False
+            self._discard(conn)
+        conn.last_used = time.monotonic()
+        with self._cond:
+            self._in_use -= 1
+            if healthy:
+                self._idle.append(conn)
+            else:
+                self._open -= 1
+            self._cond.notify()
+
+    def metrics(self):
+        with self._cond:
+            checkouts = self._stats['checkouts']
+            return dict(
+                self._stats,
+                max_size=self.max_size,
+                open=self._open,
+                idle=len(self._idle),
+                in_use=self._in_use,
+                waiters=self._waiters,
+                wait_time_avg=self._stats['wait_time_total'] / checkouts if checkouts else 0.0,
+            )
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        for conn in idle:
+            self._discard(conn)
+
+EOF
+
+# Create queue number allocator module
+cat << 'EOF' > queue_numbers.py
+import threading
+from datetime import date
+
+# One statement per allocation: the upsert both creates today's row for the
+# hospital and bumps it, so there is no SELECT-then-UPDATE race.
+ALLOCATE_SQL = {
+    # LAST_INSERT_ID(expr) makes the new value come back as the cursor's
+    # lastrowid without a second query.
+    'mysql': ("INSERT INTO queue_counters (hospital, date, value) VALUES (%s, %s, LAST_INSERT_ID(%s)) "
+              "ON DUPLICATE KEY UPDATE value = LAST_INSERT_ID(value + %s)"),
+    'sqlite': ("INSERT INTO queue_counters (hospital, date, value) VALUES (?, ?, ?) "
+               "ON CONFLICT (hospital, date) DO UPDATE SET value = value + ? RETURNING value"),
+}
+
+
+class QueueNumberAllocator:
+    """Hands out per-hospital, per-day queue numbers starting at 1.
+
+    With ``block_size=1`` every call is one atomic upsert and numbers are
+    gap-free. A larger block reserves that many numbers per round trip and
+    serves them from memory, which takes the counter row off the hot path at
+    the cost of strict ordering between workers (and unused tails of a block
+    are never handed out, so the numbers no longer count allocations).
+    """
+
+    def __init__(self, get_connection, block_size=1, dialect='mysql'):
+        self._get_connection = get_connection
+        self.block_size = block_size
+        self._sql = ALLOCATE_SQL[dialect]
+        self._dialect = dialect
+        self._lock = threading.Lock()
+        self._blocks = {}  # (hospital, day) -> [next, last]
+
+    def allocate(self, hospital, day=None, connection=None):
+        """Return the next queue number for ``hospital`` on ``day`` (default today).
+
+        If ``connection`` is given the counter update joins the caller's
+        transaction and the caller commits; otherwise it commits on its own.
+        Blocks cannot join a transaction, so ``connection`` with
+        ``block_size > 1`` raises ValueError.
+        """
+        day = day or date.today()
+        if connection is not None and self.block_size > 1:
+            raise ValueError("queue number blocks are committed on their own; "
+                             "allocate without a connection or use block_size=1")
+        if self.block_size <= 1:
+            return self._reserve(hospital, day, 1, connection)
+
+        key = (hospital, day)
+        with self._lock:
+            block = self._blocks.get(key)
+            if block is None or block[0] > block[1]:
+                # Blocks are committed on their own connection: if they joined
+                # the caller's transaction a rollback would let another
+                # worker reserve the same numbers again.
+                last = self._reserve(hospital, day, self.block_size, None)
+                block = self._blocks[key] = [last - self.block_size + 1, last]
+                # Drop blocks left over from previous days.
+                for stale in [k for k in self._blocks if k[1] != day]:
+                    del self._blocks[stale]
+            number = block[0]
+            block[0] += 1
+            return number
+
+    def _reserve(self, hospital, day, count, connection):
+        if connection is not None:
+            return self._execute(connection, hospital, day, count)
+        with self._get_connection() as connection:
+            value = self._execute(connection, hospital, day, count)
+            connection.commit()
+            return value
+
+    def _execute(self, connection, hospital, day, count):
+        params = (hospital, day, count, count)
+        if self._dialect == 'sqlite':
+            return connection.execute(self._sql, params).fetchone()[0]
+        with connection.cursor() as cursor:
+            cursor.execute(self._sql, params)
+            return cursor.lastrowid
+EOF
+
+# Create schema migrations module
+cat << 'EOF' > migrations.py
+"""Versioned schema migrations for the hospital queue database.
+
+Each migration runs once, in order, and is recorded in schema_migrations.
+Keep one DDL statement per migration: MySQL commits DDL implicitly, so a
+statement is the unit that either fully applies or can be retried.
+
+    python migrations.py
+"""
+
+MIGRATIONS = [
+    # load_slot_capacity: hospital + date equality, ordered by slot_time.
+    (1, 'Index time_slots by hospital, date and slot time',
+     "ALTER TABLE time_slots ADD INDEX idx_time_slots_hospital_date_time (hospital, date, slot_time)"),
+    # waiting_patients and the per-hospital/day queue ranking: hospital
+    # equality, created_at range, status and queue_number checked in the index.
+    (2, 'Index patients by hospital, day, status and queue number',
+     "ALTER TABLE patients ADD INDEX idx_patients_hospital_day_queue (hospital, created_at, status, queue_number)"),
+    # /patients keyset pagination on (queue_number, id), unfiltered and by
+    # hospital (InnoDB appends the primary key to secondary indexes).
+    (3, 'Index patients by queue number for keyset pagination',
+     "ALTER TABLE patients ADD INDEX idx_patients_queue_number (queue_number)"),
+    (4, 'Index patients by hospital and queue number for keyset pagination',
+     "ALTER TABLE patients ADD INDEX idx_patients_hospital_queue (hospital, queue_number)"),
+    # Queue events tailed by every worker and pushed to dashboards (/events).
+    (5, 'Create queue_events table',
+     """CREATE TABLE IF NOT EXISTS queue_events (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            hospital VARCHAR(100) NOT NULL,
+            type VARCHAR(30) NOT NULL,
+            payload JSON NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )"""),
+    # Durable outbox of API Gateway calls, drained by outbox.Outbox.
+    (6, 'Create outbox table',
+     """CREATE TABLE IF NOT EXISTS outbox (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            idempotency_key CHAR(36) NOT NULL UNIQUE,
+            path VARCHAR(255) NOT NULL,
+            payload JSON NOT NULL,
+            created_at TIMESTAMP(3) DEFAULT CURRENT_TIMESTAMP(3),
+            attempts INT NOT NULL DEFAULT 0,
+            next_attempt_at TIMESTAMP(3) DEFAULT CURRENT_TIMESTAMP(3),
+            delivered_at TIMESTAMP(3) NULL,
+            last_error VARCHAR(255),
+            INDEX idx_outbox_pending (delivered_at, next_attempt_at)
+        )"""),
+    # Visit lengths (check_in_time to checkout) for the wait time estimator;
+    # the index serves its warm-up query for the most recent visits.
+    (7, 'Record checkout time on patients',
+     "ALTER TABLE patients ADD COLUMN checked_out_at TIMESTAMP NULL, "
+     "ADD INDEX idx_patients_checked_out_at (checked_out_at)"),
+    # One row per (hospital, date, slot_time), so slot_inventory can generate
+    # with INSERT IGNORE. The old seed inserted every slot twice (once per
+    # MySQL block of the bootstrap): 8-10 fold each set of duplicates into
+    # its lowest id, bookings and patients included, before 11 adds the key.
+    (8, 'Point patients at the first of duplicate time slots',
+     """UPDATE patients p
+        JOIN time_slots dup ON dup.id = p.time_slot_id
+        JOIN (SELECT hospital, date, slot_time, MIN(id) AS id FROM time_slots
+              GROUP BY hospital, date, slot_time HAVING COUNT(*) > 1) keep
+          ON keep.hospital = dup.hospital AND keep.date = dup.date AND keep.slot_time = dup.slot_time
+        SET p.time_slot_id = keep.id
+        WHERE dup.id <> keep.id"""),
+    (9, 'Sum the bookings of duplicate time slots into the first',
+     """UPDATE time_slots keep
+        JOIN (SELECT MIN(id) AS id, SUM(booked) AS booked FROM time_slots
+              GROUP BY hospital, date, slot_time HAVING COUNT(*) > 1) merged ON merged.id = keep.id
+        SET keep.booked = merged.booked"""),
+    (10, 'Delete duplicate time slots',
+     """DELETE dup FROM time_slots dup
+        JOIN (SELECT hospital, date, slot_time, MIN(id) AS id FROM time_slots
+              GROUP BY hospital, date, slot_time HAVING COUNT(*) > 1) keep
+          ON keep.hospital = dup.hospital AND keep.date = dup.date AND keep.slot_time = dup.slot_time
+        WHERE dup.id <> keep.id"""),
+    # The unique key replaces index 1 (same columns).
+    (11, 'Make time slots unique per hospital, date and time',
+     "ALTER TABLE time_slots ADD UNIQUE KEY uq_time_slots_hospital_date_time (hospital, date, slot_time), "
+     "DROP INDEX idx_time_slots_hospital_date_time"),
+    # The registration's UserId in DynamoDB (its outbox requestId), for checkouts.
+    (12, 'Record the registration id on patients',
+     "ALTER TABLE patients ADD COLUMN registration_id CHAR(36) NULL"),
+]
+
+
+def migrate(connection):
+    """Apply pending migrations and return the versions that were applied."""
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INT PRIMARY KEY,
+                description VARCHAR(255) NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cursor.execute("SELECT version FROM schema_migrations")
+        done = {row['version'] for row in cursor.fetchall()}
+
+        applied = []
+        for version, description, statement in MIGRATIONS:
+            if version in done:
+                continue
+            print(f"Applying migration {version}: {description}")
+            cursor.execute(statement)
+            cursor.execute("INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                           (version, description))
+            connection.commit()
+            applied.append(version)
+    return applied
+
+
+if __name__ == '__main__':
+    from app import get_db_connection
+    with get_db_connection() as connection:
+        applied = migrate(connection)
+    print(f"Applied migrations: {applied}" if applied else "Schema is up to date")
+EOF
+
+# Create cache module
+cat << 'EOF' > cache.py
+import asyncio
+import threading
+import time
+from collections import deque
+
+
+class _Flight:
+    """One load in progress; callers that need its result wait on ``done``."""
+
+    __slots__ = ('done', 'value', 'error')
+
+    def __init__(self, done):
+        self.done = done
+        self.value = None
+        self.error = None
+
+
+class CoalescingCache:
+    """Serve ``loader(*key)`` results to concurrent callers with one load per key.
+
+    Callers that miss while a load for their key is in flight wait for it
+    instead of calling the loader themselves. A value is fresh for ``ttl``
+    seconds, then served stale for up to ``stale_ttl`` more while a single
+    background load refreshes it (stale-while-revalidate); if that load fails,
+    the stale value keeps being served until then. Meant for a few hot keys
+    (entries are never evicted). ``ttl=0`` disables caching and coalescing:
+    every call goes to the loader.
+    """
+
+    def __init__(self, loader, ttl, stale_ttl=0):
+        self._loader = loader
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._lock = threading.Lock()
+        self._entries = {}  # key -> (loaded_at, value)
+        self._flights = {}  # key -> _Flight
+        self._load_times = deque(maxlen=100000)
+        self._stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'coalesced': 0, 'loads': 0, 'load_errors': 0}
+
+    def _new_flight(self):
+        return _Flight(threading.Event())
+
+    def _begin(self, key):
+        """Returns (action, value, flight): 'hit' or 'stale' with a value (and,
+        for 'stale', a refresh flight to start or None), 'wait' for a flight
+        in progress, or 'load' to run the flight."""
+        now = time.monotonic()
+        with self._lock:
+            if self.ttl > 0:
+                entry = self._entries.get(key)
+                if entry is not None and now - entry[0] < self.ttl:
+                    self._stats['hits'] += 1
+                    return 'hit', entry[1], None
+                flight = self._flights.get(key)
+                if entry is not None and now - entry[0] < self.ttl + self.stale_ttl:
+                    self._stats['stale_hits'] += 1
+                    if flight is None:
+                        flight = self._flights[key] = self._new_flight()
+                        return 'stale', entry[1], flight
+                    return 'stale', entry[1], None
+                if flight is not None:
+                    self._stats['coalesced'] += 1
+                    return 'wait', None, flight
+            self._stats['misses'] += 1
+            flight = self._new_flight()
+            if self.ttl > 0:
+                self._flights[key] = flight
+            return 'load', None, flight
+
+    def _finish(self, key, flight):
+        with self._lock:
+            self._stats['loads'] += 1
+            self._load_times.append(time.monotonic())
+            if flight.error is not None:
+                self._stats['load_errors'] += 1
+            elif self.ttl > 0:
+                self._entries[key] = (time.monotonic(), flight.value)
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.done.set()
+
+    def _load(self, key, flight):
+        try:
+            flight.value = self._loader(*key)
+        except Exception as e:
+            flight.error = e
+        self._finish(key, flight)
+
+    def get(self, *key):
+        action, value, flight = self._begin(key)
+        if action == 'stale' and flight is not None:
+            threading.Thread(target=self._load, args=(key, flight), daemon=True).start()
+        if action in ('hit', 'stale'):
+            return value
+        if action == 'load':
+            self._load(key, flight)
+        else:
+            flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def metrics(self):
+        """Counters, plus upstream loads in the last minute (however many callers)."""
+        with self._lock:
+            since = time.monotonic() - 60
+            return dict(self._stats, ttl=self.ttl, stale_ttl=self.stale_ttl,
+                        requests=sum(self._stats[k] for k in ('hits', 'stale_hits', 'misses', 'coalesced')),
+                        loads_last_minute=sum(1 for t in self._load_times if t > since))
+
+
+class AsyncCoalescingCache(CoalescingCache):
+    """CoalescingCache for an event loop: ``loader`` is a coroutine function
+    and ``get`` is awaited. Use from a single event loop."""
+
+    def __init__(self, loader, ttl, stale_ttl=0):
+        super().__init__(loader, ttl, stale_ttl)
+        self._refreshes = set()  # background refresh tasks, kept until done
+
+    def _new_flight(self):
+        return _Flight(asyncio.Event())
+
+    async def _load(self, key, flight):
+        try:
+            flight.value = await self._loader(*key)
+        except Exception as e:
+            flight.error = e
+        self._finish(key, flight)
+
+    async def get(self, *key):
+        action, value, flight = self._begin(key)
+        if action == 'stale' and flight is not None:
+            task = asyncio.ensure_future(self._load(key, flight))
+            self._refreshes.add(task)
+            task.add_done_callback(self._refreshes.discard)
+        if action in ('hit', 'stale'):
+            return value
+        if action == 'load':
+            await self._load(key, flight)
+        else:
+            await flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+EOF
+
+# Create queue events module
+cat << 'EOF' > queue_events.py
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+RESYNC = object()  # returned to subscribers that fell too far behind
+
+# Rows are re-read this many ids back: AUTO_INCREMENT ids are assigned at
+# INSERT but become visible at COMMIT, so a lower id can show up late.
+LOOKBACK_IDS = 200
+
+
+class Subscription:
+    """One connected dashboard: a bounded buffer of events for its hospitals."""
+
+    def __init__(self, hospitals, max_buffer):
+        self.hospitals = set(hospitals)
+        self.max_buffer = max_buffer
+        self._events = deque()
+        self._overflowed = False
+        self._cond = threading.Condition(threading.Lock())
+
+    def push(self, event):
+        """Buffer an event; returns True if this push overflowed the buffer."""
+        with self._cond:
+            if self._overflowed:
+                return False
+            if len(self._events) >= self.max_buffer:
+                # A client this far behind reloads instead of catching up.
+                self._overflowed = True
+                self._events.clear()
+            else:
+                self._events.append(event)
+            self._cond.notify()
+            return self._overflowed
+
+    def wait(self, timeout):
+        """Return buffered events, RESYNC, or [] if nothing arrived in time."""
+        with self._cond:
+            if not self._events and not self._overflowed:
+                self._cond.wait(timeout)
+            if self._overflowed:
+                self._overflowed = False
+                return RESYNC
+            events = list(self._events)
+            self._events.clear()
+            return events
+
+
+class QueueEventBroker:
+    """Fans queue events out to the dashboards connected to this worker.
+
+    Writers add events to the queue_events table in the same transaction as
+    the change (record()), so every Gunicorn worker sees every event. One
+    background thread per worker tails that table and pushes new rows to the
+    in-memory subscriptions for the event's hospital; dashboards never query
+    the database themselves.
+    """
+
+    def __init__(self, get_connection, poll_interval=0.25, max_buffer=100, retain=10000):
+        self._get_connection = get_connection
+        self.poll_interval = poll_interval
+        self.max_buffer = max_buffer
+        self.retain = retain
+        self._reset_state()
+
+    def _reset_state(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._by_hospital = {}  # hospital -> set of subscriptions
+        self._all = set()       # subscriptions for every hospital
+        self._thread = None
+        self._last_id = None
+        self._seen = set()
+        self._stats = {'events': 0, 'deliveries': 0, 'resyncs': 0, 'poll_errors': 0}
+
+    @staticmethod
+    def record(cursor, hospital, event_type, payload):
+        cursor.execute(
+            "INSERT INTO queue_events (hospital, type, payload) VALUES (%s, %s, %s)",
+            (hospital, event_type, json.dumps(payload, default=str)))
+
+    @contextmanager
+    def subscribe(self, hospitals=()):
+        if self._pid != os.getpid():
+            self._reset_state()
+        subscription = Subscription(hospitals, self.max_buffer)
+        with self._lock:
+            if subscription.hospitals:
+                for hospital in subscription.hospitals:
+                    self._by_hospital.setdefault(hospital, set()).add(subscription)
+            else:
+                self._all.add(subscription)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='queue-events', daemon=True)
+                self._thread.start()
+        try:
+            yield subscription
+        finally:
+            with self._lock:
+                self._all.discard(subscription)
+                for hospital in subscription.hospitals:
+                    self._by_hospital.get(hospital, set()).discard(subscription)
+
+    def publish(self, event):
+        with self._lock:
+            targets = self._all | self._by_hospital.get(event['hospital'], set())
+            self._stats['events'] += 1
+            self._stats['deliveries'] += len(targets)
+        overflowed = sum(subscription.push(event) for subscription in targets)
+        if overflowed:
+            with self._lock:
+                self._stats['resyncs'] += overflowed
+
+    def _run(self):
+        polls = 0
+        while True:
+            try:
+                self._poll(prune=polls % 2400 == 0)
+            except Exception:
+                with self._lock:
+                    self._stats['poll_errors'] += 1
+            polls += 1
+            time.sleep(self.poll_interval)
+
+    def _poll(self, prune=False):
+        with self._get_connection() as connection:
+            with connection.cursor() as cursor:
+                if self._last_id is None:
+                    cursor.execute("SELECT COALESCE(MAX(id), 0) AS last_id FROM queue_events")
+                    self._last_id = cursor.fetchone()['last_id']
+                    cursor.execute("SELECT id FROM queue_events WHERE id > %s", (self._last_id - LOOKBACK_IDS,))
+                    self._seen = {row['id'] for row in cursor.fetchall()}
+                    return
+                cursor.execute(
+                    "SELECT id, hospital, type, payload FROM queue_events WHERE id > %s ORDER BY id",
+                    (self._last_id - LOOKBACK_IDS,))
+                rows = [row for row in cursor.fetchall() if row['id'] not in self._seen]
+                if prune and self._last_id > self.retain:
+                    cursor.execute("DELETE FROM queue_events WHERE id <= %s LIMIT 10000",
+                                   (self._last_id - self.retain,))
+                    connection.commit()
+        for row in rows:
+            self._seen.add(row['id'])
+            self._last_id = max(self._last_id, row['id'])
+            self.publish(dict(json.loads(row['payload']), id=row['id'], type=row['type'],
+                              hospital=row['hospital']))
+        if rows:
+            self._seen = {i for i in self._seen if i > self._last_id - LOOKBACK_IDS}
+
+    def metrics(self):
+        with self._lock:
+            return dict(self._stats, subscribers=len(self._all) + len(set().union(*self._by_hospital.values())),
+                        last_event_id=self._last_id)
+EOF
+
+# Create outbox module
+cat << 'EOF' > outbox.py
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class Outbox:
+    """Durable queue of API Gateway calls, drained by a background thread.
+
+    add() writes the call to the outbox table on the caller's cursor, so it
+    commits (or rolls back) with the change it describes. The drainer claims
+    pending rows in batches with SELECT ... FOR UPDATE SKIP LOCKED and leases
+    them (next_attempt_at moved past the sends) in one short transaction, so
+    every Gunicorn worker can drain without two of them sending the same row
+    and no lock or connection is held while sending. Rows for a path in
+    ``batch_paths`` go out as one POST of {"registrations": [...]} (the
+    registration Lambda's batch mode); others one POST each, all over one
+    keep-alive requests.Session. The results are recorded in a second short
+    transaction, and failures retried with exponential backoff. Delivery is
+    at-least-once; each call carries an Idempotency-Key (also sent as
+    ``requestId``) so the receiver can drop repeats.
+    """
+
+    def __init__(self, get_connection, base_url, batch_size=25, poll_interval=1.0,
+                 max_backoff=300, timeout=5, batch_paths=()):
+        self._get_connection = get_connection
+        self.base_url = base_url
+        self.batch_size = batch_size
+        self.batch_paths = frozenset(batch_paths)
+        self.poll_interval = poll_interval
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self._reset_state()
+
+    def _reset_state(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._session = None
+        self._stats = {'delivered': 0, 'failed_attempts': 0, 'batches': 0,
+                       'lag_total': 0.0, 'lag_max': 0.0}
+
+    @staticmethod
+    def add(cursor, path, payload, key=None):
+        """Queue a POST of ``payload`` to ``path`` inside the caller's transaction.
+
+        ``key`` is the Idempotency-Key and requestId (default a new UUID); it is returned.
+        """
+        key = key or str(uuid.uuid4())
+        cursor.execute(
+            "INSERT INTO outbox (idempotency_key, path, payload) VALUES (%s, %s, %s)",
+            (key, path, json.dumps(dict(payload, requestId=key), default=str)))
+        return key
+
+    def wake(self):
+        """Start the drainer if needed and have it run now (call after commit)."""
+        self.ensure_started()
+        self._wake.set()
+
+    def ensure_started(self):
+        if self._pid != os.getpid():
+            self._reset_state()
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._session = self._new_session()
+                    self._thread = threading.Thread(target=self._run, name='outbox', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        last_prune = 0
+        while True:
+            try:
+                while self.drain_once() == self.batch_size:
+                    pass  # keep going while there is a backlog
+                if time.monotonic() - last_prune > 3600:
+                    self.prune()
+                    last_prune = time.monotonic()
+            except Exception as e:
+                logging.error(f"Outbox drain failed: {e}")
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def drain_once(self):
+        """Claim, send and record one batch; returns how many rows were claimed."""
+        rows = self._claim()
+        if not rows:
+            return 0
+        errors = {}  # id -> error, for the rows that failed
+        for path, group in self._requests(rows):
+            errors.update(self._send(path, group))
+        delivered = [row for row in rows if row['id'] not in errors]
+        failed = [(row, errors[row['id']]) for row in rows if row['id'] in errors]
+        self._record(delivered, failed)
+
+        with self._lock:
+            self._stats['batches'] += 1
+            self._stats['delivered'] += len(delivered)
+            self._stats['failed_attempts'] += len(failed)
+            for row in delivered:
+                self._stats['lag_total'] += float(row['age'])
+                self._stats['lag_max'] = max(self._stats['lag_max'], float(row['age']))
+        return len(rows)
+
+    def _requests(self, rows):
+        """(path, rows) per POST: all of a batch path's rows together, others one by one."""
+        batched = {}
+        for row in rows:
+            if row['path'] in self.batch_paths:
+                batched.setdefault(row['path'], []).append(row)
+            else:
+                yield row['path'], [row]
+        yield from batched.items()
+
+    def _claim(self):
+        """Lease up to batch_size due rows past the time it can take to send them."""
+        with self._get_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute("""
+                    SELECT id, idempotency_key, path, payload, attempts,
+                           TIMESTAMPDIFF(MICROSECOND, created_at, NOW(3)) / 1e6 AS age
+                    FROM outbox
+                    WHERE delivered_at IS NULL AND next_attempt_at <= NOW(3)
+                    ORDER BY id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                """, (self.batch_size,))
+                rows = cursor.fetchall()
+                if rows:
+                    # If this worker dies mid-send, the rows come due again after the lease
+                    lease = self.timeout * sum(1 for _ in self._requests(rows)) + 5
+                    cursor.execute(
+                        "UPDATE outbox SET next_attempt_at = NOW(3) + INTERVAL %s SECOND WHERE id IN ({})".format(
+                            ', '.join(['%s'] * len(rows))),
+                        [lease] + [row['id'] for row in rows])
+            connection.commit()
+        return rows
+
+    def _record(self, delivered, failed):
+        with self._get_connection() as connection:
+            with connection.cursor() as cursor:
+                if delivered:
+                    cursor.execute(
+                        "UPDATE outbox SET delivered_at = NOW(3), attempts = attempts + 1 WHERE id IN ({})".format(
+                            ', '.join(['%s'] * len(delivered))),
+                        [row['id'] for row in delivered])
+                for row, error in failed:
+                    backoff = min(2 ** row['attempts'], self.max_backoff)
+                    cursor.execute("""
+                        UPDATE outbox
+                        SET attempts = attempts + 1, last_error = %s,
+                            next_attempt_at = NOW(3) + INTERVAL %s SECOND
+                        WHERE id = %s
+                    """, (error[:255], backoff, row['id']))
+            connection.commit()
+
+    @staticmethod
+    def _new_session():
+        # Retries are the outbox's job (with backoff), not urllib3's.
+        session = requests.Session()
+        session.mount('http://', HTTPAdapter(pool_maxsize=4, max_retries=0))
+        session.mount('https://', HTTPAdapter(pool_maxsize=4, max_retries=0))
+        return session
+
+    def _send(self, path, rows):
+        """POST the rows (one, or a batch); returns {id: error} for those that failed."""
+        if self._session is None:
+            self._session = self._new_session()
+        if path in self.batch_paths:
+            data = '{"registrations": [' + ', '.join(row['payload'] for row in rows) + ']}'
+            headers = {'Content-Type': 'application/json'}  # each registration carries its requestId
+        else:
+            data = rows[0]['payload']
+            headers = {'Content-Type': 'application/json', 'Idempotency-Key': rows[0]['idempotency_key']}
+        try:
+            response = self._session.post(f"{self.base_url}{path}", data=data, timeout=self.timeout,
+                                          headers=headers)
+            if response.status_code >= 300:
+                return {row['id']: f"HTTP {response.status_code}" for row in rows}
+            # The Lambda's return value comes through API Gateway as is, with
+            # its own statusCode (a checkout of a registration not stored yet is a 404)
+            body = response.json() if response.content else {}
+            if path not in self.batch_paths:
+                status = body.get('statusCode', 200) if isinstance(body, dict) else 200
+                return {rows[0]['id']: f"Lambda {status}"} if status >= 300 else {}
+            # One result per registration, in order, under "body"
+            results = body.get('body', body)['results']
+        except (requests.RequestException, ValueError, KeyError, TypeError, AttributeError) as e:
+            error = str(e) or type(e).__name__
+            return {row['id']: error for row in rows}
+        return {row['id']: f"{result.get('status')}: {result.get('error', '')}".strip(': ')
+                for row, result in zip(rows, results) if result.get('status') not in ('stored', 'duplicate')}
+
+    def prune(self, days=7):
+        """Delete rows delivered more than ``days`` ago."""
+        with self._get_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute("DELETE FROM outbox WHERE delivered_at < NOW() - INTERVAL %s DAY LIMIT 10000",
+                               (days,))
+            connection.commit()
+
+    def metrics(self):
+        with self._get_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT COUNT(*) AS pending, MIN(created_at) AS oldest "
+                               "FROM outbox WHERE delivered_at IS NULL")
+                pending = cursor.fetchone()
+        with self._lock:
+            delivered = self._stats['delivered']
+            return dict(self._stats, pending=pending['pending'], oldest_pending=pending['oldest'],
+                        lag_avg=self._stats['lag_total'] / delivered if delivered else 0.0)
+EOF
+
+# Copy the triage queue module, shared with the registration Lambda
+cp "${REPO_DIR}/Capstone/triage_queue.py" triage_queue.py
+if [ $? -ne 0 ]; then
+    echo "Error: ${REPO_DIR}/Capstone/triage_queue.py not found. Run this script from a checkout of the repository. Exiting."
+    exit 1
+fi
+
+# Create wait time estimator module
+cat << 'EOF' > wait_times.py
+import logging
+import threading
+import time
+
+
+class WaitTimeEstimator:
+    """Learns how long a visit takes, per hospital and per appointment type.
+
+    Each completed visit (check-in to checkout) updates exponentially
+    weighted moving averages for its (hospital, appointment type), its
+    hospital and all hospitals, in O(1). Estimates are served from memory
+    using the most specific average with at least ``min_samples`` visits,
+    falling back to ``default_minutes`` until there is enough history. The
+    averages are rebuilt from the visit history every ``reload_interval``
+    seconds (see ensure_loaded).
+    """
+
+    def __init__(self, alpha=0.1, default_minutes=15, min_samples=5, max_minutes=240,
+                 reload_interval=300, retry_after=5):
+        self.alpha = alpha
+        self.default_minutes = default_minutes
+        self.min_samples = min_samples
+        self.max_minutes = max_minutes
+        self.reload_interval = reload_interval
+        self.retry_after = retry_after
+        self._averages = {}  # (hospital, appointment_type) -> [minutes, samples]
+        self._lock = threading.Lock()
+        self._next_load = 0.0  # time.monotonic() of the next history load
+        self._failed_loads = 0  # in a row
+        self._stats = {'loads': 0, 'failed_loads': 0}
+        self._ignored = 0
+
+    def observe(self, hospital, appointment_type, minutes):
+        """Record one completed visit that took ``minutes``."""
+        if not self._valid(minutes):
+            with self._lock:
+                self._ignored += 1
+            return
+        with self._lock:
+            self._add(self._averages, hospital, appointment_type, minutes)
+
+    def _valid(self, minutes):
+        # None: never checked in; too long: a checkout forgotten until the next day
+        return minutes is not None and 0 < minutes <= self.max_minutes
+
+    def _add(self, averages, hospital, appointment_type, minutes):
+        for key in ((hospital, appointment_type), (hospital, None), (None, None)):
+            average = averages.get(key)
+            if average is None:
+                averages[key] = [minutes, 1]
+            else:
+                average[0] += self.alpha * (minutes - average[0])
+                average[1] += 1
+
+    def service_minutes(self, hospital=None, appointment_type=None):
+        """Expected length of one visit."""
+        for key in ((hospital, appointment_type), (hospital, None), (None, None)):
+            average = self._averages.get(key)
+            if average and average[1] >= self.min_samples:
+                return average[0]
+        return self.default_minutes
+
+    def estimate(self, position, hospital=None):
+        """Minutes until a patient at ``position`` in a hospital's queue is seen."""
+        return round(position * self.service_minutes(hospital))
+
+    def estimate_queue(self, hospital, appointment_types):
+        """Waiting times for a whole queue, given each patient's appointment type in order.
+
+        Everyone's wait is the sum of the expected visits up to and including
+        their own, so a queue of follow-ups moves faster than one of
+        emergencies.
+        """
+        waits, total = [], 0.0
+        for appointment_type in appointment_types:
+            total += self.service_minutes(hospital, appointment_type)
+            waits.append(round(total))
+        return waits
+
+    def ensure_loaded(self, load_history):
+        """Rebuild the averages from ``load_history()``, an iterable of
+        (hospital, appointment_type, minutes) in the order the visits ended,
+        if ``reload_interval`` seconds have passed since the last load.
+
+        The history holds every worker's checkouts, so reloading brings this
+        worker's averages in line with the others. One caller loads while the
+        rest carry on with the current averages; a failed load is retried
+        after ``retry_after`` seconds, doubling up to ``reload_interval``.
+        """
+        now = time.monotonic()
+        if now < self._next_load:
+            return
+        with self._lock:
+            if now < self._next_load:
+                return
+            self._next_load = now + self.reload_interval
+        try:
+            averages = {}
+            for hospital, appointment_type, minutes in load_history():
+                if self._valid(minutes):
+                    self._add(averages, hospital, appointment_type, minutes)
+        except Exception as e:
+            with self._lock:
+                self._stats['failed_loads'] += 1
+                self._failed_loads += 1
+                self._next_load = now + min(self.retry_after * 2 ** (self._failed_loads - 1), self.reload_interval)
+            logging.error(f"Could not load visit history for wait times: {e}")
+            return
+        with self._lock:
+            self._averages = averages
+            self._stats['loads'] += 1
+            self._failed_loads = 0
+
+    def metrics(self):
+        with self._lock:
+            return dict(self._stats, ignored=self._ignored, averages=[
+                {'hospital': hospital, 'appointment_type': appointment_type,
+                 'minutes': round(minutes, 1), 'samples': samples}
+                for (hospital, appointment_type), (minutes, samples) in self._averages.items()])
+EOF
+
+# Create form validation module
+cat << 'EOF' > validation.py
+import re
+from datetime import date
+
+ISO_DATE = re.compile(r'\d{4}-\d{2}-\d{2}')
+# At most 15 characters in all, + included: emergency_contact_phone is VARCHAR(15)
+PHONE = re.compile(r'(?=.{9,15}$)\+?1?\d{9,15}')
+PHONE_SEPARATORS = re.compile(r'[\s().-]')
+
+
+class ValidationError(Exception):
+    """Raised with every failing field at once: ``errors`` maps field -> message."""
+
+    def __init__(self, errors):
+        super().__init__('; '.join(f"{field}: {message}" for field, message in errors.items()))
+        self.errors = errors
+
+
+class Field:
+    """One form field: whether it is required, and a function that checks and
+    converts its (stripped, non-empty) string value or raises ValueError."""
+
+    __slots__ = ('required', 'coerce')
+
+    def __init__(self, coerce, required=True):
+        self.coerce = coerce
+        self.required = required
+
+
+def text(max_length, pattern=None, required=True):
+    compiled = re.compile(pattern) if pattern else None
+
+    def coerce(value):
+        if len(value) > max_length:
+            raise ValueError(f"must be at most {max_length} characters")
+        if compiled and not compiled.fullmatch(value):
+            raise ValueError("has an invalid format")
+        return value
+    return Field(coerce, required)
+
+
+def choice(*options, required=True):
+    allowed = frozenset(options)
+
+    def coerce(value):
+        if value not in allowed:
+            raise ValueError(f"must be one of {', '.join(options)}")
+        return value
+    return Field(coerce, required)
+
+
+def integer(min_value=None, max_value=None, required=True):
+    def coerce(value):
+        try:
+            number = int(value)
+        except ValueError:
+            raise ValueError("must be a whole number") from None
+        if (min_value is not None and number < min_value) or (max_value is not None and number > max_value):
+            raise ValueError("is out of range")
+        return number
+    return Field(coerce, required)
+
+
+def iso_date(past=False, required=True):
+    """YYYY-MM-DD, parsed with date.fromisoformat (C, unlike strptime)."""
+    # Dates before the day the schema was built can never be in the future,
+    # so date.today() (the slowest step) only runs for recent dates.
+    checked_until = date.today()
+
+    def coerce(value):
+        if not ISO_DATE.fullmatch(value):
+            raise ValueError("must be a date (YYYY-MM-DD)")
+        try:
+            parsed = date.fromisoformat(value)
+        except ValueError:
+            raise ValueError("is not a valid date") from None
+        if past and parsed >= checked_until and parsed > date.today():
+            raise ValueError("cannot be in the future")
+        return parsed
+    return Field(coerce, required)
+
+
+def phone(required=True):
+    """Digits with an optional +/1 prefix; spaces, dots, dashes and brackets are dropped."""
+    def coerce(value):
+        digits = PHONE_SEPARATORS.sub('', value)
+        if not PHONE.fullmatch(digits):
+            raise ValueError("must be a phone number of 9 to 15 digits (15 characters with the +)")
+        return digits
+    return Field(coerce, required)
+
+
+class Schema:
+    """Validates and converts a form (any mapping with .get) in one pass.
+
+    Fields are compiled once, when the schema is defined; validate() returns
+    the cleaned values (missing optional fields become '') or raises
+    ValidationError listing every problem.
+    """
+
+    def __init__(self, **fields):
+        self._fields = tuple(fields.items())
+
+    def validate(self, form):
+        cleaned, errors = {}, {}
+        for name, field in self._fields:
+            value = (form.get(name) or '').strip()
+            if not value:
+                if field.required:
+                    errors[name] = "is required"
+                else:
+                    cleaned[name] = ''
+                continue
+            try:
+                cleaned[name] = field.coerce(value)
+            except ValueError as e:
+                errors[name] = str(e)
+        if errors:
+            raise ValidationError(errors)
+        return cleaned
+EOF
+
+# Create instrumentation module
+cat << 'EOF' > instrumentation.py
+import atexit
+import contextvars
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+from bisect import bisect_left
+
+import pymysql.cursors
+from flask import request
+
+# Upper bounds of the latency buckets, in milliseconds
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, float('inf'))
+
+_request = contextvars.ContextVar('instrumented_request', default=None)
+
+
+class RequestState:
+    __slots__ = ('request_id', 'started', 'sampled', 'db_seconds', 'db_queries', 'status', 'token')
+
+    def __init__(self, request_id, sampled):
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.sampled = sampled
+        self.db_seconds = 0.0
+        self.db_queries = 0
+        self.status = 500
+        self.token = None
+
+
+class TimedDictCursor(pymysql.cursors.DictCursor):
+    """DictCursor that adds its query time to the current request's total."""
+
+    def execute(self, query, args=None):
+        state = _request.get()
+        if state is None:
+            return super().execute(query, args)
+        start = time.perf_counter()
+        try:
+            return super().execute(query, args)
+        finally:
+            state.db_seconds += time.perf_counter() - start
+            state.db_queries += 1
+
+
+class Histogram:
+    """Fixed-bucket latency histogram; observe() is a bisect and two adds."""
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS_MS)
+        self.total_ms = 0.0
+
+    def observe(self, ms):
+        self.counts[bisect_left(BUCKETS_MS, ms)] += 1
+        self.total_ms += ms
+
+    def percentile(self, pct):
+        """Upper bound of the bucket holding the pct-th percentile."""
+        target = sum(self.counts) * pct / 100
+        seen = 0
+        for bound, count in zip(BUCKETS_MS, self.counts):
+            seen += count
+            if count and seen >= target:
+                return bound
+        return 0
+
+    def snapshot(self):
+        count = sum(self.counts)
+        return {
+            'count': count,
+            'mean': round(self.total_ms / count, 2) if count else 0,
+            'p50': self.percentile(50), 'p90': self.percentile(90), 'p99': self.percentile(99),
+            'buckets': {('+Inf' if bound == float('inf') else str(bound)): n
+                        for bound, n in zip(BUCKETS_MS, self.counts) if n},
+        }
+
+
+class SampledDebugFilter(logging.Filter):
+    """Keeps DEBUG records only for sampled requests; other levels always pass."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        state = _request.get()
+        return state.sampled if state is not None else random.random() < self.rate
+
+
+class ContextFilter(logging.Filter):
+    """Tags records with the current request id (on the caller's thread)."""
+
+    def filter(self, record):
+        state = _request.get()
+        record.request_id = state.request_id if state is not None else None
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Never blocks the request: when the queue is full the record is dropped and counted."""
+
+    dropped = 0
+
+    def prepare(self, record):
+        # Merge the arguments now, since they may change once the call returns;
+        # the JSON formatting happens on the listener thread.
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+
+class Instrumentation:
+    """Per-route latency and database time, plus non-blocking, sampled logging.
+
+    Requests append log records to a bounded in-memory queue; a listener
+    thread formats them as JSON lines and writes the file, so no request
+    waits on disk I/O or the file handler's lock. DEBUG records are kept for
+    ``debug_sample_rate`` of requests (all or nothing per request, so a
+    sampled request's trail is complete).
+    """
+
+    def __init__(self, debug_sample_rate=0.01, queue_size=10000):
+        self.debug_sample_rate = debug_sample_rate
+        self.queue_size = queue_size
+        self._ids = itertools.count(1)
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._routes = {}  # 'METHOD rule' -> {'latency', 'db', 'errors', 'db_queries'}
+        self._listener = None
+        self._handler = None
+        self._file_handler = None
+        if hasattr(os, 'register_at_fork'):
+            # With gunicorn --preload, workers fork after this runs: give them
+            # their own request id prefix and a listener thread (threads do not
+            # survive the fork).
+            os.register_at_fork(after_in_child=self._after_fork)
+        atexit.register(self._stop_listener)
+
+    def setup_logging(self, filename, level=logging.DEBUG):
+        """Log through the queue to ``filename``; a second call replaces the
+        first's listener thread and file instead of adding to them."""
+        self._stop_listener()
+        if self._file_handler is not None:
+            self._file_handler.close()
+        self._queue = queue.Queue(self.queue_size)
+        self._file_handler = logging.FileHandler(filename)
+        self._file_handler.setFormatter(JsonFormatter())
+        self._handler = DroppingQueueHandler(self._queue)
+        self._handler.addFilter(SampledDebugFilter(self.debug_sample_rate))
+        self._handler.addFilter(ContextFilter())
+        root = logging.getLogger()
+        root.setLevel(level)
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(self._handler)
+        self._start_listener()
+
+    def _after_fork(self):
+        self._pid = os.getpid()
+        if self._handler is not None:
+            self._start_listener()
+
+    def _start_listener(self):
+        self._listener = logging.handlers.QueueListener(self._queue, self._file_handler)
+        self._listener.start()
+
+    def _stop_listener(self):
+        if self._listener is not None:
+            self._listener.stop()  # flushes what is still queued
+            self._listener = None
+
+    def init_app(self, app):
+        # Register before the app's own hooks so their queries are counted too.
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    # The hooks keep everything on the RequestState rather than flask.g, as
+    # each g/request proxy lookup costs about as much as the bookkeeping.
+    def _before_request(self):
+        state = RequestState(f'{self._pid}-{next(self._ids)}', random.random() < self.debug_sample_rate)
+        state.token = _request.set(state)
+
+    def _after_request(self, response):
+        state = _request.get()
+        if state is not None:
+            state.status = response.status_code
+        return response
+
+    def _teardown_request(self, exc):
+        state = _request.get()
+        if state is None:
+            return
+        try:
+            _request.reset(state.token)
+        except ValueError:  # torn down from another context (e.g. a streamed response)
+            _request.set(None)
+        elapsed_ms = (time.perf_counter() - state.started) * 1000
+        req = request._get_current_object()
+        route = f"{req.method} {req.url_rule.rule if req.url_rule else '<unmatched>'}"
+        self.record(route, elapsed_ms, state.db_seconds, state.db_queries, exc is not None or state.status >= 500)
+
+    def record(self, route, elapsed_ms, db_seconds=0.0, db_queries=0, error=False):
+        """Add one request to the stats for ``route`` ('METHOD rule')."""
+        with self._lock:
+            stats = self._routes.get(route)
+            if stats is None:
+                stats = self._routes[route] = {'latency': Histogram(), 'db': Histogram(),
+                                               'errors': 0, 'db_queries': 0}
+            stats['latency'].observe(elapsed_ms)
+            stats['db'].observe(db_seconds * 1000)
+            stats['db_queries'] += db_queries
+            stats['errors'] += error
+
+    def metrics(self):
+        with self._lock:
+            routes = {
+                route: {
+                    'latency_ms': stats['latency'].snapshot(),
+                    'db_ms': stats['db'].snapshot(),
+                    'db_queries_per_request': round(stats['db_queries'] / max(1, sum(stats['latency'].counts)), 2),
+                    'errors': stats['errors'],
+                }
+                for route, stats in self._routes.items()
+            }
+        return {
+            'routes': routes,
+            'logging': {
+                'debug_sample_rate': self.debug_sample_rate,
+                'queued': self._queue.qsize() if self._handler else 0,
+                'dropped': DroppingQueueHandler.dropped,
+            },
+        }
+EOF
+
+# Create ASGI entry point module (SERVING_MODE=async)
+cat << 'EOF' > asgi.py
+"""ASGI entry point: I/O-bound routes on an event loop, the rest on threads.
+
+    uvicorn --workers 3 asgi:app
+
+GET /check_queues (a call to API Gateway) and GET /triage/<hospital> (one
+MySQL query) are served natively, through pooled async clients (aiohttp and
+aiomysql), so a slow upstream holds a coroutine instead of a thread and one
+worker can have thousands of them in flight. /check_queues is cached and
+coalesced like the Flask route, in an AsyncCoalescingCache, which is why
+GET /cache_metrics is served here too. Every other request goes to the
+Flask app (app.app) unchanged, through a2wsgi on WSGI_THREADS threads.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+
+import aiohttp
+import aiomysql
+from a2wsgi import WSGIMiddleware
+
+import app as hospital_app
+from cache import AsyncCoalescingCache
+
+# Threads for the Flask routes; like the gthread workers' --threads, an open
+# dashboard (/events) holds one.
+WSGI_THREADS = int(os.environ.get('WSGI_THREADS', 100))
+# Per worker: concurrent API Gateway calls and MySQL connections for the async routes
+ASYNC_HTTP_CONNECTIONS = int(os.environ.get('ASYNC_HTTP_CONNECTIONS', 100))
+ASYNC_DB_POOL_SIZE = int(os.environ.get('ASYNC_DB_POOL_SIZE', 10))
+
+
+class HospitalQueueASGI:
+    def __init__(self, flask_app):
+        self.wsgi = WSGIMiddleware(flask_app, workers=WSGI_THREADS)
+        self.routes = [
+            (re.compile(r'/check_queues'), 'GET /check_queues', self.check_queues),
+            (re.compile(r'/triage/(?P<hospital>[^/]+)'), 'GET /triage/<hospital>', self.triage),
+            (re.compile(r'/cache_metrics'), 'GET /cache_metrics', self.cache_metrics),
+        ]
+        self._http = None
+        self._db = None
+        self._db_lock = asyncio.Lock()
+        # Same policy as the Flask route's app.queue_status, one per worker
+        self.queue_status = AsyncCoalescingCache(self.load_queue_status, ttl=hospital_app.queue_status.ttl,
+                                                 stale_ttl=hospital_app.queue_status.stale_ttl)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] == 'http' and scope['method'] == 'GET':
+            for pattern, route, handler in self.routes:
+                match = pattern.fullmatch(scope['path'])
+                if match:
+                    return await self.serve(route, handler, scope, match.groupdict(), send)
+        await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self._http is not None:
+                    await self._http.close()
+                if self._db is not None:
+                    self._db.close()
+                    await self._db.wait_closed()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def serve(self, route, handler, scope, args, send):
+        """Run ``handler``, which returns (status, JSON-able body or bytes[, extra headers])."""
+        start = time.perf_counter()
+        stats = {'db_seconds': 0.0, 'db_queries': 0}
+        try:
+            status, body, *headers = await handler(stats, scope, **args)
+        except Exception as e:
+            logging.exception("%s failed", route)
+            status, body, headers = 500, {'error': str(e)}, []
+        payload = body if isinstance(body, bytes) else json.dumps(body, default=str).encode()
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'application/json'),
+                                (b'content-length', str(len(payload)).encode())] + (headers[0] if headers else [])})
+        await send({'type': 'http.response.body', 'body': payload})
+        hospital_app.instrumentation.record(route, (time.perf_counter() - start) * 1000,
+                                            stats['db_seconds'], stats['db_queries'], status >= 500)
+
+    def http(self):
+        # Created on first use, inside the worker's event loop
+        if self._http is None:
+            self._http = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=ASYNC_HTTP_CONNECTIONS),
+                                               timeout=aiohttp.ClientTimeout(total=10))
+        return self._http
+
+    async def db(self):
+        async with self._db_lock:
+            if self._db is None:
+                config = hospital_app.db_config
+                # autocommit: a pooled connection would otherwise keep reading
+                # the snapshot of its first transaction
+                self._db = await aiomysql.create_pool(
+                    host=config['host'], port=config['port'], user=config['user'],
+                    password=config['password'] or '', db=config['db'], charset=config['charset'],
+                    maxsize=ASYNC_DB_POOL_SIZE, autocommit=True, cursorclass=aiomysql.DictCursor)
+        return self._db
+
+    async def load_queue_status(self):
+        async with self.http().get(f"{hospital_app.API_ENDPOINT}/check_queues") as response:
+            response.raise_for_status()
+            return hospital_app.queue_status_response(await response.json(content_type=None))
+
+    async def check_queues(self, stats, scope):
+        try:
+            status = await self.queue_status.get()
+        except Exception as e:
+            error_message = f"Error checking queues: {e}"
+            logging.error(error_message)
+            return 500, {'error': error_message}
+        etag = f'"{status["etag"]}"'.encode()
+        headers = [(b'etag', etag), (b'cache-control', b'no-cache')]
+        if_none_match = next((value for name, value in scope['headers'] if name == b'if-none-match'), b'')
+        if etag in [tag.strip().removeprefix(b'W/') for tag in if_none_match.split(b',')]:
+            return 304, b'', headers
+        return 200, status['body'], headers
+
+    async def cache_metrics(self, stats, scope):
+        return 200, {'available_slots': hospital_app.free_slots.metrics(),
+                     'slot_generator': hospital_app.slot_generator.metrics(),
+                     'queue_status': self.queue_status.metrics()}
+
+    async def triage(self, stats, scope, hospital):
+        """Same response as the Flask route (app.triage_order on app.TRIAGE_QUERY)."""
+        pool = await self.db()
+        start = time.perf_counter()
+        async with pool.acquire() as connection:
+            async with connection.cursor() as cursor:
+                await cursor.execute(hospital_app.TRIAGE_QUERY, (hospital,))
+                rows = await cursor.fetchall()
+        stats['db_seconds'] += time.perf_counter() - start
+        stats['db_queries'] += 1
+        return 200, hospital_app.triage_order(rows)
+
+
+app = HospitalQueueASGI(hospital_app.app)
+EOF
+
+# Create time slot inventory module
+cat << 'EOF' > slot_inventory.py
+"""Time-slot inventory: slots generated ahead from capacity rules, and a
+per-worker bitmap of which of a day's slots still have room.
+
+    python slot_inventory.py [--days 30]
+"""
+import json
+import logging
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+
+class SlotRule:
+    """A slot every ``interval`` minutes from ``start`` to ``end`` ('HH:MM',
+    both included), each taking ``capacity`` bookings, on ``weekdays``
+    (0 is Monday)."""
+
+    __slots__ = ('start', 'end', 'interval', 'capacity', 'weekdays', 'times')
+
+    def __init__(self, start='18:00', end='22:00', interval=30, capacity=10, weekdays=range(7)):
+        self.start = start
+        self.end = end
+        self.interval = interval
+        self.capacity = capacity
+        self.weekdays = frozenset(weekdays)
+        first = datetime.strptime(start, '%H:%M')
+        last = datetime.strptime(end, '%H:%M')
+        self.times = []
+        while first <= last:
+            self.times.append(first.strftime('%H:%M:%S'))
+            first += timedelta(minutes=interval)
+
+
+def slot_rules(hospitals, rules_json='{}', capacity=10):
+    """Rules per hospital: SlotRule's defaults with ``capacity``, updated by
+    the "default" entry of ``rules_json`` and then by the hospital's own, e.g.
+    '{"default": {"capacity": 8}, "Hospital C": {"start": "09:00", "weekdays": [0, 1, 2, 3, 4]}}'.
+    Hospitals that only appear in ``rules_json`` get slots too."""
+    overrides = json.loads(rules_json or '{}')
+    default = dict({'capacity': capacity}, **overrides.pop('default', {}))
+    names = list(hospitals) + [name for name in overrides if name not in hospitals]
+    return {name: SlotRule(**dict(default, **overrides.get(name, {}))) for name in names}
+
+
+class SlotGenerator:
+    """Keeps time_slots filled ``days_ahead`` days ahead of today.
+
+    Capacity is not stored per row: bookings are checked against the
+    hospital's rule (see capacity()), so a changed rule applies to slots
+    already generated.
+
+    Rows go in with multi-row INSERT IGNOREs of ``batch_size`` rows, one
+    transaction each. time_slots is unique on (hospital, date, slot_time), so
+    a run only adds the slots that are missing and never touches existing
+    ones or their bookings: every Gunicorn worker can run the background job
+    (after a full pass it only adds the day that came into range).
+    """
+
+    def __init__(self, get_connection, rules, days_ahead=14, interval=3600, batch_size=1000):
+        self._get_connection = get_connection
+        self.rules = rules  # hospital -> SlotRule
+        self.days_ahead = days_ahead
+        self.interval = interval
+        self.batch_size = batch_size
+        self._reset_state()
+
+    def _reset_state(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._generated_through = None  # last day this process has generated
+        self._stats = {'runs': 0, 'inserted': 0, 'failed_runs': 0, 'last_run_seconds': 0.0}
+
+    def rows(self, start, days):
+        """(hospital, date, slot_time) for every slot from ``start``, ``days`` days on."""
+        for offset in range(days):
+            day = start + timedelta(days=offset)
+            weekday = day.weekday()
+            for hospital, rule in self.rules.items():
+                if weekday in rule.weekdays:
+                    for slot_time in rule.times:
+                        yield hospital, day, slot_time
+
+    def generate(self, start=None, days=None):
+        """Insert the missing slots of ``days`` days from ``start`` (default:
+        today and ``days_ahead``); returns how many were inserted."""
+        start = start or date.today()
+        days = self.days_ahead if days is None else days
+        began = time.perf_counter()
+        inserted = 0
+        batch = []
+        with self._get_connection() as connection:
+            with connection.cursor() as cursor:
+                for row in self.rows(start, days):
+                    batch.append(row)
+                    if len(batch) == self.batch_size:
+                        inserted += self._insert(connection, cursor, batch)
+                        batch = []
+                if batch:
+                    inserted += self._insert(connection, cursor, batch)
+        with self._lock:
+            self._stats['runs'] += 1
+            self._stats['inserted'] += inserted
+            self._stats['last_run_seconds'] = time.perf_counter() - began
+        return inserted
+
+    @staticmethod
+    def _insert(connection, cursor, batch):
+        # PyMySQL sends an executemany of INSERT ... VALUES as one multi-row statement
+        cursor.executemany(
+            "INSERT IGNORE INTO time_slots (hospital, date, slot_time) VALUES (%s, %s, %s)",
+            batch)
+        inserted = cursor.rowcount
+        connection.commit()
+        return inserted
+
+    def capacity(self, hospital, default):
+        rule = self.rules.get(hospital)
+        return rule.capacity if rule is not None else default
+
+    def ensure_started(self):
+        if self._pid != os.getpid():
+            self._reset_state()
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='slot-generator', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.extend()
+            except Exception as e:
+                with self._lock:
+                    self._stats['failed_runs'] += 1
+                logging.error(f"Time slot generation failed: {e}")
+            time.sleep(self.interval)
+
+    def extend(self):
+        """One pass of the background job: the whole horizon the first time in
+        this process, then only the days after what it already generated."""
+        today = date.today()
+        last = today + timedelta(days=self.days_ahead - 1)
+        start = today if self._generated_through is None else max(today, self._generated_through + timedelta(days=1))
+        inserted = self.generate(start, (last - start).days + 1) if start <= last else 0
+        self._generated_through = last
+        return inserted
+
+    def metrics(self):
+        with self._lock:
+            return dict(self._stats, days_ahead=self.days_ahead, hospitals=len(self.rules),
+                        generated_through=self._generated_through)
+
+
+class _DaySlots:
+    """One (hospital, day): its slots in time order, their remaining
+    capacity, and bit i of ``free`` set while slot i has any left."""
+
+    __slots__ = ('ids', 'times', 'index', 'remaining', 'free', 'loaded_at')
+
+    def __init__(self, rows):
+        self.ids = [row['id'] for row in rows]
+        self.times = [row['slot_time'] for row in rows]
+        self.index = {slot_id: i for i, slot_id in enumerate(self.ids)}
+        self.remaining = [max(int(row['remaining']), 0) for row in rows]
+        self.free = 0
+        for i, remaining in enumerate(self.remaining):
+            if remaining:
+                self.free |= 1 << i
+        self.loaded_at = time.monotonic()
+
+
+class FreeSlots:
+    """Which slots of a (hospital, day) can still be booked, answered from memory.
+
+    ``loader(hospital, day)`` returns the day's slots in time order as rows
+    with id, slot_time and remaining (capacity left). An entry is loaded once
+    per ``ttl`` seconds and kept current between loads by this worker's own
+    bookings (book, mark_full); bookings made by other workers show up at the
+    next load. The booking UPDATE stays the authority: the bitmap only lets
+    /submit turn away a slot it already knows is full without a transaction.
+    ``ttl=0`` loads on every call. Any hospital name can come in through a
+    URL, so only those in ``hospitals`` (if given) are cached, and at most
+    ``max_days`` entries are kept.
+    """
+
+    def __init__(self, loader, ttl, max_days=1024, hospitals=None):
+        self._loader = loader
+        self.ttl = ttl
+        self.max_days = max_days
+        self.hospitals = hospitals
+        self._lock = threading.Lock()
+        self._days = {}  # (hospital, day) -> _DaySlots
+        self._stats = {'hits': 0, 'loads': 0, 'bookings': 0, 'rejected': 0}
+
+    def _get(self, hospital, day):
+        key = (hospital, day)
+        with self._lock:
+            slots = self._days.get(key)
+            if slots is not None and time.monotonic() - slots.loaded_at < self.ttl:
+                self._stats['hits'] += 1
+                return slots
+            self._stats['loads'] += 1
+        slots = _DaySlots(self._loader(hospital, day))
+        with self._lock:
+            if self.ttl > 0 and (self.hospitals is None or hospital in self.hospitals):
+                # Past days are never asked for again
+                for old in [k for k in self._days if k[1] < day]:
+                    del self._days[old]
+                if len(self._days) >= self.max_days and key not in self._days:
+                    del self._days[min(self._days, key=lambda k: self._days[k].loaded_at)]
+                self._days[key] = slots
+        return slots
+
+    def available(self, hospital, day):
+        """The bookable slots, as [{'id', 'slot_time'}] in time order."""
+        slots = self._get(hospital, day)
+        free = slots.free
+        return [{'id': slots.ids[i], 'slot_time': slots.times[i]}
+                for i in range(len(slots.ids)) if free >> i & 1]
+
+    def has_capacity(self, hospital, day, slot_id):
+        """False if the slot is known to be full, True if it has room, None if
+        it is not one of the day's slots (let the database decide)."""
+        slots = self._get(hospital, day)
+        i = slots.index.get(slot_id)
+        if i is None:
+            return None
+        if not slots.free >> i & 1:
+            with self._lock:
+                self._stats['rejected'] += 1
+            return False
+        return True
+
+    def book(self, hospital, day, slot_id):
+        """Count a booking this worker made."""
+        with self._lock:
+            self._stats['bookings'] += 1
+            slots = self._days.get((hospital, day))
+            i = slots.index.get(slot_id) if slots is not None else None
+            if i is not None and slots.remaining[i] > 0:
+                slots.remaining[i] -= 1
+                if not slots.remaining[i]:
+                    slots.free &= ~(1 << i)
+
+    def mark_full(self, hospital, day, slot_id):
+        """Record that the database turned a booking away."""
+        with self._lock:
+            slots = self._days.get((hospital, day))
+            i = slots.index.get(slot_id) if slots is not None else None
+            if i is not None:
+                slots.remaining[i] = 0
+                slots.free &= ~(1 << i)
+
+    def metrics(self):
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['loads']
+            return dict(self._stats, ttl=self.ttl, days_cached=len(self._days),
+                        hit_rate=self._stats['hits'] / lookups if lookups else 0.0)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from app import slot_generator
+    parser = argparse.ArgumentParser(description="Generate the time slots of the coming days.")
+    parser.add_argument('--days', type=int, default=None,
+                        help=f"days ahead, from today (default SLOT_DAYS_AHEAD, {slot_generator.days_ahead})")
+    args = parser.parse_args()
+    inserted = slot_generator.generate(days=args.days)
+    print(f"Inserted {inserted} time slots for {len(slot_generator.rules)} hospitals")
+EOF
+
 # Create database and user
 sudo mysql -e "CREATE DATABASE IF NOT EXISTS hospital_queue;"
 sudo mysql -e "CREATE USER IF NOT EXISTS 'hospital_user'@'localhost' IDENTIFIED BY '${DB_PASSWORD}';"
@@ -347,11 +2733,12 @@ CREATE TABLE IF NOT EXISTS patients (
     estimated_waiting_time INT  -- in minutes
 );
 
--- Create daily_counter table if not exists
-CREATE TABLE IF NOT EXISTS daily_counter (
-    id INT PRIMARY KEY,
-    value INT,
-    date DATE
+-- Create queue_counters table if not exists (one row per hospital per day)
+CREATE TABLE IF NOT EXISTS queue_counters (
+    hospital VARCHAR(100) NOT NULL,
+    date DATE NOT NULL,
+    value INT NOT NULL,
+    PRIMARY KEY (hospital, date)
 );
 
 -- Create time_slots table if not exists
@@ -363,20 +2750,7 @@ CREATE TABLE IF NOT EXISTS time_slots (
     booked INT DEFAULT 0
 );
 
--- Initialize time slots (you may want to adjust this based on your needs)
-INSERT IGNORE INTO time_slots (slot_time, date, hospital)
-SELECT time_slot, CURDATE() + INTERVAL day DAY, hospital
-FROM (
-    SELECT 0 AS day UNION SELECT 1 UNION SELECT 2 UNION SELECT 3 UNION SELECT 4 UNION SELECT 5 UNION SELECT 6
-) AS days
-CROSS JOIN (
-    SELECT '18:00' AS time_slot UNION SELECT '18:30' UNION SELECT '19:00' UNION
-    SELECT '19:30' UNION SELECT '20:00' UNION SELECT '20:30' UNION
-    SELECT '21:00' UNION SELECT '21:30' UNION SELECT '22:00'
-) AS times
-CROSS JOIN (
-    SELECT 'Hospital A' AS hospital UNION SELECT 'Hospital B' UNION SELECT 'Hospital C'
-) AS hospitals;
+-- Time slots are generated by slot_inventory.py once the migrations have run
 EOF
 
 if [ $? -ne 0 ]; then
@@ -420,18 +2794,18 @@ cat << EOF > templates/index.html
             {% for hospital in hospitals %}
                 <div class="hospital-item">
                     <img src="{{ hospital.image }}" alt="{{ hospital.name }}" class="hospital-image">
-                    <h3><a href="{{ url_for('form', hospital=hospital.name) }}">{{ hospital.name }}</a></h3>
+                    <h3><a href="{{ url_for('.form', hospital=hospital.name) }}">{{ hospital.name }}</a></h3>
                 </div>
             {% endfor %}
         </div>
-        <p><a href="{{ url_for('patients') }}">View All Patients</a></p>
+        <p><a href="{{ url_for('.patients') }}">View All Patients</a></p>
     </div>
     <script src="{{ url_for('static', filename='js/script.js') }}"></script>
 </body>
 </html>
 EOF
 
-cat << EOF > templates/form.html
+cat << EOF > templates/form_header.html
 <!DOCTYPE html>
 <html>
 <head>
@@ -442,7 +2816,7 @@ cat << EOF > templates/form.html
 <body>
     <div class="container">
         <h1>Patient Information for {{ hospital }}</h1>
-        <form action="{{ url_for('submit') }}" method="post">
+        <form action="{{ url_for('.submit') }}" method="post">
             <input type="hidden" name="hospital" value="{{ hospital }}">
             <label for="name">Name:</label>
             <input type="text" id="name" name="name" required><br><br>
@@ -472,6 +2846,10 @@ cat << EOF > templates/form.html
                 <option value="follow-up">Follow-up</option>
                 <option value="emergency">Emergency</option>
             </select><br><br>
+EOF
+
+cat << EOF > templates/form.html
+{{ header }}
             <label for="time_slot">Preferred Time Slot:</label>
             <select id="time_slot" name="time_slot" required>
                 {% for slot in available_slots %}
@@ -500,13 +2878,13 @@ cat << EOF > templates/queue_info.html
         <p>You are currently number {{ queue_number }} in the queue.</p>
         <p>Your estimated waiting time is approximately {{ estimated_time }} minutes.</p>
         <p>Please wait for your number to be called.</p>
-        <a href="{{ url_for('index') }}">Back to Home</a>
+        <a href="{{ url_for('.index') }}">Back to Home</a>
     </div>
 </body>
 </html>
 EOF
 
-cat << EOF > templates/patients.html
+cat << 'EOF' > templates/patients.html
 <!DOCTYPE html>
 <html>
 <head>
@@ -518,7 +2896,19 @@ cat << EOF > templates/patients.html
 <body>
     <div class="container">
         <h1>Patient List</h1>
-        <table>
+        <form method="get" action="{{ url_for('.patients') }}">
+            <input type="text" name="hospital" placeholder="Hospital" value="{{ filters.hospital or '' }}">
+            <input type="date" name="date" value="{{ filters.date or '' }}">
+            <select name="status">
+                <option value="">Any status</option>
+                {% for status in ['in_queue', 'checked_in', 'in_progress', 'checked_out'] %}
+                <option value="{{ status }}" {% if filters.status == status %}selected{% endif %}>{{ status }}</option>
+                {% endfor %}
+            </select>
+            <input type="submit" value="Filter">
+            <a href="{{ url_for('.patients_json', **filters) }}">Download JSON</a>
+        </form>
+        <table id="patients-table">
             <tr>
                 <th>Queue Number</th>
                 <th>Name</th>
@@ -532,12 +2922,12 @@ cat << EOF > templates/patients.html
                 <th>Actions</th>
             </tr>
             {% for patient in patients %}
-            <tr>
-                <td>{{ patient.queue_number }}</td>
+            <tr data-patient-id="{{ patient.id }}" data-hospital="{{ patient.hospital }}" data-queue-date="{{ patient.queue_date }}">
+                <td class="queue-position">{{ patient.queue_position or '-' }}</td>
                 <td>{{ patient.name }}</td>
                 <td>{{ patient.last_name }}</td>
                 <td>{{ patient.hospital }}</td>
-                <td>{{ patient.status }}</td>
+                <td class="status">{{ patient.status }}</td>
                 <td>{{ patient.appointment_type }}</td>
                 <td>{{ patient.payment_method }}</td>
                 <td>
@@ -547,7 +2937,7 @@ cat << EOF > templates/patients.html
                         <option value="not_required" {% if patient.payment_status == 'not_required' %}selected{% endif %}>Not Required</option>
                     </select>
                 </td>
-                <td>{{ patient.estimated_waiting_time }} minutes</td>
+                <td class="waiting-time">{{ patient.estimated_waiting_time }} minutes</td>
                 <td>
                     <select class="status-select" data-patient-id="{{ patient.id }}">
                         <option value="in_queue" {% if patient.status == 'in_queue' %}selected{% endif %}>In Queue</option>
@@ -559,11 +2949,77 @@ cat << EOF > templates/patients.html
             </tr>
             {% endfor %}
         </table>
-        <a href="{{ url_for('index') }}">Back to Home</a>
+        {% if next_cursor %}
+        <p><a href="{{ url_for('.patients', after=next_cursor, **filters) }}">Next page</a></p>
+        {% endif %}
+        <a href="{{ url_for('.index') }}">Back to Home</a>
     </div>
     <script>
+        var filters = {{ filters|tojson }};
+        var hasNextPage = {{ 'true' if next_cursor else 'false' }};
+        var STATUS_OPTIONS = {in_queue: 'In Queue', checked_in: 'Checked In', in_progress: 'In Progress', checked_out: 'Checked Out'};
+        var PAYMENT_OPTIONS = {pending: 'Pending', completed: 'Completed', not_required: 'Not Required'};
+
+        function buildSelect(className, patientId, options, value) {
+            var $select = $('<select>').addClass(className).attr('data-patient-id', patientId);
+            $.each(options, function(optionValue, label) {
+                $select.append($('<option>').val(optionValue).text(label));
+            });
+            return $select.val(value);
+        }
+
+        function buildRow(patient, queueDate) {
+            var $row = $('<tr>').attr({'data-patient-id': patient.id, 'data-hospital': patient.hospital,
+                                       'data-queue-date': queueDate});
+            [['queue-position', '-'], ['', patient.name], ['', patient.last_name], ['', patient.hospital],
+             ['status', patient.status], ['', patient.appointment_type], ['', patient.payment_method]
+            ].forEach(function(cell) {
+                $row.append($('<td>').addClass(cell[0]).text(cell[1]));
+            });
+            $row.append($('<td>').append(buildSelect('payment-status-select', patient.id, PAYMENT_OPTIONS, patient.payment_status)));
+            $row.append($('<td>').addClass('waiting-time').text('0 minutes'));
+            $row.append($('<td>').append(buildSelect('status-select', patient.id, STATUS_OPTIONS, patient.status)));
+            return $row;
+        }
+
+        // New patients are appended only on the last page of a matching list.
+        function showsNewPatient(patient, queueDate) {
+            return !hasNextPage
+                && (!filters.hospital || filters.hospital === patient.hospital)
+                && (!filters.status || filters.status === patient.status)
+                && (!filters.date || filters.date === queueDate);
+        }
+
+        function applyQueueEvent(event) {
+            var patient = event.patient;
+            var $row = $('#patients-table tr').filter(function() {
+                return $(this).attr('data-patient-id') === String(patient.id);
+            });
+            if (event.type === 'patient_added' && !$row.length && showsNewPatient(patient, event.queue_date)) {
+                $row = buildRow(patient, event.queue_date).appendTo('#patients-table');
+            }
+            if (patient.status) {
+                $row.find('.status').text(patient.status);
+                $row.find('.status-select').val(patient.status);
+            }
+            if (patient.payment_status) {
+                $row.find('.payment-status-select').val(patient.payment_status);
+            }
+            if (event.positions) {
+                // Positions cover everyone still waiting that day; anyone missing has left the queue.
+                $('#patients-table tr').filter(function() {
+                    return $(this).attr('data-hospital') === event.hospital
+                        && $(this).attr('data-queue-date') === event.queue_date;
+                }).each(function() {
+                    var position = event.positions[$(this).attr('data-patient-id')];
+                    $(this).find('.queue-position').text(position ? position.queue_position : '-');
+                    $(this).find('.waiting-time').text((position ? position.estimated_waiting_time : 0) + ' minutes');
+                });
+            }
+        }
+
         $(document).ready(function() {
-            $('.status-select, .payment-status-select').change(function() {
+            $(document).on('change', '.status-select, .payment-status-select', function() {
                 var $this = $(this);
                 var patientId = $this.data('patient-id');
                 var url = $this.hasClass('status-select') ? '/update_status/' : '/update_payment_status/';
@@ -574,14 +3030,20 @@ cat << EOF > templates/patients.html
                 $.post(url + patientId, postData, function(response) {
                     if (response.success) {
                         alert(dataKey.charAt(0).toUpperCase() + dataKey.slice(1) + ' updated successfully');
-                        if (dataKey === 'status' && postData.status === 'checked_out') {
-                            location.reload(); // Reload the page to update queue numbers and estimated waiting times
-                        }
                     } else {
                         alert('Error updating ' + dataKey + ': ' + response.error);
                     }
                 });
             });
+
+            // Live updates from the server instead of reloading the page
+            var source = new EventSource('/events' + (filters.hospital ? '?hospital=' + encodeURIComponent(filters.hospital) : ''));
+            source.addEventListener('queue', function(e) {
+                applyQueueEvent(JSON.parse(e.data));
+            });
+            source.addEventListener('resync', function() {
+                location.reload();
+            });
         });
     </script>
     <script src="{{ url_for('static', filename='js/script.js') }}"></script>
@@ -679,7 +3141,13 @@ fi
 
 
 
-# Create systemd service for Gunicorn
+# Create systemd service for Gunicorn (or Uvicorn, with SERVING_MODE=async)
+if [ "${SERVING_MODE}" = "async" ]; then
+    EXEC_START="/home/ubuntu/hospital_queue/venv/bin/uvicorn --workers 3 --host 127.0.0.1 --port 8000 asgi:app"
+else
+    # gthread workers: each open dashboard (/events) holds a thread, not a whole worker
+    EXEC_START="/home/ubuntu/hospital_queue/venv/bin/gunicorn --workers 3 --worker-class gthread --threads 100 --bind 127.0.0.1:8000 app:app"
+fi
 sudo tee /etc/systemd/system/hospital_queue.service << EOF
 [Unit]
 Description=Gunicorn instance to serve hospital queue application
@@ -692,7 +3160,8 @@ WorkingDirectory=/home/ubuntu/hospital_queue
 Environment="PATH=/home/ubuntu/hospital_queue/venv/bin"
 Environment="DB_PASSWORD=${DB_PASSWORD}"
 Environment="API_ENDPOINT=${API_ENDPOINT}"
-ExecStart=/home/ubuntu/hospital_queue/venv/bin/gunicorn --workers 3 --bind 127.0.0.1:8000 app:app
+Environment="SECRET_KEY=${SECRET_KEY}"
+ExecStart=${EXEC_START}
 
 [Install]
 WantedBy=multi-user.target
@@ -732,11 +3201,12 @@ CREATE TABLE IF NOT EXISTS patients (
     estimated_waiting_time INT  -- in minutes
 );
 
--- Create daily_counter table if not exists
-CREATE TABLE IF NOT EXISTS daily_counter (
-    id INT PRIMARY KEY,
-    value INT,
-    date DATE
+-- Create queue_counters table if not exists (one row per hospital per day)
+CREATE TABLE IF NOT EXISTS queue_counters (
+    hospital VARCHAR(100) NOT NULL,
+    date DATE NOT NULL,
+    value INT NOT NULL,
+    PRIMARY KEY (hospital, date)
 );
 
 -- Create time_slots table if not exists
@@ -748,22 +3218,6 @@ CREATE TABLE IF NOT EXISTS time_slots (
     booked INT DEFAULT 0
 );
 
--- Initialize time slots
-INSERT IGNORE INTO time_slots (slot_time, date, hospital)
-SELECT time_slot, date, hospital
-FROM (
-    SELECT '18:00' AS time_slot UNION SELECT '18:30' UNION SELECT '19:00' UNION
-    SELECT '19:30' UNION SELECT '20:00' UNION SELECT '20:30' UNION
-    SELECT '21:00' UNION SELECT '21:30' UNION SELECT '22:00'
-) AS times
-CROSS JOIN (
-    SELECT 'Hospital A' AS hospital UNION SELECT 'Hospital B' UNION SELECT 'Hospital C'
-) AS hospitals
-CROSS JOIN (
-    SELECT CURDATE() + INTERVAL a DAY AS date
-    FROM (SELECT 0 a UNION SELECT 1 UNION SELECT 2 UNION SELECT 3 UNION SELECT 4 UNION SELECT 5 UNION SELECT 6) AS days
-) AS dates;
-
 EOF
 
 # Check for errors in the execution of the MySQL commands
@@ -772,6 +3226,19 @@ if [ $? -ne 0 ]; then
     echo "Continuing with the script execution..."
 fi
 
+# Apply versioned schema migrations (indexes)
+python migrations.py
+if [ $? -ne 0 ]; then
+    echo "Error occurred during schema migrations. The app needs them. Exiting."
+    exit 1
+fi
+
+# Generate the coming days' time slots (each worker keeps them rolling after this)
+python slot_inventory.py
+if [ $? -ne 0 ]; then
+    echo "Warning: Time slot generation failed. Check the output above."
+fi
+
 # Create directory for hospital images
 mkdir -p /home/ubuntu/hospital_queue/static/images/hospitals
 chmod 755 /home/ubuntu/hospital_queue/static/images/hospitals
@@ -1,14 +1,25 @@
 from flask import Flask, render_template, request, jsonify, redirect, url_for, flash
-import requests
 import os
 import pymysql
 import json
+from db_pool import ConnectionPool
+from outbox import Outbox
 
 app = Flask(__name__)
 app.secret_key = os.urandom(24)  # Required for flashing messages
 
 # ... (keep the existing imports and configuration)
 
+# Reuse connections instead of opening a new one per request
+db_pool = ConnectionPool(lambda: pymysql.connect(**db_config),
+                         max_size=int(os.environ.get('DB_POOL_SIZE', 5)))
+
+def get_db_connection():
+    return db_pool.connection()
+
+# API Gateway calls are queued in the same transaction and sent in the background
+outbox = Outbox(get_db_connection, API_ENDPOINT)
+
 @app.route('/submit', methods=['POST'])
 def submit():
     data = request.form.to_dict()
@@ -22,11 +33,10 @@ def submit():
                          VALUES (%s, %s, %s, %s, %s)"""
                 cursor.execute(sql, (data['name'], data['lastName'], data['dob'], 
                                      data['hospital'], data['symptoms']))
+                # Queue the API call to the Lambda function via API Gateway
+                outbox.add(cursor, '/submit', data)
             connection.commit()
-        
-        # Make API call to Lambda function via API Gateway
-        response = requests.post(f"{API_ENDPOINT}/submit", json=data)
-        result = response.json()
+        outbox.wake()
         
         # If everything is successful, redirect to patients page
         flash('Patient information submitted successfully!', 'success')
@@ -37,11 +47,6 @@ def submit():
         error_message = f"Database error: {e}"
         app.logger.error(error_message)
         flash(error_message, 'error')
-    except requests.RequestException as e:
-        # API call error
-        error_message = f"API error: {e}"
-        app.logger.error(error_message)
-        flash(error_message, 'error')
     except Exception as e:
         # Any other error
         error_message = f"An unexpected error occurred: {e}"
@@ -0,0 +1,122 @@
+"""Local stand-in for the API Gateway in front of the Lambdas (API_ENDPOINT).
+
+POST /submit stores one registration per Idempotency-Key, like the
+registration Lambda, or a {"registrations": [...]} batch, one per requestId,
+answered with a result for each; GET /check_queues returns the per-hospital counts of
+what was stored. A share of the POSTs can be made to fail (half rejected,
+half stored and then answered with an error, i.e. a lost response) and every
+call can be delayed, to stand in for a slow or flaky gateway. Used by
+bench_outbox.py, bench_check_queues.py and loadtest.py, or on its own:
+
+    python api_stub.py --port 8001 --delay 20
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StandIn(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # listen backlog; the default 5 stalls bursts of connections
+
+    def __init__(self, failure_rate=0.0, delay=0.0, port=0):
+        super().__init__(('127.0.0.1', port), StandInHandler)
+        self.failure_rate = failure_rate
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.accepted = {}  # Idempotency-Key -> time first stored
+        self.queue_lengths = Counter()  # hospital -> registrations stored
+        self.calls = 0
+        self.queue_checks = 0  # GET /check_queues calls
+        self.duplicates = 0
+        self.mismatched = 0
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def start(self):
+        """Serve from a daemon thread; returns self."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        time.sleep(server.delay)
+        roll = random.random()
+        if 'registrations' in body:
+            registrations = body['registrations']
+        else:
+            registrations = [body]
+            if self.headers.get('Idempotency-Key') != body.get('requestId'):
+                with server.lock:
+                    server.mismatched += 1
+        results = []
+        with server.lock:
+            server.calls += 1
+            if roll >= server.failure_rate / 2:
+                for registration in registrations:
+                    results.append({'userId': registration.get('requestId'),
+                                    'status': self.store(server, registration)})
+        # The first half of failures are rejected, the second half stored
+        # and then answered with an error.
+        if roll < server.failure_rate:
+            return self.respond(503, {})
+        self.respond(200, {'statusCode': 200, 'body': {'results': results}} if 'registrations' in body else {})
+
+    @staticmethod
+    def store(server, registration):
+        """Store one registration unless a previous delivery did; call with server.lock held."""
+        key = registration.get('requestId')
+        if key in server.accepted:
+            server.duplicates += 1
+            return 'duplicate'
+        server.accepted[key] = time.monotonic()
+        server.queue_lengths[registration.get('hospital')] += 1
+        return 'stored'
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/check_queues':
+            return self.respond(404, {'message': 'Not Found'})
+        time.sleep(self.server.delay)
+        with self.server.lock:
+            self.server.queue_checks += 1
+            queue_lengths = dict(self.server.queue_lengths)
+        self.respond(200, {'queueLengths': queue_lengths})
+
+    def respond(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--delay', type=float, default=0, help='latency per call, in ms')
+    args = parser.parse_args()
+
+    server = StandIn(args.failure_rate, args.delay / 1000, args.port)
+    print(f"API_ENDPOINT={server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
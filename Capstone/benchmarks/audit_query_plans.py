@@ -0,0 +1,149 @@
+"""Query plan audit: fail if any query the app issues does a full scan.
+
+1. Drives every route through the Flask test client and records the SQL the
+   app actually sends (via a recording cursor class).
+2. Seeds a realistic volume of synthetic history for audit-only hospitals
+   (1M patients over a year by default) and runs ANALYZE TABLE.
+3. Runs EXPLAIN on each recorded statement and exits non-zero if a table is
+   read with a full table scan (type ALL), or with a full index scan (type
+   index) that is not cut short by a LIMIT.
+
+Copy next to app.py and run with the app's virtualenv against the local MySQL
+database (apply migrations.py first). The seeded rows are deleted afterwards
+unless --keep is given.
+
+    python audit_query_plans.py --patients 1000000
+"""
+import argparse
+import os
+import sys
+from contextlib import contextmanager
+
+sys.path.insert(0, os.getcwd())
+
+import pymysql
+
+import app as hospital_app
+from seed_data import delete_hospitals, execute, seed_history
+
+AUDIT_PREFIX = 'Audit Hospital'
+# A type=index plan estimating more rows than this reads (most of) an index
+# end to end; keyset pages with a LIMIT stay far below it.
+MAX_INDEX_SCAN_ROWS = 1000
+
+# Statements that are unbounded by design; listed here so the audit stays
+# green for everything else. Keep this empty whenever possible.
+KNOWN_FULL_SCANS = set()
+
+recorded = []
+
+
+@contextmanager
+def recording_queries():
+    """Record every statement sent through any pymysql cursor class."""
+    original = pymysql.cursors.Cursor.execute
+
+    def execute(cursor, query, args=None):
+        recorded.append(cursor.mogrify(query, args))
+        return original(cursor, query, args)
+
+    pymysql.cursors.Cursor.execute = execute
+    try:
+        yield
+    finally:
+        pymysql.cursors.Cursor.execute = original
+
+
+def is_full_scan(row):
+    if row['type'] == 'ALL':
+        return True
+    return row['type'] == 'index' and (row['rows'] or 0) > MAX_INDEX_SCAN_ROWS
+
+
+def record_app_queries():
+    """Exercise every route once so each query the app issues is recorded."""
+    get_connection = hospital_app.get_db_connection
+    hospital = f'{AUDIT_PREFIX} Live'
+    slot_id = execute(get_connection,
+                      "INSERT INTO time_slots (slot_time, date, hospital) VALUES ('18:00', CURDATE(), %s)",
+                      (hospital,))
+    client = hospital_app.app.test_client()
+    with recording_queries():
+        client.get('/')
+        client.get(f'/form/{hospital}')
+        client.post('/submit', data={
+            'hospital': hospital, 'name': 'Audit', 'lastName': 'Patient', 'dob': '1990-01-01',
+            'symptoms': 'cough', 'emergency_contact_name': 'Contact',
+            'emergency_contact_phone': '5145550100', 'payment_method': 'cash',
+            'appointment_type': 'consultation', 'time_slot': str(slot_id),
+        })
+        client.get('/queue_info')
+        client.get(f'/triage/{hospital}')
+        client.get('/patients')
+        client.get('/patients?after=1-1')
+        client.get(f'/patients?hospital={hospital}&after=1-1')
+        client.get(f'/patients?hospital={hospital}&date=2024-01-01&status=in_queue')
+        client.get(f'/patients.json?hospital={hospital}').get_data()
+    with get_connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT MAX(id) AS id FROM patients WHERE hospital = %s", (hospital,))
+            patient_id = cursor.fetchone()['id']
+    with recording_queries():
+        for status in ('checked_in', 'in_progress', 'checked_out'):
+            client.post(f'/update_status/{patient_id}', data={'status': status})
+        client.post(f'/update_payment_status/{patient_id}', data={'payment_status': 'completed'})
+        client.get('/test_db')
+
+    statements = []
+    for sql in recorded:
+        normalized = ' '.join(sql.split())
+        if normalized not in statements:
+            statements.append(normalized)
+    return statements
+
+
+def explain(statements):
+    failures = []
+    with hospital_app.get_db_connection() as connection:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                if not sql.upper().startswith(('SELECT', 'UPDATE', 'DELETE')) or sql == 'SELECT 1':
+                    continue
+                cursor.execute(f"EXPLAIN {sql}")
+                plan = cursor.fetchall()
+                scans = [row for row in plan if is_full_scan(row)]
+                known = any(sql.startswith(prefix) for prefix in KNOWN_FULL_SCANS)
+                verdict = 'FULL SCAN' if scans and not known else 'known full scan' if scans else 'ok'
+                print(f"\n[{verdict}] {sql[:160]}")
+                for row in plan:
+                    print(f"    table={row['table']} type={row['type']} key={row['key']} "
+                          f"rows={row['rows']} extra={row['Extra']}")
+                if scans and not known:
+                    failures.append(sql)
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--patients', type=int, default=1_000_000)
+    parser.add_argument('--hospitals', type=int, default=20)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--keep', action='store_true', help='keep the seeded rows')
+    args = parser.parse_args()
+
+    get_connection = hospital_app.get_db_connection
+    delete_hospitals(get_connection, AUDIT_PREFIX)
+    try:
+        statements = record_app_queries()
+        seed_history(get_connection, AUDIT_PREFIX, args.patients, args.hospitals, args.days)
+        failures = explain(statements)
+    finally:
+        if not args.keep:
+            delete_hospitals(get_connection, AUDIT_PREFIX)
+
+    print(f"\n{len(statements)} statements audited, {len(failures)} full scans")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""Concurrent slow requests one worker can hold: sync vs. gthread vs. async.
+
+Starts the app written by build_app.py with a single worker in each serving
+mode, with api_stub.py (in its own process) answering API Gateway calls
+after --delay ms, and sends bursts of N simultaneous GET /check_queues (the
+proxy to API Gateway) for each N in --concurrency. The same bursts are first
+sent to the stub directly; a mode holds N concurrently when its slowest
+request is less than one extra stub delay behind that, i.e. no request had
+to wait for a free worker or thread. Escalation stops at a mode's first
+burst that is not held. Also reports each worker's peak memory. No MySQL
+needed:
+
+    python build_app.py --out build/hospital_queue
+    python bench_asgi.py --app-dir build/hospital_queue --delay 500 --concurrency 10 100 500 1000
+
+  sync     gunicorn, one sync worker (one request at a time)
+  gthread  gunicorn, one gthread worker with --threads threads (bootstrap default)
+  async    uvicorn asgi:app, one worker (the bootstrap's SERVING_MODE=async),
+           with ASYNC_HTTP_CONNECTIONS raised to the largest burst
+"""
+import argparse
+import asyncio
+import statistics
+import subprocess
+import sys
+import time
+
+from loadtest import free_port, server_command, start_app
+
+
+def modes(threads, max_burst):
+    gthread, _ = server_command('sync', 1, threads)
+    asgi, env = server_command('async', 1, threads)
+    return {
+        'sync': (['gunicorn', '--workers', '1', '--bind', '127.0.0.1:{port}', 'app:app'], {}),
+        'gthread': (gthread, {}),
+        'async': (asgi, dict(env, ASYNC_HTTP_CONNECTIONS=str(max_burst))),
+    }
+
+
+async def get(port, path):
+    """One HTTP/1.1 GET on a new connection; returns its latency, or None if it failed."""
+    start = time.perf_counter()
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n'.encode())
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), timeout=120)
+        writer.close()
+    except (OSError, asyncio.TimeoutError):
+        return None
+    # A plain asyncio client: an HTTP library's own overhead would dominate a 1000-request burst
+    return time.perf_counter() - start if response.split(b' ', 2)[1:2] == [b'200'] else None
+
+
+def burst(port, n):
+    """Send n GET /check_queues at once; returns the latencies of those that succeeded."""
+    async def run():
+        return await asyncio.gather(*(get(port, '/check_queues') for _ in range(n)))
+    return [x for x in asyncio.run(run()) if x is not None]
+
+
+def worker_peak_rss(pid):
+    """Peak resident memory (MB) of the server's worker processes, if /proc has it."""
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            children = [int(child) for child in f.read().split()]
+        total = 0
+        for child in children:
+            with open(f'/proc/{child}/status') as f:
+                total += next(int(line.split()[1]) for line in f if line.startswith('VmHWM:'))
+        return total / 1024 if children else None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--app-dir', required=True, help='directory written by build_app.py')
+    parser.add_argument('--delay', type=float, default=500, help='API Gateway latency, in ms')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 50, 100, 200, 500, 1000])
+    parser.add_argument('--threads', type=int, default=100, help='threads per gthread worker')
+    parser.add_argument('--modes', nargs='+', choices=['sync', 'gthread', 'async'],
+                        default=['sync', 'gthread', 'async'])
+    args = parser.parse_args()
+
+    delay = args.delay / 1000
+    stub_port = free_port()
+    stub = subprocess.Popen([sys.executable, 'api_stub.py', '--port', str(stub_port), '--delay', str(args.delay)],
+                            stdout=subprocess.DEVNULL)
+    time.sleep(1)
+    held = {}
+    try:
+        baseline = {}
+        for n in sorted(args.concurrency):
+            latencies = burst(stub_port, n)
+            assert len(latencies) == n, "the stub itself failed requests"
+            baseline[n] = max(latencies)
+            print(f"{'stub':8} N={n:5}  p50 {statistics.median(latencies) * 1000:8.0f} ms  "
+                  f"max {baseline[n] * 1000:8.0f} ms")
+
+        for mode in args.modes:
+            command, env = modes(args.threads, max(args.concurrency))[mode]
+            process, url = start_app(args.app_dir, command, f'http://127.0.0.1:{stub_port}', env)
+            port = int(url.rsplit(':', 1)[1])
+            held[mode] = 0
+            try:
+                for n in sorted(args.concurrency):
+                    start = time.perf_counter()
+                    latencies = burst(port, n)
+                    wall = time.perf_counter() - start
+                    slowest = max(latencies, default=float('inf'))
+                    is_held = len(latencies) == n and slowest < baseline[n] + delay
+                    p50 = f"{statistics.median(latencies) * 1000:8.0f}" if latencies else '     n/a'
+                    print(f"{mode:8} N={n:5}  p50 {p50} ms  max {slowest * 1000:8.0f} ms  "
+                          f"{len(latencies) / wall:7.1f} req/s  {n - len(latencies)} failed  "
+                          f"{'held' if is_held else 'queued'}")
+                    if not is_held:
+                        break
+                    held[mode] = n
+                rss = worker_peak_rss(process.pid)
+                if rss is not None:
+                    print(f"{mode:8} worker peak memory {rss:.0f} MB")
+            finally:
+                process.terminate()
+                process.wait()
+    finally:
+        stub.terminate()
+
+    print(f"Concurrent {args.delay:g} ms upstream calls held by one worker (of {sorted(args.concurrency)}):")
+    for mode, n in held.items():
+        print(f"  {mode:8} {n}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""API Gateway calls and latency of GET /check_queues as dashboard viewers grow.
+
+Every open dashboard polls GET /check_queues, which used to call API Gateway
+(and the Lambda behind it) once per poll. Runs N viewers, each polling every
+--interval seconds with If-None-Match, against the app written by
+build_app.py, in-process, with api_stub.py standing in for API Gateway after
+--delay ms, and reports upstream calls per second, the share of 304s and the
+poll latency for each N:
+
+    python build_app.py --out build/hospital_queue
+    python bench_check_queues.py --app-dir build/hospital_queue --viewers 10 100 500
+
+  uncached  QUEUE_STATUS_TTL=0: one upstream call per poll (the old behaviour)
+  cached    the bootstrap's defaults (QUEUE_STATUS_TTL, QUEUE_STATUS_STALE_TTL)
+
+With the cache, upstream calls stay at about one per QUEUE_STATUS_TTL
+whatever the number of viewers.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+from api_stub import StandIn
+
+
+def poll(client, interval, stop, latencies, statuses):
+    etag = None
+    time.sleep(random.uniform(0, interval))  # viewers don't open the dashboard in lockstep
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = client.get('/check_queues', headers={'If-None-Match': etag} if etag else {})
+        latencies.append(time.perf_counter() - start)
+        statuses.append(response.status_code)
+        etag = response.headers.get('ETag', etag)
+        stop.wait(interval)
+
+
+def run(create_app, stub, overrides, viewers, interval, duration):
+    app = create_app(dict(overrides, API_ENDPOINT=stub.url))
+    latencies, statuses = [], []
+    stop = threading.Event()
+    threads = [threading.Thread(target=poll, args=(app.test_client(), interval, stop, latencies, statuses))
+               for _ in range(viewers)]
+    calls_before = stub.queue_checks
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    calls = stub.queue_checks - calls_before
+    latencies.sort()
+    return {
+        'polls': len(statuses),
+        'upstream_per_s': calls / duration,
+        'not_modified': statuses.count(304) / len(statuses) if statuses else 0,
+        'errors': sum(status >= 500 for status in statuses),
+        'p50_ms': statistics.median(latencies) * 1000 if latencies else 0,
+        'p95_ms': latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--app-dir', required=True, help='directory written by build_app.py')
+    parser.add_argument('--viewers', type=int, nargs='+', default=[1, 10, 100, 500])
+    parser.add_argument('--interval', type=float, default=5, help='seconds between one viewer\'s polls')
+    parser.add_argument('--duration', type=float, default=20, help='seconds per run')
+    parser.add_argument('--delay', type=float, default=100, help='API Gateway latency, in ms')
+    args = parser.parse_args()
+
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    sys.path.insert(0, os.path.abspath(args.app_dir))
+    from app import create_app
+
+    stub = StandIn(delay=args.delay / 1000).start()
+    setups = {'uncached': {'QUEUE_STATUS_TTL': 0}, 'cached': {}}
+    print(f"{args.interval:g} s poll interval, {args.delay:g} ms API Gateway, {args.duration:g} s per run")
+    print(f"{'setup':9} {'viewers':>7} {'polls':>7} {'upstream/s':>10} {'304s':>6} {'p50 ms':>8} {'p95 ms':>8} errors")
+    for viewers in args.viewers:
+        for name, overrides in setups.items():
+            result = run(create_app, stub, overrides, viewers, args.interval, args.duration)
+            print(f"{name:9} {viewers:7} {result['polls']:7} {result['upstream_per_s']:10.2f} "
+                  f"{result['not_modified']:6.0%} {result['p50_ms']:8.1f} {result['p95_ms']:8.1f} {result['errors']}")
+
+
+if __name__ == '__main__':
+    main()
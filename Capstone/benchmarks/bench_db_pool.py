@@ -0,0 +1,101 @@
+"""Requests/sec through the Flask app with and without the connection pool.
+
+Copy this file next to app.py and db_pool.py (e.g. /home/ubuntu/hospital_queue)
+and run it with the app's virtualenv:
+
+    python bench_db_pool.py                   # local MySQL, via /test_db and /form
+    python bench_db_pool.py --backend sqlite  # SQLite stand-in, pool only
+
+Each mode runs in a fresh subprocess so DB_POOL_SIZE is read at import time.
+"""
+import argparse
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.getcwd())
+
+
+def run_threads(threads, requests_per_thread, work):
+    def worker():
+        for _ in range(requests_per_thread):
+            work()
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return threads * requests_per_thread / elapsed
+
+
+def bench_mysql(threads, requests_per_thread):
+    import app as hospital_app
+    client = hospital_app.app.test_client()
+
+    def work():
+        client.get('/test_db')
+        client.get('/form/Hospital A')
+
+    rps = run_threads(threads, requests_per_thread, work) * 2
+    return rps, hospital_app.db_pool.metrics()
+
+
+def bench_sqlite(threads, requests_per_thread):
+    from db_pool import ConnectionPool
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE time_slots (id INTEGER PRIMARY KEY, hospital TEXT, booked INT)")
+        conn.executemany("INSERT INTO time_slots (hospital, booked) VALUES (?, 0)",
+                         [('Hospital A',)] * 100)
+
+    def creator():
+        return sqlite3.connect(path, check_same_thread=False)
+
+    size = int(os.environ['DB_POOL_SIZE'])
+    pool = ConnectionPool(creator, max_size=size) if size > 0 else None
+
+    def work():
+        conn = pool.connection() if pool else creator()
+        try:
+            conn.execute("SELECT id FROM time_slots WHERE hospital = ? AND booked < 10",
+                         ('Hospital A',)).fetchall()
+        finally:
+            conn.close()
+
+    rps = run_threads(threads, requests_per_thread, work)
+    return rps, pool.metrics() if pool else {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--backend', choices=['mysql', 'sqlite'], default='mysql')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=500, help='requests per thread')
+    parser.add_argument('--pool-size', type=int, default=5)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        bench = bench_mysql if args.backend == 'mysql' else bench_sqlite
+        rps, metrics = bench(args.threads, args.requests)
+        print(f"{rps:.0f} req/s  {metrics}")
+        return
+
+    for label, size in (('before (connect per request)', 0), ('after (pooled)', args.pool_size)):
+        env = dict(os.environ, DB_POOL_SIZE=str(size))
+        result = subprocess.run(
+            [sys.executable, __file__, '--child', '--backend', args.backend,
+             '--threads', str(args.threads), '--requests', str(args.requests)],
+            env=env, capture_output=True, text=True, check=True)
+        print(f"{label:30} {result.stdout.strip()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Per-request cost of the instrumentation layer vs. the old debug logging.
+
+Serves a minimal Flask route through the test client in three setups, each
+in a fresh subprocess (logging configuration is process-wide):
+
+  bare          no logging at all (the baseline)
+  old logging   logging.basicConfig(filename=..., level=DEBUG) and the ten
+                f-string debug lines /submit used to write, form data included
+  instrumented  Instrumentation: latency/DB histograms, request ids, queued
+                JSON logging with sampled DEBUG, and /submit's current lines
+
+and reports each setup's overhead over bare, in microseconds and as a
+share of the bare request, measured in the same run. Needs only Flask, pymysql and instrumentation.py (the bootstrap writes it
+next to app.py); copy there and run:
+
+    python bench_instrumentation.py --requests 10000 --threads 1 4
+"""
+import argparse
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.getcwd())
+
+FORM = {'hospital': 'Hospital A', 'name': 'Bench', 'lastName': 'Patient', 'dob': '1990-01-01',
+        'symptoms': 'cough', 'time_slot': '42'}
+
+
+def make_app(mode, log_file, sample_rate):
+    from flask import Flask, request
+
+    app = Flask(__name__)
+    if mode == 'instrumented':
+        from instrumentation import Instrumentation
+        instrumentation = Instrumentation(debug_sample_rate=sample_rate)
+        instrumentation.setup_logging(log_file, level=logging.DEBUG)
+        instrumentation.init_app(app)
+    elif mode == 'old':
+        logging.basicConfig(filename=log_file, level=logging.DEBUG)
+
+    @app.route('/submit', methods=['POST'])
+    def submit():
+        data = request.form.to_dict()
+        if mode == 'old':
+            logging.debug("Submit route accessed")
+            logging.debug(f"Received form data: {data}")
+            logging.debug("Registering patient")
+            logging.debug("Inserting patient data")
+            logging.debug("Patient data inserted successfully. Queue number: 42")
+            logging.debug("Storing queue number in session")
+            logging.debug("Updating time slot")
+            logging.debug("Time slot updated")
+            logging.debug("Redirecting to queue info")
+            logging.debug("Rendering form template")
+        elif mode == 'instrumented':
+            logging.debug("Registered patient at %s with queue number %s", data['hospital'], 42)
+        return 'ok'
+
+    return app
+
+
+def child(mode, requests, threads, sample_rate):
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(mode, os.path.join(tmp, 'app.log'), sample_rate)
+        per_thread = requests // threads
+
+        def worker():
+            client = app.test_client()
+            for _ in range(per_thread):
+                client.post('/submit', data=FORM)
+
+        worker()  # warm up
+        pool = [threading.Thread(target=worker) for _ in range(threads)]
+        start = time.perf_counter()
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        elapsed = time.perf_counter() - start
+        logging.shutdown()
+    # Wall time per request across all threads
+    print(elapsed / (per_thread * threads) * 1e6)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--sample-rate', type=float, default=0.01)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.requests, args.threads[0], args.sample_rate)
+        return
+
+    for threads in args.threads:
+        results = {}
+        for mode in ('bare', 'old', 'instrumented'):
+            output = subprocess.run(
+                [sys.executable, __file__, '--child', mode, '--requests', str(args.requests),
+                 '--threads', str(threads), '--sample-rate', str(args.sample_rate)],
+                capture_output=True, text=True, check=True).stdout
+            results[mode] = float(output.strip().splitlines()[-1])
+        bare = results['bare']
+        old, instrumented = results['old'] - bare, results['instrumented'] - bare
+        print(f"{threads} thread(s): bare {bare:6.1f} us  "
+              f"old logging +{old:6.1f} us ({old / bare:+.0%})  "
+              f"instrumented +{instrumented:6.1f} us ({instrumented / bare:+.0%}) per request")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""End-to-end lag and exactly-once delivery of the API Gateway outbox.
+
+Queues registrations with Outbox.add() from several threads, each in its own
+transaction against the local MySQL database, and drains them with several
+Outbox instances (one per simulated Gunicorn worker) into api_stub.py's
+stand-in for API Gateway, batched as the app sends them. The stand-in
+rejects a share of the calls, and for some of them stores the registrations
+before failing (a lost response), so the same call is retried after it was
+already accepted. Like the registration Lambda, it keeps one record per
+requestId (the Idempotency-Key).
+
+For comparison, it also times the old inline requests.post() against the same
+stand-in. Copy next to app.py (with api_stub.py and seed_data.py) and run
+with the app's virtualenv:
+
+    python bench_outbox.py --registrations 2000 --failure-rate 0.2 --delay 50
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+import requests
+
+sys.path.insert(0, os.getcwd())
+
+import app as hospital_app
+from api_stub import StandIn
+from outbox import Outbox
+from seed_data import delete_hospitals
+
+HOSPITAL = 'Bench Outbox Hospital'
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def summary(seconds):
+    ms = [x * 1000 for x in seconds]
+    return f"p50 {statistics.median(ms):8.2f} ms  p99 {percentile(ms, 99):8.2f} ms"
+
+
+def enqueue(registrations, threads):
+    """Queue the registrations; returns ({key: commit time}, enqueue latencies)."""
+    committed = {}
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(count):
+        for i in range(count):
+            start = time.perf_counter()
+            with hospital_app.get_db_connection() as connection:
+                with connection.cursor() as cursor:
+                    key = Outbox.add(cursor, '/submit', {
+                        'name': 'Bench', 'lastName': f'Patient {i}', 'dob': '1990-01-01',
+                        'hospital': HOSPITAL, 'symptoms': 'cough'})
+                connection.commit()
+            done = time.perf_counter()
+            with lock:
+                committed[key] = time.monotonic()
+                latencies.append(done - start)
+
+    pool = [threading.Thread(target=worker, args=(registrations // threads,)) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return committed, latencies
+
+
+def inline_posts(url, count):
+    """The old request path: a blocking POST on a fresh connection per call."""
+    latencies = []
+    for i in range(count):
+        start = time.perf_counter()
+        try:
+            requests.post(f'{url}/submit', json={'name': 'Bench', 'hospital': HOSPITAL})
+        except requests.RequestException:
+            pass
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--registrations', type=int, default=1000)
+    parser.add_argument('--threads', type=int, default=8, help='concurrent registering clients')
+    parser.add_argument('--drainers', type=int, default=3, help='Outbox instances (Gunicorn workers)')
+    parser.add_argument('--batch-size', type=int, default=25)
+    parser.add_argument('--failure-rate', type=float, default=0.2)
+    parser.add_argument('--delay', type=float, default=20, help='stand-in latency per call, in ms')
+    parser.add_argument('--timeout', type=float, default=120)
+    args = parser.parse_args()
+
+    random.seed(42)
+    get_connection = hospital_app.get_db_connection
+    with get_connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) AS pending FROM outbox WHERE delivered_at IS NULL")
+            if cursor.fetchone()['pending']:
+                sys.exit("The outbox has undelivered rows; let the app drain them before benchmarking.")
+
+    server = StandIn(args.failure_rate, args.delay / 1000).start()
+    drainers = [Outbox(get_connection, server.url, batch_size=args.batch_size,
+                       poll_interval=0.1, max_backoff=2, batch_paths=('/submit',))
+                for _ in range(args.drainers)]
+    try:
+        print(f"inline POST  {summary(inline_posts(server.url, 100))}")
+        server.accepted.clear()
+        server.calls = server.duplicates = 0
+
+        for drainer in drainers:
+            drainer.ensure_started()
+        committed, latencies = enqueue(args.registrations, args.threads)
+        for drainer in drainers:
+            drainer.wake()
+        print(f"outbox add   {summary(latencies)}")
+
+        deadline = time.monotonic() + args.timeout
+        while time.monotonic() < deadline:
+            with server.lock:
+                if set(committed) <= set(server.accepted):
+                    break
+            time.sleep(0.1)
+        with server.lock:
+            accepted = dict(server.accepted)
+            calls, duplicates, mismatched = server.calls, server.duplicates, server.mismatched
+
+        lags = [accepted[key] - committed[key] for key in committed if key in accepted]
+        if lags:
+            print(f"end-to-end   {summary(lags)}")
+        print(f"{len(committed)} queued  {len(accepted)} stored  {calls} calls  "
+              f"{duplicates} duplicate deliveries dropped")
+        missing = set(committed) - set(accepted)
+        unexpected = set(accepted) - set(committed)
+        assert not missing, f"{len(missing)} registrations were never delivered"
+        assert not unexpected, f"{len(unexpected)} unknown registrations were stored"
+        assert not mismatched, f"{mismatched} calls had a requestId that did not match the key"
+        print("exactly-once: every registration stored exactly once")
+    finally:
+        server.shutdown()
+        delete_hospitals(get_connection, HOSPITAL)
+
+
+if __name__ == '__main__':
+    main()
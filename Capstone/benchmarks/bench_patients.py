@@ -0,0 +1,84 @@
+"""Memory and time-to-first-byte of the patient list at 10k and 1M rows.
+
+Compares three ways of serving the list against the local MySQL database:
+
+- fetchall: the old /patients (every row fetched and rendered in one go)
+- page:     /patients, one keyset page
+- stream:   /patients.json, server-side cursor streamed as it is read
+
+Synthetic rows are added under benchmark-only hospitals and deleted at the
+end. Copy next to app.py and run with the app's virtualenv:
+
+    python bench_patients.py --volumes 10000 1000000
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.getcwd())
+
+from flask import render_template
+
+import app as hospital_app
+from seed_data import delete_hospitals, seed_history
+
+BENCH_PREFIX = 'Bench List Hospital'
+HOSPITAL = f'{BENCH_PREFIX} 0'  # seed_history names its single hospital '<prefix> 0'
+
+
+def fetchall_everything():
+    sql, params = hospital_app.patients_query({'hospital': HOSPITAL})
+    with hospital_app.get_db_connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            add_waiting_time = hospital_app.waiting_time_adder(cursor)
+            patients = [add_waiting_time(p) for p in cursor.fetchall()]
+    with hospital_app.app.test_request_context('/patients'):
+        body = render_template('patients.html', patients=patients, filters={}, next_cursor=None)
+    yield body.encode()
+
+
+def measure(label, make_chunks):
+    tracemalloc.start()
+    start = time.perf_counter()
+    chunks = iter(make_chunks())
+    first = next(chunks)
+    ttfb = time.perf_counter() - start
+    size = len(first) + sum(len(chunk) for chunk in chunks)
+    total = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {label:9} ttfb {ttfb * 1000:9.1f} ms  total {total * 1000:9.1f} ms  "
+          f"peak {peak / 2**20:8.1f} MiB  body {size / 2**20:8.1f} MiB")
+
+
+def run(rows):
+    client = hospital_app.app.test_client()
+    print(f"{rows} benchmark rows")
+    measure('fetchall', fetchall_everything)
+    measure('page', lambda: client.get(f'/patients?hospital={HOSPITAL}', buffered=False).response)
+    measure('stream', lambda: client.get(f'/patients.json?hospital={HOSPITAL}', buffered=False).response)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--volumes', type=int, nargs='+', default=[10_000, 1_000_000])
+    args = parser.parse_args()
+
+    get_connection = hospital_app.get_db_connection
+    delete_hospitals(get_connection, BENCH_PREFIX)
+    try:
+        seeded = 0
+        for volume in sorted(args.volumes):
+            seed_history(get_connection, BENCH_PREFIX, volume - seeded,
+                         hospitals=1, days=30, with_slots=False)
+            seeded = volume
+            run(volume)
+    finally:
+        delete_hospitals(get_connection, BENCH_PREFIX)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Queue lengths from counters vs. querying HospitalIndex, on DynamoDB Local.
+
+Loads one large queue (--patients items, well past the 1 MB Query page) and
+a number of small ones, registers patients through User_Registration_Lambda
+(delivering every request twice, as a retrying outbox would), then checks
+that the counters match a full paginated count and times:
+
+  * the old lookup (one Query, len(Items)), which stops at the first page
+  * a paginated Select='COUNT' query on today's HospitalDayIndex partition
+  * a single counter read, and one batch read for every hospital
+
+Run from anywhere with DynamoDB Local listening (see dynamo_local.py):
+
+    python bench_queue_check.py --patients 50000 --hospitals 50
+"""
+import argparse
+import random
+import time
+import uuid
+from datetime import datetime
+
+from dynamo_local import create_tables, drop_tables, use_local_dynamodb
+
+use_local_dynamodb()
+
+import Queue_Check_Lambda as queue_check
+import User_Registration_Lambda as registration
+from boto3.dynamodb.conditions import Key
+
+PREFIX = 'Bench Queue Hospital'
+
+
+def timed(fn, *args, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return result, best * 1000
+
+
+def old_queue_length(hospital):
+    response = queue_check.table.query(IndexName='HospitalIndex',
+                                       KeyConditionExpression=Key('Hospital').eq(hospital))
+    return len(response['Items'])
+
+
+def load(hospitals, patients):
+    """Bulk-load the starting queues; returns {hospital: length}."""
+    expected = dict.fromkeys(hospitals, 0)
+    symptoms = 'persistent cough, mild fever and fatigue for several days ' * 4
+    timestamp = datetime.now().isoformat()  # waiting today, so on HospitalDayIndex
+    with queue_check.table.batch_writer() as batch:
+        for i in range(patients):
+            # Most patients go to the first hospital, to make one long queue.
+            hospital = hospitals[0] if i % 10 else random.choice(hospitals)
+            expected[hospital] += 1
+            batch.put_item(Item={
+                'UserId': str(uuid.uuid4()), 'Name': 'Seed', 'LastName': f'Patient {i}',
+                'DoB': '1980-01-01', 'Hospital': hospital, 'Symptoms': symptoms,
+                'Timestamp': timestamp, 'HospitalDay': queue_check.hospital_day(hospital),
+                'Severity': 1, 'QueuePosition': 10})
+    return expected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--patients', type=int, default=50000)
+    parser.add_argument('--hospitals', type=int, default=50)
+    parser.add_argument('--registrations', type=int, default=200)
+    args = parser.parse_args()
+
+    random.seed(42)
+    dynamodb = queue_check.dynamodb
+    hospitals = [f'{PREFIX} {i}' for i in range(args.hospitals)]
+    create_tables(dynamodb, queue_check.table.name, queue_check.counters.name)
+    try:
+        print(f"Loading {args.patients} patients...")
+        expected = load(hospitals, args.patients)
+        queue_check.rebuild_counters(hospitals)
+
+        print(f"Registering {args.registrations} patients, each delivered twice...")
+        for i in range(args.registrations):
+            body = {'requestId': str(uuid.uuid4()), 'name': 'Bench', 'lastName': f'Patient {i}',
+                    'dob': '1990-01-01', 'hospital': random.choice(hospitals), 'symptoms': 'cough'}
+            registration.lambda_handler({}, body)
+            registration.lambda_handler({}, body)
+            expected[body['hospital']] += 1
+
+        big = hospitals[0]
+        old, old_ms = timed(old_queue_length, big)
+        counted, count_ms = timed(queue_check.count_queue, big)
+        single, single_ms = timed(queue_check.lambda_handler, {'hospital': big}, None)
+        batch, batch_ms = timed(queue_check.lambda_handler, {'hospitals': hospitals}, None)
+
+        print(f"{'one Query, len(Items)':28} {old:8}  {old_ms:9.1f} ms")
+        print(f"{'paginated COUNT':28} {counted:8}  {count_ms:9.1f} ms")
+        print(f"{'counter':28} {single['body']['queueLength']:8}  {single_ms:9.1f} ms")
+        print(f"{f'batch of {len(hospitals)} counters':28} {'':8}  {batch_ms:9.1f} ms")
+
+        assert counted == expected[big], f"paginated count {counted} != {expected[big]}"
+        assert batch['body']['queueLengths'] == expected, "counters do not match the queues"
+        print("counters match every queue; duplicate deliveries were counted once")
+    finally:
+        drop_tables(dynamodb, queue_check.table.name, queue_check.counters.name)
+
+
+if __name__ == '__main__':
+    main()
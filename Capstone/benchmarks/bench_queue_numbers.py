@@ -0,0 +1,112 @@
+"""Concurrency stress test for QueueNumberAllocator.
+
+N threads (or processes) allocate queue numbers for the same hospital at once;
+the run fails if any number is handed out twice, or (with --block-size 1) if
+the sequence has gaps. Reports allocations/sec.
+
+Copy next to app.py and queue_numbers.py and run with the app's virtualenv:
+
+    python bench_queue_numbers.py --backend sqlite --workers 16
+    python bench_queue_numbers.py --backend mysql --workers 16 --processes
+    python bench_queue_numbers.py --backend mysql --block-size 20
+"""
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+
+sys.path.insert(0, os.getcwd())
+
+from db_pool import ConnectionPool
+from queue_numbers import QueueNumberAllocator
+
+HOSPITAL = 'Stress Test Hospital'
+
+
+def make_allocator(backend, block_size, sqlite_path):
+    if backend == 'sqlite':
+        pool = ConnectionPool(lambda: sqlite3.connect(sqlite_path, timeout=30, check_same_thread=False),
+                              max_size=1)
+        return QueueNumberAllocator(pool.connection, block_size=block_size, dialect='sqlite')
+    from app import get_db_connection
+    return QueueNumberAllocator(get_db_connection, block_size=block_size)
+
+
+def setup(backend, sqlite_path):
+    if backend == 'sqlite':
+        with sqlite3.connect(sqlite_path) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS queue_counters (
+                hospital VARCHAR(100) NOT NULL, date DATE NOT NULL, value INT NOT NULL,
+                PRIMARY KEY (hospital, date))""")
+            conn.execute("DELETE FROM queue_counters WHERE hospital = ?", (HOSPITAL,))
+        return
+    from app import get_db_connection
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM queue_counters WHERE hospital = %s", (HOSPITAL,))
+        conn.commit()
+
+
+def allocate_many(backend, block_size, sqlite_path, count, out):
+    allocator = make_allocator(backend, block_size, sqlite_path)
+    day = date.today()
+    out.extend(allocator.allocate(HOSPITAL, day) for _ in range(count))
+
+
+def process_worker(args):
+    numbers = []
+    allocate_many(*args, numbers)
+    return numbers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--backend', choices=['mysql', 'sqlite'], default='sqlite')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--per-worker', type=int, default=500)
+    parser.add_argument('--block-size', type=int, default=1)
+    parser.add_argument('--processes', action='store_true', help='use processes instead of threads')
+    args = parser.parse_args()
+
+    sqlite_path = os.path.join(tempfile.mkdtemp(), 'queue.db')
+    setup(args.backend, sqlite_path)
+    job = (args.backend, args.block_size, sqlite_path, args.per_worker)
+
+    start = time.perf_counter()
+    if args.processes:
+        with multiprocessing.Pool(args.workers) as pool:
+            numbers = [n for chunk in pool.map(process_worker, [job] * args.workers) for n in chunk]
+    else:
+        numbers = []
+        lock = threading.Lock()
+
+        def thread_worker():
+            mine = []
+            allocate_many(*job, mine)
+            with lock:
+                numbers.extend(mine)
+
+        threads = [threading.Thread(target=thread_worker) for _ in range(args.workers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    elapsed = time.perf_counter() - start
+
+    total = args.workers * args.per_worker
+    assert len(numbers) == total, f"expected {total} numbers, got {len(numbers)}"
+    assert len(set(numbers)) == total, f"{total - len(set(numbers))} duplicate queue numbers"
+    if args.block_size == 1:
+        assert sorted(numbers) == list(range(1, total + 1)), "queue numbers are not gap-free"
+    print(f"{total} unique numbers from {args.workers} {'processes' if args.processes else 'threads'} "
+          f"(block size {args.block_size}): {total / elapsed:.0f} allocations/sec")
+
+
+if __name__ == '__main__':
+    main()
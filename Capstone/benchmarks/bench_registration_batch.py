@@ -0,0 +1,96 @@
+"""Registration throughput: one patient per invocation vs. batch mode.
+
+Registers --patients patients through User_Registration_Lambda.lambda_handler
+on DynamoDB Local, first one per call and then in batches of each
+--batch-sizes, with a share of each batch being replays of already stored
+requests. It checks the per-item results and that the queue length counters
+match the stored items. Run with DynamoDB Local listening (see
+dynamo_local.py):
+
+    python bench_registration_batch.py --patients 2000 --batch-sizes 25 100 500
+"""
+import argparse
+import random
+import time
+import uuid
+from collections import Counter
+
+from dynamo_local import create_tables, drop_tables, use_local_dynamodb
+
+use_local_dynamodb()
+
+import Queue_Check_Lambda as queue_check
+import User_Registration_Lambda as registration
+
+HOSPITALS = [f'Bench Batch Hospital {i}' for i in range(5)]
+
+
+def registrations(count):
+    return [{'requestId': str(uuid.uuid4()), 'name': 'Bench', 'lastName': f'Patient {i}',
+             'dob': '1990-01-01', 'hospital': random.choice(HOSPITALS),
+             'symptoms': 'emergency' if i % 10 == 0 else 'cough'} for i in range(count)]
+
+
+def run(label, patients, call):
+    """Time call(batch) over every patient; returns the per-item results."""
+    create_tables(registration.dynamodb, registration.table.name, registration.counters.name)
+    registration.triage_queues.clear()
+    start = time.perf_counter()
+    results = call(patients)
+    elapsed = time.perf_counter() - start
+    statuses = Counter(r['status'] for r in results)
+    print(f"{label:22} {len(patients) / elapsed:8.0f} patients/s  {dict(statuses)}")
+
+    stored = Counter(p['hospital'] for p, r in zip(patients, results) if r['status'] == 'stored')
+    lengths = queue_check.get_queue_lengths(HOSPITALS)
+    assert all(lengths[h] == stored[h] == queue_check.count_queue(h) for h in HOSPITALS), \
+        f"queue lengths {lengths} do not match stored items {dict(stored)}"
+    return results
+
+
+def one_by_one(patients):
+    results = []
+    for body in patients:
+        response = registration.lambda_handler({}, body)['body']
+        results.append({'userId': response['userId'], 'queuePosition': response['queuePosition'],
+                        'status': 'stored'})
+    return results
+
+
+def batched(size, replays):
+    def call(patients):
+        results = []
+        for start in range(0, len(patients), size):
+            chunk = patients[start:start + size]
+            # Replay part of the previous batch, as an outbox retry would.
+            replayed = patients[max(0, start - replays):start]
+            response = registration.lambda_handler({}, {'registrations': replayed + chunk})['body']
+            assert all(r['status'] == 'duplicate' for r in response['results'][:len(replayed)])
+            results.extend(response['results'][len(replayed):])
+        return results
+    return call
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--patients', type=int, default=2000)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[25, 100, 500])
+    parser.add_argument('--replays', type=int, default=5, help='replayed registrations per batch')
+    args = parser.parse_args()
+
+    random.seed(42)
+    patients = registrations(args.patients)
+    try:
+        run('one per invocation', patients, one_by_one)
+        for size in args.batch_sizes:
+            results = run(f'batches of {size}', patients, batched(size, args.replays))
+            assert [r['userId'] for r in results] == [p['requestId'] for p in patients]
+            # Emergencies are queued ahead of every routine patient.
+            emergencies = [r['queuePosition'] for p, r in zip(patients, results) if p['symptoms'] == 'emergency']
+            assert max(emergencies) <= len(emergencies)
+    finally:
+        drop_tables(registration.dynamodb, registration.table.name, registration.counters.name)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Database queries per /form view with and without the free-slots bitmap.
+
+Replays form views for a benchmark hospital, with a /submit every
+--submit-every views (each booking is counted into the cached entry), from
+several threads against the local MySQL database. The run is repeated with
+SLOT_CACHE_TTL=0 (cache off) and with the configured TTL, each in a fresh
+subprocess. Copy next to app.py and run with the app's virtualenv:
+
+    python bench_slot_cache.py --views 5000 --ttl 5
+"""
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.getcwd())
+
+HOSPITAL = 'Bench Cache Hospital'
+
+
+def child(views, submit_every, threads):
+    os.environ.setdefault('MAX_QUEUE_LENGTH', '1000000')
+    os.environ.setdefault('SLOT_CAPACITY', '1000000')
+    import app as hospital_app
+    from seed_data import delete_hospitals, execute
+
+    get_connection = hospital_app.get_db_connection
+    delete_hospitals(get_connection, HOSPITAL)
+    slot_id = execute(get_connection,
+                      "INSERT INTO time_slots (slot_time, date, hospital) VALUES ('18:00', CURDATE(), %s)",
+                      (HOSPITAL,))
+    form = {
+        'hospital': HOSPITAL, 'name': 'Bench', 'lastName': 'Patient', 'dob': '1990-01-01',
+        'symptoms': 'cough', 'emergency_contact_name': 'Contact',
+        'emergency_contact_phone': '5145550100', 'payment_method': 'cash',
+        'appointment_type': 'consultation', 'time_slot': str(slot_id),
+    }
+    submits = []
+
+    def worker():
+        client = hospital_app.app.test_client()
+        for i in range(views // threads):
+            client.get(f'/form/{HOSPITAL}')
+            if submit_every and i % submit_every == submit_every - 1:
+                client.post('/submit', data=form)
+                submits.append(1)
+
+    try:
+        start = time.perf_counter()
+        pool = [threading.Thread(target=worker) for _ in range(threads)]
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        elapsed = time.perf_counter() - start
+        # Every lookup the bitmap could not answer ran the slot query.
+        slot_queries = hospital_app.free_slots.metrics()['loads']
+    finally:
+        delete_hospitals(get_connection, HOSPITAL)
+
+    total_views = views // threads * threads
+    print(f"{slot_queries / total_views:.3f} queries/view  {total_views / elapsed:.0f} views/s  "
+          f"{len(submits)} bookings  {hospital_app.free_slots.metrics()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--views', type=int, default=2000)
+    parser.add_argument('--submit-every', type=int, default=20)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--ttl', type=float, default=5)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.views, args.submit_every, args.threads)
+        return
+
+    for label, ttl in (('no cache', 0), (f'cache ttl={args.ttl:g}s', args.ttl)):
+        env = dict(os.environ, SLOT_CACHE_TTL=str(ttl))
+        result = subprocess.run(
+            [sys.executable, __file__, '--child', '--views', str(args.views),
+             '--submit-every', str(args.submit_every), '--threads', str(args.threads)],
+            env=env, capture_output=True, text=True, check=True)
+        print(f"{label:16} {result.stdout.strip()}")
+
+
+if __name__ == '__main__':
+    main()
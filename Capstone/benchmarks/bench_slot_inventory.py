@@ -0,0 +1,107 @@
+"""Bulk time slot generation for 1,000 hospitals x 90 days, and free-slot checks.
+
+Generates the slots of --hospitals benchmark hospitals (default 1,000, 9
+slots a day) for --days days (default 90, 810,000 rows) with
+SlotGenerator, once per --batch-sizes value, into the local MySQL database
+the app is configured for, then:
+
+  rerun       the same generation again: nothing to insert (idempotent)
+  extend      the background job's pass the next day: one new day of slots
+  row-by-row  one INSERT IGNORE per row (a plain loop over the rules), on the
+              first --row-by-row-days days only, extrapolated
+
+and times "does this slot have room" as a FreeSlots bitmap lookup against
+the slot query it replaces. --no-db only times the in-memory parts (row
+generation and bitmap lookups):
+
+    python build_app.py --out build/hospital_queue --init-db
+    DB_HOST=127.0.0.1 DB_PASSWORD=local python bench_slot_inventory.py --app-dir build/hospital_queue
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+PREFIX = 'Bench Slots '
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--app-dir', required=True, help='directory written by build_app.py')
+    parser.add_argument('--hospitals', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[100, 1000, 5000])
+    parser.add_argument('--row-by-row-days', type=int, default=1)
+    parser.add_argument('--checks', type=int, default=100000, help='bitmap lookups to time')
+    parser.add_argument('--no-db', action='store_true', help='skip everything that needs MySQL')
+    args = parser.parse_args()
+
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    sys.path.insert(0, os.path.abspath(args.app_dir))
+    import app as hospital_app
+    from seed_data import delete_hospitals
+    from slot_inventory import FreeSlots, SlotGenerator, slot_rules
+
+    names = [f'{PREFIX}{i:04d}' for i in range(args.hospitals)]
+    rules = slot_rules(names)
+    get_connection = hospital_app.get_db_connection
+    start = date.today()
+
+    rows, elapsed = timed(lambda: list(SlotGenerator(None, rules).rows(start, args.days)))
+    print(f"{args.hospitals} hospitals x {args.days} days = {len(rows)} slots")
+    print(f"{'rows in memory':24} {elapsed:8.2f} s  {len(rows) / elapsed:10.0f} rows/s")
+
+    # A day of one hospital, as load_slot_capacity returns it, three slots full
+    day_rows = [{'id': i, 'slot_time': timedelta(hours=18, minutes=30 * i), 'remaining': 0 if i % 3 else 5}
+                for i in range(9)]
+    free_slots = FreeSlots(lambda hospital, day: day_rows, ttl=3600)
+    _, elapsed = timed(lambda: [free_slots.has_capacity(names[0], start, i % 9) for i in range(args.checks)])
+    print(f"{'bitmap check':24} {elapsed / args.checks * 1e6:8.2f} us per check")
+    if args.no_db:
+        return
+
+    delete_hospitals(get_connection, PREFIX)
+    try:
+        for batch_size in args.batch_sizes:
+            generator = SlotGenerator(get_connection, rules, days_ahead=args.days, batch_size=batch_size)
+            inserted, elapsed = timed(generator.generate)
+            print(f"{f'generate, batch {batch_size}':24} {elapsed:8.2f} s  {inserted / elapsed:10.0f} rows/s"
+                  f"  {inserted} inserted")
+            inserted, elapsed = timed(generator.generate)
+            print(f"{'  rerun':24} {elapsed:8.2f} s  {inserted} inserted")
+            # What extend() does the next day: the one day that came into range
+            inserted, elapsed = timed(lambda: generator.generate(start + timedelta(days=args.days), 1))
+            print(f"{'  extend (next day)':24} {elapsed:8.2f} s  {inserted} inserted")
+            delete_hospitals(get_connection, PREFIX)
+
+        sample = list(SlotGenerator(None, rules).rows(start, args.row_by_row_days))
+
+        def row_by_row():
+            with get_connection() as connection:
+                with connection.cursor() as cursor:
+                    for row in sample:
+                        cursor.execute("INSERT IGNORE INTO time_slots (hospital, date, slot_time) "
+                                       "VALUES (%s, %s, %s)", row)
+                connection.commit()
+        _, elapsed = timed(row_by_row)
+        print(f"{'row by row':24} {elapsed:8.2f} s  {len(sample) / elapsed:10.0f} rows/s"
+              f"  ({elapsed * len(rows) / len(sample):.0f} s for all {len(rows)})")
+
+        def query_checks():
+            for i in range(args.checks // 100):
+                hospital_app.load_slot_capacity(names[i % len(names)], start)
+        _, elapsed = timed(query_checks)
+        print(f"{'slot query check':24} {elapsed / (args.checks // 100) * 1e6:8.2f} us per check")
+    finally:
+        delete_hospitals(get_connection, PREFIX)
+
+
+if __name__ == '__main__':
+    main()
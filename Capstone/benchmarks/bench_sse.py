@@ -0,0 +1,126 @@
+"""How many live dashboards (/events) one Gunicorn worker can hold.
+
+Starts a single Gunicorn worker for the app, opens an increasing number of
+server-sent-event connections to /events, then changes a benchmark patient's
+payment status once and measures how many dashboards received the event and
+how long it took. Copy next to app.py and run with the app's virtualenv
+(gunicorn and the local MySQL database are required):
+
+    python bench_sse.py --threads 100 --dashboards 50 100 200 400
+    python bench_sse.py --worker-class sync --dashboards 1 2 4
+"""
+import argparse
+import os
+import selectors
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.parse
+
+sys.path.insert(0, os.getcwd())
+
+import app as hospital_app
+from seed_data import delete_hospitals, execute
+
+HOSPITAL = 'Bench SSE Hospital'
+PORT = 8123
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Gunicorn did not start listening on port {port}")
+
+
+def read_until(selector, pending, marker, timeout):
+    """Read from sockets until each has sent ``marker``; return arrival times."""
+    arrived = {}
+    deadline = time.monotonic() + timeout
+    while pending and time.monotonic() < deadline:
+        for key, _ in selector.select(timeout=0.1):
+            sock = key.fileobj
+            try:
+                data = sock.recv(65536)
+            except BlockingIOError:
+                continue
+            buffers = key.data
+            buffers.append(data)
+            if sock in pending and marker in b''.join(buffers):
+                arrived[sock] = time.monotonic()
+                pending.discard(sock)
+                buffers.clear()
+    return arrived
+
+
+def run(count, patient_id, timeout):
+    selector = selectors.DefaultSelector()
+    sockets = []
+    request = (f"GET /events?hospital={urllib.parse.quote(HOSPITAL)} HTTP/1.1\r\n"
+               f"Host: 127.0.0.1\r\nAccept: text/event-stream\r\n\r\n").encode()
+    for _ in range(count):
+        sock = socket.create_connection(('127.0.0.1', PORT))
+        sock.sendall(request)
+        sock.setblocking(False)
+        selector.register(sock, selectors.EVENT_READ, data=[])
+        sockets.append(sock)
+
+    connected = read_until(selector, set(sockets), b': connected', timeout)
+    # Give the worker's tailer a poll interval to see the starting point.
+    time.sleep(1)
+
+    # The change goes through this process's copy of the app, so it still
+    # lands when every Gunicorn thread is busy streaming.
+    start = time.monotonic()
+    hospital_app.app.test_client().post(f'/update_payment_status/{patient_id}',
+                                        data={'payment_status': 'completed' if count % 2 else 'pending'})
+    delivered = read_until(selector, set(connected), b'event: queue', timeout)
+
+    for sock in sockets:
+        selector.unregister(sock)
+        sock.close()
+    latencies = sorted((t - start) * 1000 for t in delivered.values())
+    summary = "no deliveries"
+    if latencies:
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        summary = f"p50 {statistics.median(latencies):7.1f} ms  p99 {p99:7.1f} ms"
+    print(f"{count:5} dashboards  connected {len(connected):5}  received {len(delivered):5}  {summary}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dashboards', type=int, nargs='+', default=[50, 100, 200, 400])
+    parser.add_argument('--worker-class', default='gthread')
+    parser.add_argument('--threads', type=int, default=100)
+    parser.add_argument('--timeout', type=float, default=5)
+    args = parser.parse_args()
+
+    get_connection = hospital_app.get_db_connection
+    delete_hospitals(get_connection, HOSPITAL)
+    patient_id = execute(get_connection, """
+        INSERT INTO patients (name, last_name, dob, hospital, symptoms, queue_number)
+        VALUES ('Bench', 'Patient', '1990-01-01', %s, 'cough', 1)""", (HOSPITAL,))
+    gunicorn = subprocess.Popen(
+        [os.path.join(os.path.dirname(sys.executable), 'gunicorn'), '--workers', '1',
+         '--worker-class', args.worker_class, '--threads', str(args.threads),
+         '--bind', f'127.0.0.1:{PORT}', 'app:app'],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(PORT)
+        print(f"1 {args.worker_class} worker, {args.threads} threads")
+        for count in args.dashboards:
+            run(count, patient_id, args.timeout)
+    finally:
+        gunicorn.terminate()
+        gunicorn.wait()
+        delete_hospitals(get_connection, HOSPITAL)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Per-submission latency of /submit at 1, 8 and 64 concurrent clients.
+
+Posts intake forms through the Flask test client against the local MySQL
+database the bootstrap creates, using a dedicated benchmark hospital that is
+removed again afterwards. Copy next to app.py and run with the app's virtualenv:
+
+    python bench_submit.py --submissions 200
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.getcwd())
+
+# Lift the intake limits and size the pool for the highest concurrency level
+# before the app reads its configuration.
+os.environ.setdefault('MAX_QUEUE_LENGTH', '1000000')
+os.environ.setdefault('SLOT_CAPACITY', '1000000')
+os.environ.setdefault('DB_POOL_SIZE', '64')
+
+import app as hospital_app
+
+HOSPITAL = 'Benchmark Hospital'
+
+
+def execute(sql, params=()):
+    with hospital_app.get_db_connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            row_id = cursor.lastrowid
+        connection.commit()
+    return row_id
+
+
+def cleanup():
+    execute("DELETE FROM patients WHERE hospital = %s", (HOSPITAL,))
+    execute("DELETE FROM time_slots WHERE hospital = %s", (HOSPITAL,))
+    execute("DELETE FROM queue_counters WHERE hospital = %s", (HOSPITAL,))
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def run(clients, submissions, slot_id):
+    form = {
+        'hospital': HOSPITAL, 'name': 'Bench', 'lastName': 'Patient', 'dob': '1990-01-01',
+        'symptoms': 'cough', 'emergency_contact_name': 'Contact',
+        'emergency_contact_phone': '5145550100', 'payment_method': 'cash',
+        'appointment_type': 'consultation', 'time_slot': str(slot_id),
+    }
+    latencies = []
+    failures = []
+    lock = threading.Lock()
+
+    def client():
+        test_client = hospital_app.app.test_client()
+        mine = []
+        for _ in range(submissions // clients):
+            start = time.perf_counter()
+            response = test_client.post('/submit', data=form)
+            mine.append(time.perf_counter() - start)
+            if response.status_code != 302 or not response.location.endswith('/patients'):
+                failures.append(response.status_code)
+        with lock:
+            latencies.extend(mine)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    ms = [x * 1000 for x in latencies]
+    print(f"{clients:3} clients  {len(ms):6} submissions  "
+          f"p50 {statistics.median(ms):7.2f} ms  p99 {percentile(ms, 99):7.2f} ms  "
+          f"{len(ms) / elapsed:7.0f} req/s  failures {len(failures)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--submissions', type=int, default=640, help='submissions per concurrency level')
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 8, 64])
+    args = parser.parse_args()
+
+    cleanup()
+    slot_id = execute("INSERT INTO time_slots (slot_time, date, hospital) VALUES ('18:00', CURDATE(), %s)",
+                      (HOSPITAL,))
+    try:
+        for clients in args.clients:
+            run(clients, args.submissions, slot_id)
+    finally:
+        cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Render time of the template-rendered pages, per route, before and after render caching.
+
+Creates the app written by build_app.py in-process in two setups and times
+each route's view function inside a request context (the test client's own
+overhead, about 1 ms a request, would hide the rendering), as the mean over
+--requests calls. /form/<hospital> gets its time slots from a fixed list
+instead of the database, so no MySQL is needed:
+
+    python build_app.py --out build/hospital_queue
+    python bench_templates.py --app-dir build/hospital_queue --requests 5000
+
+  uncached  TEMPLATES_AUTO_RELOAD=1, RENDER_CACHE=0: every template checked
+            on disk and every page rendered in full on each request (the old
+            behaviour)
+  cached    the defaults: templates compiled in create_app, the index page
+            rendered once (and answered with 304 when the browser has it),
+            the form header rendered once per hospital
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import timedelta
+
+SLOTS = [{'id': i, 'slot_time': timedelta(hours=18, minutes=15 * i), 'remaining': 10} for i in range(16)]
+
+
+def time_route(app, path, requests, headers=None):
+    with app.test_request_context(path, headers=headers) as context:
+        view = app.view_functions[context.request.url_rule.endpoint]
+        args = context.request.view_args
+        response = app.make_response(view(**args))
+        assert response.status_code in (200, 304), (path, response.status_code)
+        start = time.perf_counter()
+        for _ in range(requests):
+            app.make_response(view(**args))
+        return (time.perf_counter() - start) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--app-dir', required=True, help='directory written by build_app.py')
+    parser.add_argument('--requests', type=int, default=2000, help='timed requests per route')
+    args = parser.parse_args()
+
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    sys.path.insert(0, os.path.abspath(args.app_dir))
+    import app as hospital_app
+    from slot_inventory import FreeSlots
+
+    setups = {
+        'uncached': {'TEMPLATES_AUTO_RELOAD': True, 'RENDER_CACHE': False},
+        'cached': {},
+    }
+    hospital = hospital_app.hospitals[0]['name']
+    results = {}
+    for name, overrides in setups.items():
+        app = hospital_app.create_app(dict(overrides, LOG_FILE=os.devnull))
+        hospital_app.free_slots = FreeSlots(lambda hospital, day: SLOTS, ttl=3600)
+        etag = app.test_client().get('/').headers.get('ETag')
+        routes = {
+            'GET /': ('/', None),
+            'GET / (If-None-Match)': ('/', {'If-None-Match': etag} if etag else None),
+            'GET /form/<hospital>': (f'/form/{hospital}', None),
+        }
+        for route, (path, headers) in routes.items():
+            results[name, route] = time_route(app, path, args.requests, headers)
+
+    print(f"{'route':24} {'uncached us':>12} {'cached us':>10} {'speedup':>8}")
+    for route in routes:
+        before, after = results['uncached', route], results['cached', route]
+        print(f"{route:24} {before * 1e6:12.1f} {after * 1e6:10.1f} {before / after:7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Per-operation cost of the triage queue at 100k queued patients.
+
+Fills a TriageQueue and, for comparison, a sorted list maintained with bisect
+(O(n) insert, remove and rank), then times each operation on the full queue.
+Pure Python, no database needed:
+
+    python bench_triage_queue.py --patients 100000 --ops 20000
+"""
+import argparse
+import bisect
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from triage_queue import MAX_SEVERITY, TriageQueue
+
+
+class SortedListQueue:
+    """The straightforward alternative: one sorted list of keys."""
+
+    def __init__(self):
+        self._keys = []
+        self._entries = {}
+
+    def add(self, patient_id, severity, arrival):
+        self._entries[patient_id] = (severity, arrival)
+        bisect.insort(self._keys, (-severity, arrival, patient_id))
+
+    def remove(self, patient_id):
+        severity, arrival = self._entries.pop(patient_id)
+        del self._keys[bisect.bisect_left(self._keys, (-severity, arrival, patient_id))]
+        return severity, arrival
+
+    def reprioritize(self, patient_id, severity):
+        _, arrival = self.remove(patient_id)
+        self.add(patient_id, severity, arrival)
+
+    def rank(self, patient_id):
+        severity, arrival = self._entries[patient_id]
+        return bisect.bisect_left(self._keys, (-severity, arrival, patient_id)) + 1
+
+
+def per_op(label, fn, args_list):
+    start = time.perf_counter()
+    for args in args_list:
+        fn(*args)
+    elapsed = time.perf_counter() - start
+    return f"{label} {elapsed / len(args_list) * 1e6:8.2f} us"
+
+
+def bench(name, queue, patients, ops, rng):
+    start = time.perf_counter()
+    for patient_id in range(patients):
+        queue.add(patient_id, rng.randint(1, MAX_SEVERITY), patient_id)
+    fill = time.perf_counter() - start
+
+    arrivals = patients
+    sample = rng.sample(range(patients), ops)
+    results = [
+        per_op('rank', queue.rank, [(p,) for p in sample]),
+        per_op('reprioritize', queue.reprioritize, [(p, rng.randint(1, MAX_SEVERITY)) for p in sample]),
+        per_op('remove', queue.remove, [(p,) for p in sample]),
+        per_op('add', queue.add, [(patients + i, rng.randint(1, MAX_SEVERITY), arrivals + i)
+                                  for i in range(ops)]),
+    ]
+    print(f"{name:12} fill {fill:6.2f} s  " + "  ".join(results))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--patients', type=int, default=100000)
+    parser.add_argument('--ops', type=int, default=20000)
+    args = parser.parse_args()
+
+    bench('skip list', TriageQueue(seed=42), args.patients, args.ops, random.Random(42))
+    bench('sorted list', SortedListQueue(), args.patients, args.ops, random.Random(42))
+
+    # Cross-check: both structures agree on every rank.
+    rng = random.Random(7)
+    skip, flat = TriageQueue(seed=7), SortedListQueue()
+    for patient_id in range(5000):
+        severity, arrival = rng.randint(1, MAX_SEVERITY), rng.random()
+        skip.add(patient_id, severity, arrival)
+        flat.add(patient_id, severity, arrival)
+    for patient_id in rng.sample(range(5000), 1000):
+        severity = rng.randint(1, MAX_SEVERITY)
+        skip.reprioritize(patient_id, severity)
+        flat.reprioritize(patient_id, severity)
+    assert all(skip.rank(p) == flat.rank(p) for p in range(5000)), "ranks differ"
+    print("ranks agree with the sorted-list reference")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Replay a synthetic day of visits through the wait time estimator.
+
+Simulates one doctor per hospital working through a FIFO queue, with visit
+lengths that depend on the hospital and appointment type and get longer in
+the afternoon. Every arrival is given an estimate (as the app computes it:
+queue position times the expected visit length) by the old flat 15 minutes,
+by the learned per-hospital average, and by the per-type sum used for the
+live queue snapshots; every checkout is fed to the estimator. Reports the
+mean absolute error against the simulated time until each visit ends, and
+the per-update and per-estimate cost. Pure Python, no database needed; copy
+next to wait_times.py (the bootstrap writes it next to app.py):
+
+    python bench_wait_times.py --hospitals 5 --days 1
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.getcwd())
+
+from wait_times import WaitTimeEstimator
+
+VISIT_MINUTES = {'consultation': 20, 'follow-up': 10, 'emergency': 45}
+TYPE_WEIGHTS = [('consultation', 6), ('follow-up', 3), ('emergency', 1)]
+OPEN, CLOSE = 8 * 60, 20 * 60
+
+
+def simulate(rng, hospitals, days, utilization):
+    """Events (minute, order, kind, hospital, patient) for every visit, in time order."""
+    types = [t for t, weight in TYPE_WEIGHTS for _ in range(weight)]
+    mean_visit = sum(VISIT_MINUTES[t] for t in types) / len(types)
+    events = []
+    order = 0
+    for h in range(hospitals):
+        hospital = f'Hospital {h}'
+        speed = rng.uniform(0.7, 1.4)
+        for day in range(days):
+            clock = day * 1440 + OPEN
+            free_at = clock
+            while True:
+                clock += rng.expovariate(utilization / (mean_visit * speed))
+                if clock >= day * 1440 + CLOSE:
+                    break
+                appointment_type = rng.choice(types)
+                afternoon = 1.3 if clock % 1440 >= 13 * 60 else 1.0
+                visit = VISIT_MINUTES[appointment_type] * speed * afternoon * rng.lognormvariate(0, 0.35)
+                start = max(clock, free_at)
+                free_at = start + visit
+                patient = {'type': appointment_type, 'arrival': clock, 'end': free_at, 'visit': visit}
+                events.append((clock, order, 'arrive', hospital, patient))
+                events.append((free_at, order + 1, 'checkout', hospital, patient))
+                order += 2
+    events.sort(key=lambda event: event[:2])
+    return events
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--hospitals', type=int, default=5)
+    parser.add_argument('--days', type=int, default=1)
+    parser.add_argument('--utilization', type=float, default=0.9)
+    parser.add_argument('--alpha', type=float, default=0.1)
+    args = parser.parse_args()
+
+    events = simulate(random.Random(42), args.hospitals, args.days, args.utilization)
+    estimator = WaitTimeEstimator(alpha=args.alpha)
+    waiting = {}  # hospital -> patients not checked out yet, in queue order
+    errors = {'flat 15 min': [], 'per hospital': [], 'per type': []}
+    update_time = estimate_time = 0.0
+    estimates = updates = 0
+
+    for minute, _, kind, hospital, patient in events:
+        queue = waiting.setdefault(hospital, [])
+        if kind == 'checkout':
+            queue.remove(patient)
+            start = time.perf_counter()
+            estimator.observe(hospital, patient['type'], patient['visit'])
+            update_time += time.perf_counter() - start
+            updates += 1
+            continue
+
+        queue.append(patient)
+        actual = patient['end'] - minute
+        start = time.perf_counter()
+        per_hospital = estimator.estimate(len(queue), hospital)
+        per_type = estimator.estimate_queue(hospital, [p['type'] for p in queue])[-1]
+        estimate_time += time.perf_counter() - start
+        estimates += 1
+        errors['flat 15 min'].append(abs(len(queue) * 15 - actual))
+        errors['per hospital'].append(abs(per_hospital - actual))
+        errors['per type'].append(abs(per_type - actual))
+
+    print(f"{estimates} arrivals, {updates} checkouts at {args.hospitals} hospitals over {args.days} day(s)")
+    for label, values in errors.items():
+        print(f"{label:14} mean absolute error {sum(values) / len(values):7.1f} min")
+    print(f"observe {update_time / updates * 1e6:6.2f} us/update  "
+          f"estimates {estimate_time / estimates * 1e6:6.2f} us/arrival (both kinds)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""Write the app from 18_Final_bootstrap.sh out as a local, importable package.
+
+The bootstrap is the single source of the app: every file it writes with a
+heredoc (app.py, its modules, templates and static files) is copied as-is
+into the output directory, as are the modules it copies from the repository
+(triage_queue.py), together with schema.sql (its MySQL table setup, in
+order) and an __init__.py exposing create_app. The result runs the same
+way it does on EC2, against a local MySQL, for example in a container:
+
+    docker run -d --name hospital-mysql -p 3306:3306 -e MYSQL_ROOT_PASSWORD=root \\
+        -e MYSQL_DATABASE=hospital_queue -e MYSQL_USER=hospital_user \\
+        -e MYSQL_PASSWORD=local mysql:8.0
+    python build_app.py --out build/hospital_queue --init-db
+    cd build/hospital_queue && DB_HOST=127.0.0.1 DB_PASSWORD=local gunicorn app:app
+
+or in-process:
+
+    sys.path.insert(0, 'build'); import hospital_queue
+    app = hospital_queue.create_app({'DB_HOST': '127.0.0.1', 'DB_PASSWORD': 'local'})
+
+--init-db connects with the app's own settings (DB_HOST, DB_PORT, DB_USER,
+DB_PASSWORD, DB_NAME from the environment), runs schema.sql, migrations.py
+and then slot_inventory.py, like the bootstrap does.
+"""
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import sys
+
+BOOTSTRAP = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'architecture', '18_Final_bootstrap.sh')
+APP_HOME = '/home/ubuntu/hospital_queue/'
+# Copied in by the bootstrap from the checkout: app file -> repository path
+SHARED_MODULES = {'triage_queue.py': os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                                                  'triage_queue.py')}
+
+FILE_HEREDOC = re.compile(r"^cat << '?EOF'? > (\S+)$")
+SCHEMA_HEREDOC = re.compile(r"^sudo mysql hospital_queue << '?EOF'?$")
+
+PACKAGE_INIT = '''"""Hospital queue app, written out from 18_Final_bootstrap.sh by build_app.py.
+
+The modules import each other by top-level name, as they do on EC2, so this
+directory goes on sys.path first.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import Config, create_app  # noqa: E402
+'''
+
+
+def extract(bootstrap, out):
+    """Write the bootstrap's files into ``out`` (replacing it); returns their paths."""
+    with open(bootstrap) as f:
+        lines = f.read().split('\n')
+    files = {}
+    schema = []
+    i = 0
+    while i < len(lines):
+        file_match = FILE_HEREDOC.match(lines[i])
+        if file_match or SCHEMA_HEREDOC.match(lines[i]):
+            end = lines.index('EOF', i + 1)
+            body = '\n'.join(lines[i + 1:end]) + '\n'
+            if file_match:
+                # A file written twice ends up with its last content, as on EC2
+                files[file_match.group(1).replace(APP_HOME, '')] = body
+            else:
+                schema.append(body)
+            i = end
+        i += 1
+    if 'app.py' not in files:
+        sys.exit(f"No app.py heredoc found in {bootstrap}")
+
+    for path, source in SHARED_MODULES.items():
+        with open(source) as f:
+            files[path] = f.read()
+    files['schema.sql'] = '\n'.join(schema)
+    files['__init__.py'] = PACKAGE_INIT
+    shutil.rmtree(out, ignore_errors=True)
+    for path, body in files.items():
+        dest = os.path.join(out, path)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        with open(dest, 'w') as f:
+            f.write(body)
+    return sorted(files)
+
+
+def init_db(app_dir):
+    """Create the tables, apply the migrations and generate the time slots,
+    using the app's DB_* settings."""
+    import pymysql
+    from pymysql.constants import CLIENT
+
+    with open(os.path.join(app_dir, 'schema.sql')) as f:
+        schema = f.read()
+    connection = pymysql.connect(host=os.environ.get('DB_HOST', 'localhost'),
+                                 port=int(os.environ.get('DB_PORT', 3306)),
+                                 user=os.environ.get('DB_USER', 'hospital_user'),
+                                 password=os.environ.get('DB_PASSWORD'),
+                                 db=os.environ.get('DB_NAME', 'hospital_queue'),
+                                 client_flag=CLIENT.MULTI_STATEMENTS)
+    with connection:
+        with connection.cursor() as cursor:
+            cursor.execute(schema)
+            while cursor.nextset():
+                pass
+        connection.commit()
+    subprocess.run([sys.executable, 'migrations.py'], cwd=app_dir, check=True)
+    subprocess.run([sys.executable, 'slot_inventory.py'], cwd=app_dir, check=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bootstrap', default=BOOTSTRAP)
+    parser.add_argument('--out', default=os.path.join('build', 'hospital_queue'))
+    parser.add_argument('--init-db', action='store_true',
+                        help='create the tables, run the migrations and generate the time slots')
+    args = parser.parse_args()
+
+    paths = extract(args.bootstrap, args.out)
+    print(f"Wrote {len(paths)} files to {args.out}")
+    if args.init_db:
+        init_db(args.out)
+
+
+if __name__ == '__main__':
+    main()
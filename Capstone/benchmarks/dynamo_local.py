@@ -0,0 +1,60 @@
+"""DynamoDB Local setup shared by the Lambda benchmarks.
+
+The Lambdas create their boto3 resources at import time, so call
+use_local_dynamodb() before importing them. It points boto3 at DynamoDB Local
+(http://localhost:8000 unless AWS_ENDPOINT_URL_DYNAMODB says otherwise), for
+example one started with:
+
+    docker run -p 8000:8000 amazon/dynamodb-local
+"""
+import os
+import sys
+
+LAMBDA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def use_local_dynamodb():
+    os.environ.setdefault('AWS_ENDPOINT_URL_DYNAMODB', 'http://localhost:8000')
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'local')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'local')
+    if LAMBDA_DIR not in sys.path:
+        sys.path.insert(0, LAMBDA_DIR)
+
+
+def create_tables(dynamodb, queue_table='HospitalQueue', counter_table='HospitalQueueLength'):
+    """(Re)create the registration table with HospitalIndex and HospitalDayIndex, and the
+    counter table (one item per HospitalDay)."""
+    drop_tables(dynamodb, queue_table, counter_table)
+    dynamodb.create_table(
+        TableName=queue_table,
+        KeySchema=[{'AttributeName': 'UserId', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'UserId', 'AttributeType': 'S'},
+                              {'AttributeName': 'Hospital', 'AttributeType': 'S'},
+                              {'AttributeName': 'HospitalDay', 'AttributeType': 'S'},
+                              {'AttributeName': 'Timestamp', 'AttributeType': 'S'}],
+        GlobalSecondaryIndexes=[{'IndexName': 'HospitalIndex',
+                                 'KeySchema': [{'AttributeName': 'Hospital', 'KeyType': 'HASH'}],
+                                 'Projection': {'ProjectionType': 'ALL'}},
+                                # Sparse: only registrations not checked out yet
+                                {'IndexName': 'HospitalDayIndex',
+                                 'KeySchema': [{'AttributeName': 'HospitalDay', 'KeyType': 'HASH'},
+                                               {'AttributeName': 'Timestamp', 'KeyType': 'RANGE'}],
+                                 'Projection': {'ProjectionType': 'INCLUDE',
+                                                'NonKeyAttributes': ['Severity']}}],
+        BillingMode='PAY_PER_REQUEST')
+    dynamodb.create_table(
+        TableName=counter_table,
+        KeySchema=[{'AttributeName': 'HospitalDay', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'HospitalDay', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST')
+    for name in (queue_table, counter_table):
+        dynamodb.Table(name).wait_until_exists()
+
+
+def drop_tables(dynamodb, *names):
+    existing = {table.name for table in dynamodb.tables.all()}
+    for name in names:
+        if name in existing:
+            dynamodb.Table(name).delete()
+            dynamodb.Table(name).wait_until_not_exists()
@@ -0,0 +1,319 @@
+"""Scripted load against the hospital queue app: throughput and latency per route.
+
+Virtual users, each with its own cookie session and seeded random choices,
+loop over weighted scenarios until the time is up:
+
+  intake     home page, registration form, /submit with one of the offered
+             slots, then the patient's /queue_info
+  desk       /triage for a hospital, then check in, mark paid and check out
+             the most urgent patient
+  dashboard  the first /patients page for a hospital and /check_queues
+
+and the report gives requests, errors, throughput and p50/p95/p99 latency
+for each route. --save keeps the report as JSON (with the git commit), and
+--compare prints the change against a saved one, so runs can be compared
+between commits.
+
+Targets a running app (--url), or starts one: --app-dir runs a directory
+written by build_app.py the way the bootstrap serves it (Gunicorn gthread
+workers, or Uvicorn with --serving-mode async), with api_stub.py in place of
+API_ENDPOINT. MySQL settings come from the usual DB_* variables, e.g. for
+the container in build_app.py:
+
+    python build_app.py --out build/hospital_queue --init-db
+    DB_HOST=127.0.0.1 DB_PASSWORD=local python loadtest.py --app-dir build/hospital_queue \\
+        --mix mixed --users 50 --duration 60 --save results
+    ... (another commit) ...
+    DB_HOST=127.0.0.1 DB_PASSWORD=local python loadtest.py --app-dir build/hospital_queue \\
+        --mix mixed --users 50 --duration 60 --compare results/<earlier run>.json
+
+Registrations are made at Hospital A to C and stay in the database; the
+started app gets MAX_QUEUE_LENGTH and SLOT_CAPACITY high enough not to turn
+them away.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime
+
+import requests
+
+from api_stub import StandIn
+
+HOSPITALS = ['Hospital A', 'Hospital B', 'Hospital C']
+SYMPTOMS = ['cough', 'sore throat', 'fever and headache', 'sprained ankle', 'rash',
+            'chest pain', 'shortness of breath', 'deep cut on the hand', 'back pain', 'earache']
+SLOT_OPTION = re.compile(r'<option value="(\d+)">')
+
+MIXES = {
+    'intake': {'intake': 1},
+    'desk': {'desk': 1},
+    'dashboard': {'dashboard': 1},
+    'mixed': {'intake': 3, 'desk': 2, 'dashboard': 5},
+}
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)  # route -> seconds
+        self.errors = defaultdict(int)
+        self.recording = False
+
+    def add(self, route, seconds, ok):
+        if not self.recording:
+            return
+        with self.lock:
+            self.latencies[route].append(seconds)
+            if not ok:
+                self.errors[route] += 1
+
+
+class VirtualUser:
+    def __init__(self, base_url, seed, recorder):
+        self.base_url = base_url
+        self.rng = random.Random(seed)
+        self.recorder = recorder
+        self.session = requests.Session()
+
+    def request(self, method, route, path, ok=None, **kwargs):
+        """Time one request; ``route`` is the report label. Returns the response or None."""
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, allow_redirects=False,
+                                            timeout=30, **kwargs)
+        except requests.RequestException:
+            self.recorder.add(route, time.perf_counter() - start, False)
+            return None
+        elapsed = time.perf_counter() - start
+        good = ok(response) if ok else response.status_code < 400
+        self.recorder.add(route, elapsed, good)
+        return response if good else None
+
+    def intake(self):
+        hospital = self.rng.choice(HOSPITALS)
+        self.request('GET', 'GET /', '/')
+        page = self.request('GET', 'GET /form/<hospital>', f'/form/{hospital}')
+        slots = SLOT_OPTION.findall(page.text) if page is not None else []
+        if not slots:
+            return
+        form = {
+            'hospital': hospital, 'name': 'Load', 'lastName': f'Test {self.rng.randrange(10 ** 6)}',
+            'dob': f'{self.rng.randint(1940, 2020)}-{self.rng.randint(1, 12):02d}-{self.rng.randint(1, 28):02d}',
+            'symptoms': self.rng.choice(SYMPTOMS), 'emergency_contact_name': 'Contact',
+            'emergency_contact_phone': f'514555{self.rng.randrange(10 ** 4):04d}',
+            'payment_method': self.rng.choice(['cash', 'credit_card', 'insurance']),
+            'appointment_type': self.rng.choice(['consultation'] * 6 + ['follow-up'] * 3 + ['emergency']),
+            'time_slot': self.rng.choice(slots),
+        }
+        # A registration redirects to the patient list; anything else is a rejection
+        registered = self.request('POST', 'POST /submit', '/submit', data=form,
+                                  ok=lambda r: r.status_code == 302 and r.headers['Location'].endswith('/patients'))
+        if registered is not None:
+            self.request('GET', 'GET /queue_info', '/queue_info', ok=lambda r: r.status_code == 200)
+
+    def desk(self):
+        hospital = self.rng.choice(HOSPITALS)
+        queue = self.request('GET', 'GET /triage/<hospital>', f'/triage/{hospital}')
+        waiting = [p for p in queue.json() if p['status'] == 'in_queue'] if queue is not None else []
+        if not waiting:
+            return
+        # Several desks work the same queue, so take one of the most urgent few
+        patient_id = self.rng.choice(waiting[:3])['id']
+        for route, path, data in (
+                ('POST /update_status/<id>', f'/update_status/{patient_id}', {'status': 'checked_in'}),
+                ('POST /update_payment_status/<id>', f'/update_payment_status/{patient_id}',
+                 {'payment_status': 'completed'}),
+                ('POST /update_status/<id>', f'/update_status/{patient_id}', {'status': 'checked_out'})):
+            if self.request('POST', route, path, data=data) is None:
+                return
+
+    def dashboard(self):
+        hospital = self.rng.choice(HOSPITALS)
+        # /patients redirects home when the query fails
+        self.request('GET', 'GET /patients', '/patients', ok=lambda r: r.status_code == 200,
+                     params={'hospital': hospital, 'date': date.today().isoformat()})
+        self.request('GET', 'GET /check_queues', '/check_queues')
+
+    def run(self, mix, think, stop):
+        scenarios = [getattr(self, name) for name in mix]
+        weights = list(mix.values())
+        while not stop.is_set():
+            self.rng.choices(scenarios, weights)[0]()
+            if think:
+                stop.wait(self.rng.expovariate(1 / think))
+
+
+def percentile(values, pct):
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def summarize(recorder, seconds):
+    routes = {}
+    for route, latencies in sorted(recorder.latencies.items()):
+        ms = sorted(x * 1000 for x in latencies)
+        routes[route] = {
+            'requests': len(ms), 'errors': recorder.errors[route],
+            'rps': round(len(ms) / seconds, 2),
+            'p50_ms': round(percentile(ms, 50), 2), 'p95_ms': round(percentile(ms, 95), 2),
+            'p99_ms': round(percentile(ms, 99), 2),
+        }
+    total = sum(r['requests'] for r in routes.values())
+    return routes, {'requests': total, 'errors': sum(r['errors'] for r in routes.values()),
+                    'rps': round(total / seconds, 2)}
+
+
+def print_report(routes, total, baseline=None):
+    print(f"{'route':34} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for route, r in routes.items():
+        line = (f"{route:34} {r['requests']:8} {r['errors']:6} {r['rps']:8.1f} "
+                f"{r['p50_ms']:8.1f} {r['p95_ms']:8.1f} {r['p99_ms']:8.1f}")
+        before = (baseline or {}).get('routes', {}).get(route)
+        if before:
+            line += (f"   req/s {change(before['rps'], r['rps'])}  p95 {change(before['p95_ms'], r['p95_ms'])}"
+                     f"  p99 {change(before['p99_ms'], r['p99_ms'])}")
+        print(line)
+    line = f"{'total':34} {total['requests']:8} {total['errors']:6} {total['rps']:8.1f}"
+    if baseline:
+        line += f"{'':27}   req/s {change(baseline['total']['rps'], total['rps'])}"
+    print(line)
+
+
+def change(before, after):
+    return f"{(after - before) / before * 100:+6.1f}%" if before else '    n/a'
+
+
+def git_commit():
+    try:
+        head = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True,
+                               text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+        return head + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def server_command(mode, workers, threads):
+    """How the bootstrap serves the app in SERVING_MODE ``mode``; {port} is filled in later."""
+    if mode == 'async':
+        return ['uvicorn', '--workers', str(workers), '--host', '127.0.0.1', '--port', '{port}',
+                '--log-level', 'warning', 'asgi:app'], {'WSGI_THREADS': str(threads)}
+    return ['gunicorn', '--workers', str(workers), '--worker-class', 'gthread', '--threads', str(threads),
+            '--bind', '127.0.0.1:{port}', 'app:app'], {}
+
+
+def start_app(app_dir, command, api_url, env=None):
+    """Run ``command`` (see server_command) in ``app_dir``; returns (process, base URL)."""
+    port = free_port()
+    env = dict(os.environ, API_ENDPOINT=api_url, SECRET_KEY='loadtest',
+               MAX_QUEUE_LENGTH='1000000', SLOT_CAPACITY='1000000',
+               LOG_FILE=os.path.join(os.path.abspath(app_dir), 'app.log'), **(env or {}))
+    process = subprocess.Popen([sys.executable, '-m'] + [arg.format(port=port) for arg in command],
+                               cwd=app_dir, env=env)
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"{command[0]} exited with status {process.returncode}")
+        try:
+            if requests.get(url + '/', timeout=1).status_code == 200:
+                return process, url
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    sys.exit("The app did not start within 30 seconds")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:8000', help='a running app (ignored with --app-dir)')
+    parser.add_argument('--app-dir', help='start the app written by build_app.py from this directory')
+    parser.add_argument('--serving-mode', choices=['sync', 'async'], default='sync',
+                        help="the bootstrap's SERVING_MODE, for --app-dir")
+    parser.add_argument('--workers', type=int, default=3, help='workers for --app-dir')
+    parser.add_argument('--threads', type=int, default=100, help='threads per worker for --app-dir')
+    parser.add_argument('--api-delay', type=float, default=20, help='api_stub latency per call, in ms')
+    parser.add_argument('--mix', choices=sorted(MIXES), default='mixed')
+    parser.add_argument('--users', type=int, default=20, help='concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=30, help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=5, help='seconds of load before measuring')
+    parser.add_argument('--think', type=float, default=0, help='mean pause between scenarios, in seconds')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--save', metavar='DIR', help='write the report to DIR as JSON')
+    parser.add_argument('--compare', metavar='FILE', help='a report saved with --save to compare against')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    process = stub = None
+    url = args.url
+    if args.app_dir:
+        stub = StandIn(delay=args.api_delay / 1000).start()
+        command, env = server_command(args.serving_mode, args.workers, args.threads)
+        process, url = start_app(args.app_dir, command, stub.url, env)
+
+    recorder = Recorder()
+    stop = threading.Event()
+    mix = MIXES[args.mix]
+    users = [threading.Thread(target=VirtualUser(url, f'{args.seed}-{i}', recorder).run,
+                              args=(mix, args.think, stop), daemon=True)
+             for i in range(args.users)]
+    try:
+        for user in users:
+            user.start()
+        time.sleep(args.warmup)
+        recorder.recording = True
+        time.sleep(args.duration)
+        recorder.recording = False
+        stop.set()
+        for user in users:
+            user.join(timeout=35)
+    finally:
+        stop.set()
+        if process is not None:
+            process.terminate()
+            process.wait()
+        if stub is not None:
+            stub.shutdown()
+
+    routes, total = summarize(recorder, args.duration)
+    print(f"{args.mix} mix, {args.users} users, {args.duration:g} s against {url}")
+    print_report(routes, total, baseline)
+
+    if args.save:
+        os.makedirs(args.save, exist_ok=True)
+        commit = git_commit()
+        report = {
+            'commit': commit, 'started': datetime.now().isoformat(timespec='seconds'),
+            'settings': {key: getattr(args, key) for key in
+                         ('mix', 'users', 'duration', 'warmup', 'think', 'seed', 'serving_mode', 'workers',
+                          'threads', 'api_delay')},
+            'routes': routes, 'total': total,
+        }
+        path = os.path.join(args.save, f"{datetime.now():%Y%m%d-%H%M%S}-{commit}-{args.mix}.json")
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""Synthetic patient history shared by the benchmark and audit scripts.
+
+All rows belong to hospitals whose names start with a caller-chosen prefix,
+so they can be removed again without touching real data.
+"""
+import random
+from datetime import date, datetime, timedelta
+
+SLOT_TIMES = ['18:00', '18:30', '19:00', '19:30', '20:00', '20:30', '21:00', '21:30', '22:00']
+
+
+def execute(get_connection, sql, params=(), many=False):
+    with get_connection() as connection:
+        with connection.cursor() as cursor:
+            if many:
+                cursor.executemany(sql, params)
+            else:
+                cursor.execute(sql, params)
+            row_id = cursor.lastrowid
+        connection.commit()
+    return row_id
+
+
+def seed_history(get_connection, prefix, patients, hospitals=20, days=365, with_slots=True):
+    """Insert ``patients`` rows spread over ``hospitals`` and the last ``days`` days."""
+    random.seed(42)
+    names = [f'{prefix} {i}' for i in range(hospitals)]
+    today = date.today()
+    if with_slots:
+        print(f"Seeding {hospitals * days * len(SLOT_TIMES)} time slots...")
+        execute(get_connection,
+                "INSERT INTO time_slots (slot_time, date, hospital, booked) VALUES (%s, %s, %s, %s)",
+                [(t, today - timedelta(days=d), h, random.randint(0, 10))
+                 for h in names for d in range(days) for t in SLOT_TIMES], many=True)
+
+    print(f"Seeding {patients} patients...")
+    statuses = ['checked_out'] * 8 + ['in_queue', 'checked_in']
+    batch = []
+    counters = {}
+    for i in range(patients):
+        hospital = random.choice(names)
+        day = today - timedelta(days=random.randrange(days))
+        counters[hospital, day] = queue_number = counters.get((hospital, day), 0) + 1
+        created_at = datetime.combine(day, datetime.min.time()) + timedelta(seconds=random.randrange(86400))
+        batch.append(('Seed', 'Patient', '1980-01-01', hospital, 'seeded', created_at, queue_number,
+                      random.choice(statuses), random.choice(['cash', 'credit_card', 'insurance']),
+                      random.choice(['consultation', 'follow-up', 'emergency'])))
+        if len(batch) == 10000 or i == patients - 1:
+            execute(get_connection,
+                    """INSERT INTO patients (name, last_name, dob, hospital, symptoms, created_at,
+                                             queue_number, status, payment_method, appointment_type)
+                       VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""", batch, many=True)
+            batch = []
+    execute(get_connection, "ANALYZE TABLE patients, time_slots")
+    return names
+
+
+def delete_hospitals(get_connection, prefix):
+    """Delete every row belonging to hospitals named ``prefix...``, in chunks."""
+    for table in ('patients', 'time_slots', 'queue_counters', 'queue_events'):
+        while True:
+            with get_connection() as connection:
+                with connection.cursor() as cursor:
+                    deleted = cursor.execute(f"DELETE FROM {table} WHERE hospital LIKE %s LIMIT 50000",
+                                             (f'{prefix}%',))
+                connection.commit()
+            if deleted == 0:
+                break
+    # Queued API calls carry the hospital in their payload.
+    execute(get_connection, "DELETE FROM outbox WHERE payload->>'$.hospital' LIKE %s", (f'{prefix}%',))
@@ -0,0 +1,202 @@
+"""Priority-aware triage queue shared by the registration Lambda and the web app.
+
+Patients are ordered by severity (highest first), then by arrival. The queue
+is an indexable skip list: every link also stores how many positions it
+skips, so add, remove, reprioritize and rank lookups all take O(log n)
+expected time, where a sorted list would need O(n) for each.
+
+18_Final_bootstrap.sh copies this file into the web app.
+"""
+import math
+import random
+
+MAX_LEVEL = 24  # enough for millions of patients
+
+# Highest matching score wins; anything else is routine (1).
+SEVERITY_KEYWORDS = {
+    'emergency': 5, 'unconscious': 5, 'chest pain': 5, 'stroke': 5,
+    'breathing': 4, 'bleeding': 4, 'seizure': 4,
+    'fracture': 3, 'burn': 3, 'head injury': 3,
+    'fever': 2, 'vomiting': 2, 'pain': 2,
+}
+MAX_SEVERITY = max(SEVERITY_KEYWORDS.values())
+
+
+def severity_score(symptoms, appointment_type=None):
+    """Score free-text symptoms from 1 (routine) to MAX_SEVERITY."""
+    if appointment_type == 'emergency':
+        return MAX_SEVERITY
+    text = (symptoms or '').lower()
+    return max([score for keyword, score in SEVERITY_KEYWORDS.items() if keyword in text], default=1)
+
+
+class _Node:
+    __slots__ = ('key', 'next', 'width')
+
+    def __init__(self, key, level):
+        self.key = key
+        self.next = [None] * level
+        self.width = [1] * level
+
+
+class _End:
+    """Sorts after every key, so searches stop at the end of each level."""
+
+    def __lt__(self, other):
+        return False
+
+    def __gt__(self, other):
+        return True
+
+    __le__ = __lt__
+    __ge__ = __gt__
+
+
+class TriageQueue:
+    """Patients in triage order: highest severity first, then earliest arrival.
+
+    ``arrival`` can be anything that orders consistently (a timestamp, an ISO
+    string, a queue number); patient ids break ties and must be orderable.
+    """
+
+    def __init__(self, seed=None):
+        self._random = random.Random(seed)
+        self._end = _Node(_End(), 0)
+        self._head = _Node(None, MAX_LEVEL)
+        self._head.next = [self._end] * MAX_LEVEL
+        self._levels = 1  # levels in use; searches skip the empty ones above
+        self._entries = {}  # patient_id -> (severity, arrival)
+
+    @classmethod
+    def from_items(cls, items, seed=None):
+        """Build a queue from (patient_id, severity, arrival) tuples."""
+        queue = cls(seed)
+        for patient_id, severity, arrival in items:
+            queue.add(patient_id, severity, arrival)
+        return queue
+
+    @staticmethod
+    def _key(patient_id, severity, arrival):
+        return (-severity, arrival, patient_id)
+
+    def _key_of(self, patient_id):
+        severity, arrival = self._entries[patient_id]
+        return self._key(patient_id, severity, arrival)
+
+    def _insert(self, key):
+        height = min(MAX_LEVEL, 1 - int(math.log(1 - self._random.random(), 2)))
+        if height > self._levels:
+            # Open the new levels: the head links straight to the end, which is
+            # len(self) positions away now that the new key is counted.
+            for level in range(self._levels, height):
+                self._head.width[level] = len(self)
+            self._levels = height
+
+        chain = [self._head] * self._levels
+        steps_at_level = [0] * self._levels
+        node = self._head
+        for level in reversed(range(self._levels)):
+            while node.next[level].key <= key:
+                steps_at_level[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+
+        new = _Node(key, height)
+        steps = 0
+        for level in range(height):
+            previous = chain[level]
+            new.next[level] = previous.next[level]
+            previous.next[level] = new
+            new.width[level] = previous.width[level] - steps
+            previous.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(height, self._levels):
+            chain[level].width[level] += 1
+
+    def _delete(self, key):
+        chain = [None] * self._levels
+        node = self._head
+        for level in reversed(range(self._levels)):
+            while node.next[level].key < key:
+                node = node.next[level]
+            chain[level] = node
+        target = chain[0].next[0]
+        for level in range(len(target.next)):
+            previous = chain[level]
+            previous.width[level] += target.width[level] - 1
+            previous.next[level] = target.next[level]
+        for level in range(len(target.next), self._levels):
+            chain[level].width[level] -= 1
+
+    def add(self, patient_id, severity, arrival):
+        if patient_id in self._entries:
+            raise KeyError(f"Patient {patient_id} is already queued")
+        self._entries[patient_id] = (severity, arrival)
+        self._insert(self._key(patient_id, severity, arrival))
+
+    def remove(self, patient_id):
+        """Remove a patient (checked in, left); returns their (severity, arrival)."""
+        self._delete(self._key_of(patient_id))
+        return self._entries.pop(patient_id)
+
+    def reprioritize(self, patient_id, severity):
+        """Change a patient's severity, keeping their arrival time."""
+        _, arrival = self.remove(patient_id)
+        self.add(patient_id, severity, arrival)
+
+    def rank(self, patient_id):
+        """1-based position of the patient in triage order."""
+        return self._position(self._key_of(patient_id))
+
+    def position(self, patient_id, severity, arrival):
+        """1-based position a patient not queued yet would take if added now."""
+        return self._position(self._key(patient_id, severity, arrival))
+
+    def _position(self, key):
+        position = 0
+        node = self._head
+        for level in reversed(range(self._levels)):
+            while node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+        return position + 1
+
+    def at(self, index):
+        """Patient id at 0-based ``index`` in triage order."""
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        index += 1
+        node = self._head
+        for level in reversed(range(self._levels)):
+            while node.width[level] <= index:
+                index -= node.width[level]
+                node = node.next[level]
+        return node.key[2]
+
+    def peek(self):
+        if not self._entries:
+            raise IndexError("Triage queue is empty")
+        return self._head.next[0].key[2]
+
+    def pop(self):
+        """Remove and return the next patient to be seen."""
+        patient_id = self.peek()
+        self.remove(patient_id)
+        return patient_id
+
+    def items(self):
+        """(patient_id, severity, arrival) tuples in triage order, for persisting."""
+        for patient_id in self:
+            yield (patient_id,) + self._entries[patient_id]
+
+    def __iter__(self):
+        node = self._head.next[0]
+        while node is not self._end:
+            yield node.key[2]
+            node = node.next[0]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, patient_id):
+        return patient_id in self._entries
@@ -0,0 +1,82 @@
+"""Per-invocation latency and GCS calls of create_bucket_and_upload, cold and warm.
+
+Runs cloud_function_create_bucket.py against gcs_stub.py (in-process, every
+call delayed by --delay ms to stand in for the round trip to GCS),
+--invocations times per variant:
+
+  old   a storage.Client built, exists(), data.txt written to a temporary
+        file and uploaded with upload_from_filename on every invocation
+        (the code before it was changed)
+  cold  the first invocation on a new instance: module-level client, bucket
+        created (or found to exist) once
+  warm  every later invocation on that instance: known bucket, upload with
+        if_generation_match=0 turned away because data.txt is there
+
+Needs google-cloud-storage:
+
+    python bench_create_bucket.py --delay 10 --invocations 200
+"""
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import tempfile
+import time
+
+from bench_face_upload import ROOT, load_function
+from gcs_stub import GCSStandIn
+
+
+def old_invocation(function):
+    client = function.storage.Client()
+    bucket_name = function.BUCKET_NAME
+    if not client.bucket(bucket_name).exists():
+        client.bucket(bucket_name).create()
+    path = os.path.join(tempfile.gettempdir(), 'data.txt')
+    with open(path, 'w') as f:
+        f.write(function.DATA)
+    client.bucket(bucket_name).blob('data.txt').upload_from_filename(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--invocations', type=int, default=200, help='invocations per variant')
+    parser.add_argument('--delay', type=float, default=10, help='GCS round trip, in ms')
+    args = parser.parse_args()
+
+    stub = GCSStandIn(delay=args.delay / 1000).start()
+    path = os.path.join(ROOT, 'cloud_function_create_bucket.py')
+    function = load_function(path, stub.url)
+
+    def new_instance():
+        # What a cold start runs: the module, client included, then the first invocation
+        instance = load_function(path, stub.url)
+        instance.create_bucket_and_upload({}, None)
+
+    variants = {
+        'old': lambda: old_invocation(function),
+        'cold': new_instance,
+        'warm': lambda: function.create_bucket_and_upload({}, None),
+    }
+    print(f"GCS round trip {args.delay:g} ms, {args.invocations} invocations each")
+    print(f"{'variant':8} {'p50 ms':>8} {'p95 ms':>8} {'calls/invocation':>16}")
+    for name, invoke in variants.items():
+        stub.clear(function.BUCKET_NAME)
+        with contextlib.redirect_stdout(io.StringIO()):  # the function's own prints
+            invoke()  # the bucket and data.txt exist from here on, as in steady state
+        stub.reset_counters()
+        latencies = []
+        for _ in range(args.invocations):
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                invoke()
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        print(f"{name:8} {statistics.median(latencies) * 1000:8.2f} "
+              f"{latencies[int(len(latencies) * 0.95)] * 1000:8.2f} "
+              f"{sum(stub.calls.values()) / args.invocations:16.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Backfill throughput of cloud_function_vision-v1.py against worker count, rate limiting and resume.
+
+Puts --images images (and a few non-image objects, which are skipped)
+under a prefix in a bucket on gcs_stub.py, then runs backfill() over it
+against vision_stub.py (in-process; every GCS call delayed by --gcs-delay
+ms and every Vision request by --rpc-delay ms):
+
+  workers N   the whole prefix, N images at a time, once per --workers value
+  rate R      --rate-workers workers limited to --rate images a second
+  resume      half the images (limit), then the rest from the checkpoint
+              file: every image must be sent to Vision exactly once
+
+The results bucket is emptied before each run, so nothing is skipped as
+already analysed. Needs google-cloud-storage and google-cloud-vision:
+
+    python bench_face_backfill.py --images 400 --workers 1 2 4 8 16 32
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+
+from bench_face_upload import ROOT, SOURCE_BUCKET, load_function
+from gcs_stub import GCSStandIn
+from vision_stub import VisionStandIn
+
+PREFIX = 'backfill/'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--images', type=int, default=400)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument('--rate', type=float, default=50, help='images a second for the rate-limited run')
+    parser.add_argument('--rate-workers', type=int, default=16)
+    parser.add_argument('--gcs-delay', type=float, default=10, help='GCS round trip, in ms')
+    parser.add_argument('--rpc-delay', type=float, default=100, help='Vision request latency, in ms')
+    args = parser.parse_args()
+
+    gcs = GCSStandIn(delay=args.gcs_delay / 1000).start()
+    vision_api = VisionStandIn(args.rpc_delay / 1000).start()
+    function = load_function(os.path.join(ROOT, 'cloud_function_vision-v1.py'), gcs.url)
+    from google.auth.credentials import AnonymousCredentials
+    function.vision_client = function.vision.ImageAnnotatorClient(
+        transport='rest', credentials=AnonymousCredentials(), client_options={'api_endpoint': vision_api.url})
+    for i in range(args.images):
+        gcs.store(SOURCE_BUCKET, f'{PREFIX}photo-{i:05d}.jpg', f'jpeg bytes of image {i}'.encode(), 'image/jpeg')
+    for i in range(0, args.images, 50):
+        gcs.store(SOURCE_BUCKET, f'{PREFIX}photo-{i:05d}.txt', b'notes', 'text/plain')
+    gcs.add_bucket(function.RESULTS_BUCKET)
+
+    def run(**kwargs):
+        function.known_results.clear()
+        gcs.clear(function.RESULTS_BUCKET)
+        vision_api.reset_counters()
+        with contextlib.redirect_stdout(io.StringIO()):  # the function's own prints
+            return function.backfill(SOURCE_BUCKET, PREFIX, **kwargs)
+
+    print(f"{args.images} images; GCS {args.gcs_delay:g} ms, Vision {args.rpc_delay:g} ms")
+    print(f"{'run':12} {'images/s':>9} {'speedup':>8} {'Vision calls':>12} {'failed':>7}")
+    base = None
+    for workers in args.workers:
+        done = run(workers=workers)
+        rate = done['images'] / done['seconds']
+        base = base or rate
+        print(f"{f'workers {workers}':12} {rate:9.1f} {rate / base:7.1f}x {vision_api.images:12} {done['failed']:7}")
+
+    done = run(workers=args.rate_workers, rate=args.rate)
+    print(f"{f'rate {args.rate:g}':12} {done['images'] / done['seconds']:9.1f} {'':8} {vision_api.images:12} "
+          f"{done['failed']:7}")
+
+    checkpoint = os.path.join(tempfile.mkdtemp(), 'backfill.json')
+    first = run(workers=8, checkpoint=checkpoint, limit=args.images // 2)
+    first_calls = vision_api.images
+    vision_api.reset_counters()
+    with contextlib.redirect_stdout(io.StringIO()):
+        second = function.backfill(SOURCE_BUCKET, PREFIX, workers=8, checkpoint=checkpoint)
+    calls = first_calls + vision_api.images
+    print(f"{'resume':12} {first['images']} then {second['images']} images, {calls} Vision calls "
+          f"({'each image once' if calls == args.images else f'expected {args.images}'})")
+
+
+if __name__ == '__main__':
+    main()
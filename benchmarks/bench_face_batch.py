@@ -0,0 +1,111 @@
+"""Throughput and cost per image of face detection, one event per image against batch mode.
+
+Puts --images images in a source bucket on gcs_stub.py and runs face
+detection over all of them against vision_stub.py (in-process; every GCS
+call delayed by --gcs-delay ms, every Vision request by --rpc-delay ms plus
+--image-delay ms per image in it):
+
+  per-image  mcitfacedetection once per image, as the storage trigger calls
+             it, --workers events at a time
+  batch      one mcitfacedetection_batch run: the images listed, sent
+             BATCH_SIZE (16) to a batch_annotate_images request, one results
+             file written per request
+
+and then a second batch run, which must find nothing left to do. Cost per
+1,000 images is estimated from the calls made, at list prices: Vision face
+detection, Cloud Functions (1st gen) invocations and 256 MB compute time
+rounded up to 100 ms per invocation, and Cloud Storage operations. Needs
+google-cloud-storage and google-cloud-vision:
+
+    python bench_face_batch.py --images 400 --gcs-delay 10 --rpc-delay 80 --image-delay 20
+"""
+import argparse
+import contextlib
+import io
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from bench_face_upload import ROOT, SOURCE_BUCKET, load_function
+from gcs_stub import GCSStandIn
+from vision_stub import VisionStandIn
+
+# USD list prices
+VISION_PER_IMAGE = 1.50 / 1000  # face detection, 1,001 to 5,000,000 units a month
+INVOCATION = 0.40 / 1e6
+COMPUTE_PER_100MS = 0.000000463  # 256 MB / 400 MHz
+CLASS_A = 0.005 / 1000  # uploads, listings
+CLASS_B = 0.0004 / 1000  # metadata reads, downloads
+
+
+def gcs_cost(calls):
+    class_a = sum(n for call, n in calls.items() if call.startswith(('upload', 'list', 'create')))
+    return class_a * CLASS_A + (sum(calls.values()) - class_a) * CLASS_B
+
+
+def per_image(function, names, workers):
+    """Busy seconds of each invocation."""
+    def event(name):
+        start = time.perf_counter()
+        function.mcitfacedetection({'bucket': SOURCE_BUCKET, 'name': name}, None)
+        return time.perf_counter() - start
+    with ThreadPoolExecutor(workers) as pool:
+        return list(pool.map(event, names))
+
+
+def batch(function):
+    start = time.perf_counter()
+    # Only .args of the flask.Request the Functions Framework passes is used
+    summary = function.mcitfacedetection_batch(SimpleNamespace(args={'bucket': SOURCE_BUCKET}))
+    return [time.perf_counter() - start], summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--images', type=int, default=400)
+    parser.add_argument('--workers', type=int, default=8, help='concurrent per-image events')
+    parser.add_argument('--gcs-delay', type=float, default=10, help='GCS round trip, in ms')
+    parser.add_argument('--rpc-delay', type=float, default=80, help='Vision request latency, in ms')
+    parser.add_argument('--image-delay', type=float, default=20, help='added Vision latency per image, in ms')
+    args = parser.parse_args()
+
+    gcs = GCSStandIn(delay=args.gcs_delay / 1000).start()
+    vision_api = VisionStandIn(args.rpc_delay / 1000, args.image_delay / 1000).start()
+    function = load_function(os.path.join(ROOT, 'cloud_function_vision-v1.py'), gcs.url)
+    from google.auth.credentials import AnonymousCredentials
+    function.vision_client = function.vision.ImageAnnotatorClient(
+        transport='rest', credentials=AnonymousCredentials(), client_options={'api_endpoint': vision_api.url})
+
+    names = [f'photo-{i:05d}.jpg' for i in range(args.images)]
+    for name in names:
+        gcs.store(SOURCE_BUCKET, name, b'\xff\xd8 not really a jpeg', 'image/jpeg')
+    gcs.add_bucket(function.RESULTS_BUCKET)
+
+    print(f"{args.images} images; GCS {args.gcs_delay:g} ms, Vision {args.rpc_delay:g} ms a request "
+          f"+ {args.image_delay:g} ms an image")
+    print(f"{'mode':16} {'images/s':>9} {'invocations':>11} {'Vision RPCs':>11} {'GCS calls':>9} "
+          f"{'USD/1000 img':>12} {'excl. Vision':>12}")
+    runs = (('per-image', lambda: (per_image(function, names, args.workers), None)),
+            ('batch', lambda: batch(function)),
+            ('batch, again', lambda: batch(function)))
+    for mode, run in runs:
+        gcs.reset_counters()
+        vision_api.reset_counters()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):  # the function's own prints
+            busy, summary = run()
+        elapsed = time.perf_counter() - start
+        if summary is not None and summary['images'] not in (args.images, 0):
+            raise SystemExit(f"{mode}: processed {summary['images']} images, expected {args.images}")
+        cost = (vision_api.images * VISION_PER_IMAGE + len(busy) * INVOCATION
+                + sum(math.ceil(seconds * 10) for seconds in busy) * COMPUTE_PER_100MS + gcs_cost(gcs.calls))
+        per_1000 = 1000 / args.images
+        print(f"{mode:16} {vision_api.images / elapsed:9.0f} {len(busy):11} {vision_api.rpcs:11} "
+              f"{sum(gcs.calls.values()):9} {cost * per_1000:12.4f} "
+              f"{(cost - vision_api.images * VISION_PER_IMAGE) * per_1000:12.4f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Vision calls avoided by mcitfacedetection's content-hash result index, on a replayed upload trace.
+
+Replays --uploads uploads against gcs_stub.py and vision_stub.py
+(in-process, every GCS call delayed by --gcs-delay ms and every Vision
+request by --rpc-delay ms). Each upload gets a new name. A --repeat share of
+them are the bytes of an earlier upload, the recent ones more often. A
+--same-name share of those repeats reuses the earlier name as well. Each
+upload is stored and then handed to mcitfacedetection with the metadata the
+storage trigger passes. The trace is replayed three times:
+
+  off   DEDUP_BY_HASH off: every upload is sent to Vision (the old behaviour)
+  warm  the index, with one instance serving the whole trace (its memory
+        cache holds every hash)
+  cold  the index, with a new instance for every upload (only the
+        hashes/ objects in the results bucket are shared)
+
+Needs google-cloud-storage and google-cloud-vision:
+
+    python bench_face_dedup.py --uploads 1000 --repeat 0.4
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import statistics
+import time
+
+from bench_face_batch import VISION_PER_IMAGE, gcs_cost
+from bench_face_upload import ROOT, SOURCE_BUCKET, load_function
+from gcs_stub import GCSStandIn
+from vision_stub import VisionStandIn
+
+
+def upload_trace(uploads, repeat, same_name, seed=7):
+    """[(name, content id)]: a new content id, or with probability ``repeat``
+    an earlier one (recent ones more likely)."""
+    rng = random.Random(seed)
+    trace = []
+    for i in range(uploads):
+        if trace and rng.random() < repeat:
+            earlier_name, content = trace[-1 - min(int(rng.expovariate(1 / 50)), len(trace) - 1)]
+            name = earlier_name if rng.random() < same_name else f'photo-{i:05d}.jpg'
+        else:
+            name, content = f'photo-{i:05d}.jpg', i
+        trace.append((name, content))
+    return trace
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--uploads', type=int, default=1000)
+    parser.add_argument('--repeat', type=float, default=0.4, help='share of uploads that repeat earlier bytes')
+    parser.add_argument('--same-name', type=float, default=0.25, help='share of repeats under the same name')
+    parser.add_argument('--gcs-delay', type=float, default=10, help='GCS round trip, in ms')
+    parser.add_argument('--rpc-delay', type=float, default=150, help='Vision request latency, in ms')
+    args = parser.parse_args()
+
+    gcs = GCSStandIn(delay=args.gcs_delay / 1000).start()
+    vision_api = VisionStandIn(args.rpc_delay / 1000).start()
+    function = load_function(os.path.join(ROOT, 'cloud_function_vision-v1.py'), gcs.url)
+    from google.auth.credentials import AnonymousCredentials
+    function.vision_client = function.vision.ImageAnnotatorClient(
+        transport='rest', credentials=AnonymousCredentials(), client_options={'api_endpoint': vision_api.url})
+    gcs.add_bucket(function.RESULTS_BUCKET)
+
+    trace = upload_trace(args.uploads, args.repeat, args.same_name)
+    repeats = args.uploads - len({content for _, content in trace})
+    print(f"{args.uploads} uploads, {repeats} of earlier bytes; GCS {args.gcs_delay:g} ms, "
+          f"Vision {args.rpc_delay:g} ms")
+    print(f"{'mode':5} {'Vision calls':>12} {'avoided':>8} {'hit rate':>8} {'p50 ms':>7} {'mean ms':>8} "
+          f"{'GCS calls':>9} {'USD/1000 uploads':>16}")
+    for mode in ('off', 'warm', 'cold'):
+        function.DEDUP_BY_HASH = mode != 'off'
+        function.known_results.clear()
+        gcs.clear(SOURCE_BUCKET)
+        gcs.clear(function.RESULTS_BUCKET)
+        gcs.reset_counters()
+        vision_api.reset_counters()
+        latencies = []
+        for name, content in trace:
+            event = gcs.store(SOURCE_BUCKET, name, f'jpeg bytes of image {content}'.encode(), 'image/jpeg')
+            if mode == 'cold':
+                function.known_results.clear()
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):  # the function's own prints
+                function.mcitfacedetection(event, None)
+            latencies.append(time.perf_counter() - start)
+        avoided = args.uploads - vision_api.rpcs
+        cost = vision_api.images * VISION_PER_IMAGE + gcs_cost(gcs.calls)
+        print(f"{mode:5} {vision_api.rpcs:12} {avoided:8} {avoided / args.uploads:8.1%} "
+              f"{statistics.median(latencies) * 1000:7.1f} {statistics.mean(latencies) * 1000:8.1f} "
+              f"{sum(gcs.calls.values()):9} {cost * 1000 / args.uploads:16.4f}")
+
+
+if __name__ == '__main__':
+    main()
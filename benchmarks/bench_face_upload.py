@@ -0,0 +1,121 @@
+"""Per-event latency and bytes written by mcitfacedetection's result upload.
+
+Runs the storage side of one mcitfacedetection event against gcs_stub.py
+(in-process, every call delayed by --delay ms to stand in for the round
+trip to GCS) for images with 0 to 100 faces, --events times each:
+
+  old  get_blob on the source image, then str(faces) written to a
+       mkstemp() file and uploaded with upload_from_filename (the code
+       before it was changed)
+  new  uploadToGCS from cloud_function_vision-v1.py: compact JSON uploaded
+       from memory
+
+The faces are synthetic FaceAnnotations with a full set of landmarks, like
+the Vision API returns; the Vision API itself is not called. Needs
+google-cloud-storage and google-cloud-vision:
+
+    python bench_face_upload.py --delay 10 --events 50
+"""
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from gcs_stub import GCSStandIn
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SOURCE_BUCKET = 'bench-source-images'
+
+
+def load_function(path, storage_url):
+    """Import a cloud function file against the stand-in. The Vision client
+    only needs credentials to be constructed: placeholder ones, never used."""
+    os.environ['STORAGE_EMULATOR_HOST'] = storage_url
+    credentials = os.path.join(tempfile.mkdtemp(), 'placeholder.json')
+    with open(credentials, 'w') as f:
+        json.dump({'type': 'authorized_user', 'client_id': 'bench', 'client_secret': 'bench',
+                   'refresh_token': 'bench'}, f)
+    os.environ.setdefault('GOOGLE_APPLICATION_CREDENTIALS', credentials)
+    spec = importlib.util.spec_from_file_location('cloud_function', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def synthetic_faces(vision, count):
+    landmark_types = list(vision.FaceAnnotation.Landmark.Type)[1:]
+    faces = []
+    for i in range(count):
+        x, y = 40 * i, 30 * i
+        box = vision.BoundingPoly(vertices=[vision.Vertex(x=x, y=y), vision.Vertex(x=x + 120, y=y),
+                                            vision.Vertex(x=x + 120, y=y + 140), vision.Vertex(x=x, y=y + 140)])
+        faces.append(vision.FaceAnnotation(
+            bounding_poly=box, fd_bounding_poly=box,
+            landmarks=[vision.FaceAnnotation.Landmark(
+                type_=kind, position=vision.Position(x=x + 3.7 * j, y=y + 2.9 * j, z=0.0013 * j))
+                for j, kind in enumerate(landmark_types)],
+            roll_angle=-4.82, pan_angle=11.37, tilt_angle=2.05,
+            detection_confidence=0.9921875, landmarking_confidence=0.5634,
+            joy_likelihood=vision.Likelihood.VERY_LIKELY, sorrow_likelihood=vision.Likelihood.VERY_UNLIKELY,
+            anger_likelihood=vision.Likelihood.VERY_UNLIKELY, surprise_likelihood=vision.Likelihood.UNLIKELY,
+            under_exposed_likelihood=vision.Likelihood.VERY_UNLIKELY,
+            blurred_likelihood=vision.Likelihood.VERY_UNLIKELY, headwear_likelihood=vision.Likelihood.POSSIBLE))
+    return faces
+
+
+def old_event(function, faces, file_name):
+    function.storage_client.bucket(SOURCE_BUCKET).get_blob(file_name)
+    if len(faces) > 0:
+        _, temp_local_filename = tempfile.mkstemp()
+        with open(temp_local_filename, 'w') as f:
+            f.write(str(faces))
+        new_blob = function.storage_client.bucket(function.RESULTS_BUCKET).blob(file_name + '-res.txt')
+        new_blob.upload_from_filename(temp_local_filename)
+        os.remove(temp_local_filename)
+
+
+def new_event(function, faces, file_name):
+    if len(faces) > 0:
+        function.uploadToGCS(faces, file_name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--faces', type=int, nargs='+', default=[0, 1, 4, 10, 50, 100])
+    parser.add_argument('--events', type=int, default=50, help='events per face count and variant')
+    parser.add_argument('--delay', type=float, default=10, help='GCS round trip, in ms')
+    args = parser.parse_args()
+
+    stub = GCSStandIn(delay=args.delay / 1000).start()
+    function = load_function(os.path.join(ROOT, 'cloud_function_vision-v1.py'), stub.url)
+    vision = function.vision
+    file_name = 'photo.jpg'
+    stub.store(SOURCE_BUCKET, file_name, b'\xff\xd8 not really a jpeg', 'image/jpeg')
+    stub.add_bucket(function.RESULTS_BUCKET)
+
+    print(f"GCS round trip {args.delay:g} ms, {args.events} events each")
+    print(f"{'faces':>5} {'variant':7} {'p50 ms':>8} {'p95 ms':>8} {'calls/event':>11} {'bytes/event':>11}")
+    for count in args.faces:
+        faces = synthetic_faces(vision, count)
+        for name, event in (('old', old_event), ('new', new_event)):
+            stub.reset_counters()
+            latencies = []
+            for _ in range(args.events):
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):  # the function's own prints
+                    event(function, faces, file_name)
+                latencies.append(time.perf_counter() - start)
+            latencies.sort()
+            calls = sum(stub.calls.values()) / args.events
+            print(f"{count:5} {name:7} {statistics.median(latencies) * 1000:8.2f} "
+                  f"{latencies[int(len(latencies) * 0.95)] * 1000:8.2f} {calls:11.1f} "
+                  f"{stub.bytes_written / args.events:11.0f}")
+
+
+if __name__ == '__main__':
+    main()
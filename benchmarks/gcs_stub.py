@@ -0,0 +1,273 @@
+"""Local stand-in for the Cloud Storage JSON API, for the cloud function benchmarks.
+
+Serves the calls google-cloud-storage makes when STORAGE_EMULATOR_HOST
+points at it: object metadata (GET, with md5Hash and crc32c), listing,
+downloads (alt=media), multipart and resumable uploads and server-side
+copies (with ifGenerationMatch), bucket metadata and creation.
+Everything is kept in memory; every call can be delayed to stand in for the
+round trip to GCS, and calls and bytes uploaded are counted. Used by the
+bench_*.py scripts next to it, or on its own:
+
+    python gcs_stub.py --port 9023 --delay 20
+    STORAGE_EMULATOR_HOST=http://127.0.0.1:9023 python ...
+"""
+import argparse
+import base64
+import email.parser
+import hashlib
+import json
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+import google_crc32c
+
+
+class GCSStandIn(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, delay=0.0, port=0):
+        super().__init__(('127.0.0.1', port), GCSHandler)
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.buckets = {}  # name -> metadata
+        self.objects = {}  # (bucket, name) -> {'data', 'generation', 'contentType', 'updated'}
+        self.uploads = {}  # upload_id -> (bucket, name, content type, bytearray, ifGenerationMatch)
+        self.calls = Counter()  # e.g. 'upload:multipart', 'get:metadata'
+        self.bytes_written = 0
+        self._generation = 0
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def start(self):
+        """Serve from a daemon thread; returns self."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def reset_counters(self):
+        with self.lock:
+            self.calls.clear()
+            self.bytes_written = 0
+
+    def add_bucket(self, name):
+        """Create a bucket unless it exists; returns True if it was created."""
+        with self.lock:
+            if name in self.buckets:
+                return False
+            self.buckets[name] = {'kind': 'storage#bucket', 'id': name, 'name': name}
+            return True
+
+    def clear(self, bucket):
+        """Delete every object in a bucket."""
+        with self.lock:
+            for key in [key for key in self.objects if key[0] == bucket]:
+                del self.objects[key]
+
+    def store(self, bucket, name, data, content_type, if_generation_match=None):
+        """Write an object (its bucket is created if needed, as if it had
+        been there all along); returns its metadata, or None if the
+        precondition failed."""
+        self.add_bucket(bucket)
+        with self.lock:
+            current = self.objects.get((bucket, name))
+            if if_generation_match is not None:
+                generation = current['generation'] if current else 0
+                if int(if_generation_match) != generation:
+                    return None
+            self._generation += 1
+            self.objects[bucket, name] = {'data': bytes(data), 'generation': self._generation,
+                                          'contentType': content_type,
+                                          'updated': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')}
+            self.bytes_written += len(data)
+        return self.metadata(bucket, name)
+
+    def metadata(self, bucket, name):
+        entry = self.objects.get((bucket, name))
+        if entry is None:
+            return None
+        return {'kind': 'storage#object', 'bucket': bucket, 'name': name, 'id': f'{bucket}/{name}',
+                'size': str(len(entry['data'])), 'generation': str(entry['generation']),
+                'metageneration': '1', 'contentType': entry['contentType'],
+                'timeCreated': entry['updated'], 'updated': entry['updated'],
+                'md5Hash': base64.b64encode(hashlib.md5(entry['data']).digest()).decode(),
+                'crc32c': base64.b64encode(google_crc32c.value(entry['data']).to_bytes(4, 'big')).decode()}
+
+    def list(self, bucket, prefix='', page_token=None, page_size=1000, start_offset=''):
+        """One page of the bucket's objects by name: (metadata list, next page token or None)."""
+        with self.lock:
+            names = sorted(name for b, name in self.objects if b == bucket and name.startswith(prefix)
+                           and name >= start_offset and (page_token is None or name > page_token))
+            page = [self.metadata(bucket, name) for name in names[:page_size]]
+        return page, (names[page_size - 1] if len(names) > page_size else None)
+
+
+class GCSHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+    disable_nagle_algorithm = True  # headers and body go out in separate writes
+
+    def route(self):
+        url = urlsplit(self.path)
+        return url.path.split('/'), {k: v[0] for k, v in parse_qs(url.query).items()}
+
+    def body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def do_GET(self):
+        server = self.server
+        parts, query = self.route()
+        time.sleep(server.delay)
+        # /storage/v1/b/<bucket>[/o/<object>], /download/storage/v1/b/<bucket>/o/<object>
+        download = parts[1] == 'download'
+        if download:
+            parts = parts[1:]
+        if parts[1:4] != ['storage', 'v1', 'b'] or len(parts) < 5:
+            return self.respond(404, {'error': {'code': 404, 'message': 'Not Found'}})
+        bucket = unquote(parts[4])
+        if len(parts) == 5:
+            with server.lock:
+                server.calls['get:bucket'] += 1
+                found = server.buckets.get(bucket)
+            return self.respond(200, found) if found else self.not_found()
+        if len(parts) == 6 and parts[5] == 'o':
+            with server.lock:
+                server.calls['list'] += 1
+                found = bucket in server.buckets
+            if not found:
+                return self.not_found()
+            items, next_page = server.list(bucket, query.get('prefix', ''), query.get('pageToken'),
+                                           int(query.get('maxResults', 1000)), query.get('startOffset', ''))
+            listing = {'kind': 'storage#objects', 'items': items}
+            if next_page:
+                listing['nextPageToken'] = next_page
+            return self.respond(200, listing)
+        name = unquote('/'.join(parts[6:]))
+        with server.lock:
+            server.calls['download' if download or query.get('alt') == 'media' else 'get:metadata'] += 1
+            entry = server.objects.get((bucket, name))
+            metadata = server.metadata(bucket, name)
+        if entry is None:
+            return self.not_found()
+        if download or query.get('alt') == 'media':
+            return self.respond_bytes(200, entry['data'], entry['contentType'],
+                                      {'x-goog-generation': str(entry['generation'])})
+        self.respond(200, metadata)
+
+    def do_POST(self):
+        server = self.server
+        parts, query = self.route()
+        body = self.body()
+        time.sleep(server.delay)
+        if parts[1:] == ['storage', 'v1', 'b']:
+            # Bucket creation
+            name = json.loads(body or b'{}')['name']
+            with server.lock:
+                server.calls['create:bucket'] += 1
+            if not server.add_bucket(name):
+                return self.respond(409, {'error': {'code': 409, 'message': 'Bucket already exists'}})
+            return self.respond(200, server.buckets[name])
+        if parts[1:4] == ['storage', 'v1', 'b'] and 'copyTo' in parts:
+            # /storage/v1/b/<bucket>/o/<object>/copyTo/b/<bucket>/o/<object>
+            at = parts.index('copyTo')
+            with server.lock:
+                server.calls['copy'] += 1
+                entry = server.objects.get((unquote(parts[4]), unquote('/'.join(parts[6:at]))))
+            if entry is None:
+                return self.not_found()
+            return self.finish_upload(unquote(parts[at + 2]), unquote('/'.join(parts[at + 4:])), entry['data'],
+                                      entry['contentType'], query.get('ifGenerationMatch'))
+        if parts[1:5] != ['upload', 'storage', 'v1', 'b']:
+            return self.respond(404, {'error': {'code': 404, 'message': 'Not Found'}})
+        bucket = unquote(parts[5])
+        kind = query.get('uploadType')
+        with server.lock:
+            server.calls[f'upload:{kind}'] += 1
+        if kind == 'multipart':
+            message = email.parser.BytesParser().parsebytes(
+                b'Content-Type: ' + self.headers['Content-Type'].encode() + b'\r\n\r\n' + body)
+            metadata_part, data_part = message.get_payload()
+            metadata = json.loads(metadata_part.get_payload(decode=True))
+            return self.finish_upload(bucket, metadata.get('name') or query.get('name'),
+                                      data_part.get_payload(decode=True),
+                                      data_part.get_content_type(), query.get('ifGenerationMatch'))
+        if kind == 'resumable':
+            metadata = json.loads(body or b'{}')
+            upload_id = uuid.uuid4().hex
+            with server.lock:
+                server.uploads[upload_id] = (bucket, metadata.get('name') or query.get('name'),
+                                             self.headers.get('X-Upload-Content-Type', 'application/octet-stream'),
+                                             bytearray(), query.get('ifGenerationMatch'))
+            location = (f"{server.url}/upload/storage/v1/b/{quote(bucket, safe='')}/o"
+                        f"?uploadType=resumable&upload_id={upload_id}")
+            return self.respond_bytes(200, b'', 'text/plain', {'Location': location})
+        self.respond(400, {'error': {'code': 400, 'message': f'Unsupported uploadType {kind}'}})
+
+    def do_PUT(self):
+        # One chunk of a resumable upload
+        server = self.server
+        _, query = self.route()
+        body = self.body()
+        time.sleep(server.delay)
+        with server.lock:
+            server.calls['upload:resumable-chunk'] += 1
+            upload = server.uploads.get(query.get('upload_id'))
+        if upload is None:
+            return self.not_found()
+        bucket, name, content_type, data, if_generation_match = upload
+        data += body
+        content_range = self.headers.get('Content-Range', '')  # bytes a-b/total or bytes */total
+        total = content_range.rsplit('/', 1)[-1]
+        if total == '*' or int(total) > len(data):
+            headers = {'Range': f'bytes=0-{len(data) - 1}'} if data else {}
+            return self.respond_bytes(308, b'', 'text/plain', headers)
+        with server.lock:
+            server.uploads.pop(query.get('upload_id'), None)
+        self.finish_upload(bucket, name, bytes(data), content_type, if_generation_match)
+
+    def finish_upload(self, bucket, name, data, content_type, if_generation_match):
+        metadata = self.server.store(bucket, name, data, content_type, if_generation_match)
+        if metadata is None:
+            return self.respond(412, {'error': {'code': 412, 'message': 'Precondition Failed'}})
+        self.respond(200, metadata)
+
+    def not_found(self):
+        self.respond(404, {'error': {'code': 404, 'message': 'Not Found'}})
+
+    def respond(self, status, body):
+        self.respond_bytes(status, json.dumps(body).encode(), 'application/json')
+
+    def respond_bytes(self, status, payload, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=9023)
+    parser.add_argument('--delay', type=float, default=0, help='latency per call, in ms')
+    args = parser.parse_args()
+
+    server = GCSStandIn(args.delay / 1000, args.port)
+    print(f"STORAGE_EMULATOR_HOST={server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""Local stand-in for the Vision API's images:annotate, for the cloud function benchmarks.
+
+Serves POST /v1/images:annotate as google-cloud-vision's REST transport
+sends it (face_detection and batch_annotate_images both use it) and answers
+every image with 0 to 4 synthetic faces, the same number for the same URI
+each time. URIs containing "corrupt" get a per-image error instead, as the
+real API answers an image it cannot read. Each request is delayed by
+--rpc-delay plus --image-delay per image in it, and requests and images are
+counted. Used by the bench_*.py scripts next to it, or on its own:
+
+    python vision_stub.py --port 9024 --rpc-delay 80 --image-delay 20
+"""
+import argparse
+import json
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LANDMARKS = ['LEFT_EYE', 'RIGHT_EYE', 'LEFT_OF_LEFT_EYEBROW', 'RIGHT_OF_LEFT_EYEBROW', 'LEFT_OF_RIGHT_EYEBROW',
+             'RIGHT_OF_RIGHT_EYEBROW', 'MIDPOINT_BETWEEN_EYES', 'NOSE_TIP', 'UPPER_LIP', 'LOWER_LIP',
+             'MOUTH_LEFT', 'MOUTH_RIGHT', 'MOUTH_CENTER', 'NOSE_BOTTOM_RIGHT', 'NOSE_BOTTOM_LEFT',
+             'NOSE_BOTTOM_CENTER', 'LEFT_EYE_TOP_BOUNDARY', 'LEFT_EYE_RIGHT_CORNER', 'LEFT_EYE_BOTTOM_BOUNDARY',
+             'LEFT_EYE_LEFT_CORNER', 'RIGHT_EYE_TOP_BOUNDARY', 'RIGHT_EYE_RIGHT_CORNER',
+             'RIGHT_EYE_BOTTOM_BOUNDARY', 'RIGHT_EYE_LEFT_CORNER', 'LEFT_EYEBROW_UPPER_MIDPOINT',
+             'RIGHT_EYEBROW_UPPER_MIDPOINT', 'LEFT_EAR_TRAGION', 'RIGHT_EAR_TRAGION', 'FOREHEAD_GLABELLA',
+             'CHIN_GNATHION', 'CHIN_LEFT_GONION', 'CHIN_RIGHT_GONION', 'LEFT_CHEEK_CENTER', 'RIGHT_CHEEK_CENTER']
+
+
+def face_count(uri, max_results=4):
+    """How many faces the stand-in finds in ``uri``: 0 to 4, fixed per URI."""
+    return min(zlib.crc32(uri.encode()) % 5, max_results)
+
+
+def synthetic_face(i):
+    x, y = 40 * i, 30 * i
+    vertices = [{'x': x, 'y': y}, {'x': x + 120, 'y': y}, {'x': x + 120, 'y': y + 140}, {'x': x, 'y': y + 140}]
+    return {
+        'boundingPoly': {'vertices': vertices}, 'fdBoundingPoly': {'vertices': vertices},
+        'landmarks': [{'type': kind, 'position': {'x': x + 3.7 * j, 'y': y + 2.9 * j, 'z': 0.0013 * j}}
+                      for j, kind in enumerate(LANDMARKS)],
+        'rollAngle': -4.82, 'panAngle': 11.37, 'tiltAngle': 2.05,
+        'detectionConfidence': 0.9921875, 'landmarkingConfidence': 0.5634,
+        'joyLikelihood': 'VERY_LIKELY', 'sorrowLikelihood': 'VERY_UNLIKELY', 'angerLikelihood': 'VERY_UNLIKELY',
+        'surpriseLikelihood': 'UNLIKELY', 'underExposedLikelihood': 'VERY_UNLIKELY',
+        'blurredLikelihood': 'VERY_UNLIKELY', 'headwearLikelihood': 'POSSIBLE',
+    }
+
+
+class VisionStandIn(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, rpc_delay=0.0, image_delay=0.0, port=0):
+        super().__init__(('127.0.0.1', port), VisionHandler)
+        self.rpc_delay = rpc_delay
+        self.image_delay = image_delay
+        self.lock = threading.Lock()
+        self.rpcs = 0
+        self.images = 0
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def start(self):
+        """Serve from a daemon thread; returns self."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def reset_counters(self):
+        with self.lock:
+            self.rpcs = 0
+            self.images = 0
+
+    def annotate(self, request):
+        uri = request.get('image', {}).get('source', {}).get('gcsImageUri', '')
+        if 'corrupt' in uri:
+            return {'error': {'code': 3, 'message': 'Bad image data.'}}
+        max_results = min(int(feature.get('maxResults', 4)) for feature in request.get('features') or [{}])
+        return {'faceAnnotations': [synthetic_face(i) for i in range(face_count(uri, max_results))]}
+
+
+class VisionHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.path.split('?')[0] != '/v1/images:annotate':
+            return self.respond(404, {'error': {'code': 404, 'message': 'Not Found'}})
+        requests = json.loads(body or b'{}').get('requests', [])
+        with server.lock:
+            server.rpcs += 1
+            server.images += len(requests)
+        time.sleep(server.rpc_delay + server.image_delay * len(requests))
+        self.respond(200, {'responses': [server.annotate(request) for request in requests]})
+
+    def respond(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=9024)
+    parser.add_argument('--rpc-delay', type=float, default=0, help='latency per request, in ms')
+    parser.add_argument('--image-delay', type=float, default=0, help='added latency per image, in ms')
+    args = parser.parse_args()
+
+    server = VisionStandIn(args.rpc_delay / 1000, args.image_delay / 1000, args.port)
+    print(f"Vision API stand-in at {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
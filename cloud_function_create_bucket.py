@@ -1,32 +1,44 @@
+from google.api_core.exceptions import Conflict, PreconditionFailed
 from google.cloud import storage
 
-def create_bucket_and_upload(event, context):
-  """Creates a bucket and uploads a file with content."""
-
-  # Replace with your desired bucket name (globally unique)
-  bucket_name = "your-unique-bucket-name"
-
-  # Create a Storage client
-  client = storage.Client()
+# Replace with your desired bucket name (globally unique)
+BUCKET_NAME = "your-unique-bucket-name"
+DATA = "This is some data written to the file."
 
-  # Check if bucket exists
-  if not client.bucket(bucket_name).exists():
-    # Create the bucket
-    bucket = client.bucket(bucket_name)
-    bucket.create()
-    print(f"Bucket '{bucket_name}' created.")
-  else:
-    print(f"Bucket '{bucket_name}' already exists.")
+# Created once per instance and reused by every warm invocation
+client = storage.Client()
+# Buckets this instance has already made sure exist
+known_buckets = set()
 
-  # Create temporary file with content
-  with open("/tmp/data.txt", "w") as f:
-    f.write("This is some data written to the file.")
-
-  # Upload the file to the bucket
-  blob = client.bucket(bucket_name).blob("data.txt")
-  blob.upload_from_filename("/tmp/data.txt")
+def create_bucket_and_upload(event, context):
+  """Creates a bucket and uploads a file with content."""
 
-  print(f"File 'data.txt' uploaded to bucket '{bucket_name}'.")
+  bucket_name = BUCKET_NAME
+  bucket = ensure_bucket(bucket_name)
+
+  # Upload the content from memory. if_generation_match=0 only writes it if
+  # data.txt is not there yet, so a retried or repeated invocation leaves the
+  # existing object alone instead of overwriting it.
+  blob = bucket.blob("data.txt")
+  try:
+    blob.upload_from_string(DATA, content_type="text/plain", if_generation_match=0)
+    print(f"File 'data.txt' uploaded to bucket '{bucket_name}'.")
+  except PreconditionFailed:
+    print(f"File 'data.txt' already exists in bucket '{bucket_name}'.")
+
+def ensure_bucket(bucket_name):
+  """Returns the bucket, creating it the first time this instance sees it."""
+  bucket = client.bucket(bucket_name)
+  if bucket_name not in known_buckets:
+    # Create and handle "already exists" rather than check first: one request,
+    # and no race between instances that both find it missing
+    try:
+      bucket.create()
+      print(f"Bucket '{bucket_name}' created.")
+    except Conflict:
+      print(f"Bucket '{bucket_name}' already exists.")
+    known_buckets.add(bucket_name)
+  return bucket
 
 """
 **Explanation:**
@@ -34,11 +46,9 @@ def create_bucket_and_upload(event, context):
 1. **Imports:** Import the `storage` library from `google.cloud`.
 2. **Function Definition:** The function `create_bucket_and_upload` is triggered by an event (typically `http` for a web request).
 3. **Bucket Name:** Replace `"your-unique-bucket-name"` with a desired globally unique bucket name.
-4. **Storage Client:** Create a `storage.Client` object to interact with Cloud Storage.
-5. **Bucket Existence Check:** Use `client.bucket(bucket_name).exists()` to check if the bucket already exists.
-6. **Bucket Creation:** If the bucket doesn't exist, create it using `bucket.create()`.
-7. **Temporary File:** Create a temporary file in `/tmp` with desired content.
-8. **File Upload:** Use `blob.upload_from_filename` to upload the temporary file to the bucket with the name `data.txt`.
+4. **Storage Client:** A `storage.Client` object is created once, when the instance starts, and reused by every invocation it serves.
+5. **Bucket Creation:** The first invocation on an instance calls `bucket.create()`; if the bucket already exists (a `Conflict`), that is fine. Either way the name goes into `known_buckets` and later invocations skip the check.
+6. **File Upload:** `blob.upload_from_string` uploads the content from memory as `data.txt`, with `if_generation_match=0` so an existing `data.txt` is never overwritten.
 
 **Deployment:**
 
@@ -46,7 +56,7 @@ def create_bucket_and_upload(event, context):
 2.  Deploy the function using the Google Cloud Console or `gcloud functions deploy` command.
 
 **Note:**
-- This example creates a temporary file in the Cloud Function's limited memory space. For larger files, consider alternative approaches like pre-creating the file and uploading it.
+- The content is uploaded from memory: no temporary file in `/tmp`, which counts against the function's memory anyway. For larger content, `blob.upload_from_file` takes any file-like object.
 - Remember to set appropriate permissions for your Cloud Function to access Cloud Storage.
 """
 
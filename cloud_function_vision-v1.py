@@ -1,10 +1,42 @@
+from google.api_core.exceptions import NotFound, PreconditionFailed
 from google.cloud import vision, storage
-import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import base64
+import collections
+import heapq
+import itertools
+import json
 import os
+import threading
+import time
  
 vision_client = vision.ImageAnnotatorClient()
 storage_client = storage.Client()
  
+RESULTS_BUCKET = os.environ.get("RESULTS_BUCKET", "destinationmcitcloudstoragebucket")
+# Batch mode (mcitfacedetection_batch): the bucket the images land in and
+# the prefix they land under, images per Vision request
+# (batch_annotate_images takes at most 16), how many of those requests are in
+# flight at once, most images per run, and how many runs an image the Vision
+# API could not analyse is tried in before it is given up on.
+SOURCE_BUCKET = os.environ.get("SOURCE_BUCKET")
+SOURCE_PREFIX = os.environ.get("SOURCE_PREFIX", "")
+BATCH_SIZE = int(os.environ.get("BATCH_SIZE", 16))
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", 4))
+BATCH_MAX_IMAGES = int(os.environ.get("BATCH_MAX_IMAGES", 1000))
+BATCH_MAX_ATTEMPTS = int(os.environ.get("BATCH_MAX_ATTEMPTS", 3))
+BATCH_CURSOR = "batches/cursor.json"
+MAX_FACES = int(os.environ.get("MAX_FACES", 4))
+# Results by content hash (RESULTS_BUCKET/hashes/<hash>.json), so the same
+# bytes uploaded again, under any name, are not sent to the Vision API again.
+# The most recent lookups are kept in memory too, for as long as the instance lives.
+DEDUP_BY_HASH = os.environ.get("DEDUP_BY_HASH", "1") != "0"
+HASH_CACHE_SIZE = 10000
+known_results = {}
+# backfill's and the batch endpoint's worker threads share known_results
+known_results_lock = threading.Lock()
+ 
 def mcitfacedetection(data, context):
     """Triggered by a change to a Cloud Storage bucket.
     Args:
@@ -19,30 +51,370 @@ def mcitfacedetection(data, context):
     print(f"Processing file: {file_name}.")
     print(f"Bucket : {bucket_name}.")
  
-    blob = storage_client.bucket(bucket_name).get_blob(file_name)
+    key = content_key(file_data) if DEDUP_BY_HASH else None
+    known = find_result(key) if key else None
+    if known is not None and reuse_result(key, known, file_name):
+        return
+ 
+    # The Vision API reads the image from its URI, no metadata lookup needed
     blob_uri = f"gs://{bucket_name}/{file_name}"
     blob_source = vision.Image(source=vision.ImageSource(gcs_image_uri=blob_uri))
  
-    faces = vision_client.face_detection(image=blob_source, max_results=4).face_annotations
-    print(faces)
+    response = vision_client.face_detection(image=blob_source, max_results=MAX_FACES)
+    if response.error.code:
+        # Not "no faces": raised before anything is recorded under the content
+        # hash, so the image is analysed again next time (and backfill retries it)
+        raise RuntimeError(f"Face detection failed for {blob_uri}: {response.error.message}")
+    faces = response.face_annotations
+    print(f"Faces found: {len(faces)}.")
  
+    result = None
     if len(faces) > 0 :
-         uploadToGCS(faces, file_name)
+         result = uploadToGCS(faces, file_name)
+    if key:
+        record_result(key, {"faces": len(faces), "result": result}, replace=known is not None)
  
  
-def uploadToGCS(faces, file_name):
-   
-    _, temp_local_filename = tempfile.mkstemp()
+def faces_to_dicts(faces):
+    """Face annotations as the Vision REST API returns them (e.g. "joyLikelihood": "VERY_LIKELY")."""
+    return [vision.FaceAnnotation.to_dict(face, use_integers_for_enums=False, preserving_proto_field_name=False)
+            for face in faces]
  
-    f = open(temp_local_filename, "w")
-    f.write(str(faces))
-    f.close()
  
-    face_bucket = storage_client.bucket("destinationmcitcloudstoragebucket")
+def faces_to_json(faces):
+    """Face annotations as compact JSON, one object per face."""
+    return json.dumps(faces_to_dicts(faces), separators=(",", ":"))
+ 
+ 
+def uploadToGCS(faces, file_name):
+    # The JSON goes straight from faces_to_json into the results object,
+    # typed application/json so readers can parse it without sniffing.
+    face_bucket = storage_client.bucket(RESULTS_BUCKET)
     uploadfilename =  file_name + "-res.txt"
     new_blob = face_bucket.blob(uploadfilename)
-    new_blob.upload_from_filename(temp_local_filename)
-    print(f"Face Response uploaded to: gs://{face_bucket}/{uploadfilename}")
+    new_blob.upload_from_string(faces_to_json(faces), content_type="application/json")
+    print(f"Face Response uploaded to: gs://{RESULTS_BUCKET}/{uploadfilename}")
+    return uploadfilename
+ 
+ 
+def content_key(data):
+    """The object's content hash from the event's metadata: its MD5, or for
+    composite objects (which have none) its CRC32C and size. None if neither is there."""
+    if data.get("md5Hash"):
+        return base64.b64decode(data["md5Hash"]).hex()
+    if data.get("crc32c"):
+        return f"crc32c-{base64.b64decode(data['crc32c']).hex()}-{data.get('size', 0)}"
+    return None
+ 
+ 
+def find_result(key):
+    """{"faces": count, "result": results file or None} of content analysed before, or None."""
+    with known_results_lock:
+        known = known_results.get(key)
+    if known is None:
+        try:
+            known = json.loads(storage_client.bucket(RESULTS_BUCKET).blob(f"hashes/{key}.json").download_as_bytes())
+        except NotFound:
+            return None
+        remember(key, known)
+    return known
+ 
+ 
+def reuse_result(key, known, file_name):
+    """Give ``file_name`` the result of the same content analysed before;
+    False if that result is gone and the image has to be analysed again."""
+    print(f"Same content as an image already analysed: {known['faces']} faces.")
+    uploadfilename = file_name + "-res.txt"
+    if not known["result"] or known["result"] == uploadfilename:
+        return True
+    face_bucket = storage_client.bucket(RESULTS_BUCKET)
+    try:
+        # Server-side copy: the result never comes through the function
+        face_bucket.copy_blob(face_bucket.blob(known["result"]), face_bucket, uploadfilename)
+    except NotFound:
+        with known_results_lock:
+            known_results.pop(key, None)
+        return False
+    print(f"Face Response copied to: gs://{RESULTS_BUCKET}/{uploadfilename}")
+    return True
+ 
+ 
+def record_result(key, result, replace=False):
+    """Add content to the index. The first result stored for a hash stays,
+    unless ``replace`` (the one it pointed to is gone)."""
+    remember(key, result)
+    try:
+        storage_client.bucket(RESULTS_BUCKET).blob(f"hashes/{key}.json").upload_from_string(
+            json.dumps(result), content_type="application/json", if_generation_match=None if replace else 0)
+    except PreconditionFailed:
+        pass  # the same content, analysed at the same time by another instance
+ 
+ 
+def remember(key, result):
+    with known_results_lock:
+        if len(known_results) >= HASH_CACHE_SIZE:
+            known_results.pop(next(iter(known_results), None), None)
+        known_results[key] = result
+ 
+ 
+# Batch mode: instead of one trigger and one Vision request per image, an
+# HTTP function run on a schedule (e.g. Cloud Scheduler every few minutes)
+# picks up the images added to SOURCE_BUCKET since its last run (at most
+# BATCH_MAX_IMAGES a run, the oldest first), sends them to
+# batch_annotate_images BATCH_SIZE at a time, and writes one results file
+# per request to RESULTS_BUCKET/batches/. Images the Vision API returned an
+# error for are kept in the cursor and tried again at the start of the next
+# run. GCS lists by name, not by time, so every run lists everything under
+# SOURCE_PREFIX: keep it to where the uploads land. Deploy it instead of the
+# storage trigger, not next to it:
+#
+#   gcloud functions deploy mcitfacedetection_batch --trigger-http \
+#       --set-env-vars SOURCE_BUCKET=<bucket>,SOURCE_PREFIX=<uploads/>
+ 
+def mcitfacedetection_batch(request):
+    """HTTP trigger. Optional query parameters: bucket (default SOURCE_BUCKET),
+    prefix (default SOURCE_PREFIX) and limit (most images to process in this
+    run, default BATCH_MAX_IMAGES)."""
+    bucket_name = request.args.get("bucket", SOURCE_BUCKET)
+    prefix = request.args.get("prefix", SOURCE_PREFIX)
+    limit = int(request.args.get("limit", 0)) or BATCH_MAX_IMAGES
+    since, seen, failed = read_cursor()
+    # (name, blob): images that failed last time first (blob None), then new ones
+    pending = [(name, None) for name in sorted(failed)[:limit]]
+    pending += [(blob.name, blob) for blob in pending_images(bucket_name, prefix, (since, seen), limit - len(pending))]
+    print(f"Processing {len(pending)} images from {bucket_name} in batches of {BATCH_SIZE}.")
+ 
+    run = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+    batches = [pending[start:start + BATCH_SIZE] for start in range(0, len(pending), BATCH_SIZE)]
+ 
+    def process(number):
+        results = detect_faces_batch([f"gs://{bucket_name}/{name}" for name, _ in batches[number]])
+        upload_batch_results(results, f"batches/{run}-{number:05d}.json")
+        return results
+ 
+    faces_found = 0
+    with ThreadPoolExecutor(BATCH_CONCURRENCY) as pool:
+        # map() hands the batches back in order: the cursor only ever moves
+        # past batches that are done, so a run that dies part way resumes there
+        for batch, results in zip(batches, pool.map(process, range(len(batches)))):
+            for (name, blob), result in zip(batch, results):
+                faces_found += len(result.get("faces", ()))
+                if "error" not in result:
+                    failed.pop(name, None)
+                elif failed.get(name, 0) + 1 < BATCH_MAX_ATTEMPTS:
+                    failed[name] = failed.get(name, 0) + 1
+                else:
+                    print(f"Giving up on {name} after {BATCH_MAX_ATTEMPTS} attempts: {result['error']}")
+                    failed.pop(name, None)
+                if blob is not None:
+                    if blob.updated != since:
+                        since, seen = blob.updated, set()
+                    seen.add(name)
+            write_cursor(since, seen, failed)
+ 
+    return {"images": len(pending), "batches": len(batches), "faces": faces_found,
+            "failed": sum(1 for batch in batches for name, _ in batch if name in failed)}
+ 
+ 
+def pending_images(bucket_name, prefix, cursor, limit):
+    """Up to ``limit`` of the images under ``prefix`` added since ``cursor``
+    (see read_cursor), oldest first."""
+    since, seen = cursor
+    listed = storage_client.list_blobs(bucket_name, prefix=prefix or None,
+                                       fields="items(name,contentType,updated),nextPageToken")
+    pending = (blob for blob in listed
+               if (blob.content_type or "").startswith("image/")
+               and (since is None or blob.updated > since or (blob.updated == since and blob.name not in seen)))
+    # Only the oldest ``limit`` are kept while the listing goes by
+    return heapq.nsmallest(max(limit, 0), pending, key=lambda blob: (blob.updated, blob.name))
+ 
+ 
+def detect_faces_batch(uris):
+    """Face detection for up to 16 images in one request; returns one dict
+    per image: {"uri", "faces"} or {"uri", "error"}."""
+    requests = [vision.AnnotateImageRequest(
+                    image=vision.Image(source=vision.ImageSource(gcs_image_uri=uri)),
+                    features=[vision.Feature(type_=vision.Feature.Type.FACE_DETECTION, max_results=MAX_FACES)])
+                for uri in uris]
+    responses = vision_client.batch_annotate_images(requests=requests).responses
+    results = []
+    for uri, response in zip(uris, responses):
+        # A failed image fails alone, with its own status
+        if response.error.code:
+            results.append({"uri": uri, "error": response.error.message})
+        else:
+            results.append({"uri": uri, "faces": faces_to_dicts(response.face_annotations)})
+    return results
+ 
+ 
+def upload_batch_results(results, name):
+    blob = storage_client.bucket(RESULTS_BUCKET).blob(name)
+    blob.upload_from_string(json.dumps({"images": results}, separators=(",", ":")),
+                            content_type="application/json")
+    print(f"Batch results uploaded to: gs://{RESULTS_BUCKET}/{name}")
+ 
+ 
+def read_cursor():
+    """(updated time of the last image processed, names of the images
+    processed at exactly that time, {name: attempts} of the images to try
+    again), or (None, set(), {}) before the first run."""
+    blob = storage_client.bucket(RESULTS_BUCKET).get_blob(BATCH_CURSOR)
+    if blob is None:
+        return None, set(), {}
+    cursor = json.loads(blob.download_as_bytes())
+    updated = datetime.fromisoformat(cursor["updated"]) if cursor["updated"] else None
+    return updated, set(cursor["names"]), cursor.get("failed", {})
+ 
+ 
+def write_cursor(updated, names, failed):
+    storage_client.bucket(RESULTS_BUCKET).blob(BATCH_CURSOR).upload_from_string(
+        json.dumps({"updated": updated.isoformat() if updated else None, "names": sorted(names),
+                    "failed": failed}),
+        content_type="application/json")
+ 
+ 
+# Backfill: mcitfacedetection over the images already in a bucket, e.g. the
+# ones uploaded before the trigger was deployed. Runs anywhere with
+# credentials for both buckets:
+#
+#   python cloud_function_vision-v1.py <bucket> --prefix 2023/ --workers 16 --rate 25
+ 
+def backfill(bucket_name, prefix="", workers=8, rate=None, checkpoint=None, limit=None):
+    """Run mcitfacedetection on every image in ``bucket_name`` under ``prefix``,
+    ``workers`` at a time and at most ``rate`` a second (None: no limit).
+ 
+    With ``checkpoint`` (a local JSON file) progress is saved as it goes, and
+    a later call with the same file resumes after the last image done; images
+    that failed are retried first. ``limit`` stops after that many images.
+    Returns {"images", "failed", "seconds"}.
+    """
+    progress = BackfillProgress(checkpoint)
+    limiter = RateLimiter(rate) if rate else None
+    slots = threading.BoundedSemaphore(workers * 2)  # listed but not done: bounds memory, not speed
+    started = time.perf_counter()
+    counts = {"images": 0, "failed": 0}
+    lock = threading.Lock()
+ 
+    def process(entry, data):
+        try:
+            if limiter:
+                limiter.wait()
+            try:
+                mcitfacedetection(data, None)
+                ok = True
+            except Exception as e:
+                print(f"Face detection failed for {data['name']}: {e}")
+                ok = False
+            with lock:
+                counts["images"] += 1
+                counts["failed"] += not ok
+            progress.finished(entry, ok)
+        finally:
+            slots.release()
+ 
+    with ThreadPoolExecutor(workers) as pool:
+        for data, retry in backfill_images(bucket_name, prefix, progress, limit):
+            slots.acquire()
+            pool.submit(process, progress.started(data["name"], retry), data)
+    progress.save()
+    return dict(counts, seconds=time.perf_counter() - started)
+ 
+ 
+def backfill_images(bucket_name, prefix, progress, limit):
+    """(event data, retry) for the images to process: the ones that failed
+    last time, then the bucket's images after the checkpoint, in name order."""
+    retries = [({"bucket": bucket_name, "name": name}, True) for name in progress.failed]
+    # What the storage trigger passes, as far as mcitfacedetection reads it
+    listed = (({"bucket": bucket_name, "name": blob.name, "md5Hash": blob.md5_hash, "crc32c": blob.crc32c,
+                "size": blob.size}, False)
+              for blob in storage_client.list_blobs(bucket_name, prefix=prefix, start_offset=progress.after or None)
+              if blob.name != progress.after and (blob.content_type or "").startswith("image/"))
+    return itertools.islice(itertools.chain(retries, listed), limit)
+ 
+ 
+class BackfillProgress:
+    """Where a backfill is: the last name up to which every listed image is
+    done, and the images that failed. Saved to ``path`` every CHECKPOINT_EVERY
+    images (and at the end); without a path, kept in memory only."""
+ 
+    CHECKPOINT_EVERY = 100
+ 
+    def __init__(self, path=None):
+        self.path = path
+        self.after = None
+        self.failed = []
+        if path and os.path.exists(path):
+            with open(path) as f:
+                saved = json.load(f)
+            self.after, self.failed = saved["after"], saved["failed"]
+        self._lock = threading.Lock()
+        self._in_order = collections.deque()  # [name, done] of listed images, in listing order
+        self._unsaved = 0
+ 
+    def started(self, name, retry=False):
+        """An image handed to a worker; returns what to pass to finished()."""
+        entry = [name, False, retry]
+        if not retry:
+            with self._lock:
+                self._in_order.append(entry)
+        return entry
+ 
+    def finished(self, entry, ok):
+        name, _, retry = entry
+        with self._lock:
+            entry[1] = True
+            while self._in_order and self._in_order[0][1]:
+                self.after = self._in_order.popleft()[0]
+            # A retry stays on the list until it succeeds
+            if retry and ok:
+                self.failed.remove(name)
+            elif not retry and not ok:
+                self.failed.append(name)
+            self._unsaved += 1
+            save = self._unsaved >= self.CHECKPOINT_EVERY
+        if save:
+            self.save()
+ 
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            state = {"after": self.after, "failed": list(self.failed)}
+            self._unsaved = 0
+            # Written whole and renamed into place, so a crash never leaves half a file
+            with open(self.path + ".tmp", "w") as f:
+                json.dump(state, f)
+            os.replace(self.path + ".tmp", self.path)
+ 
+ 
+class RateLimiter:
+    """At most ``rate`` calls of wait() a second, spread evenly, across threads."""
+ 
+    def __init__(self, rate):
+        self.interval = 1 / rate
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+ 
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            at = max(self._next, now)
+            self._next = at + self.interval
+        time.sleep(at - now)
+ 
+ 
+if __name__ == "__main__":
+    import argparse
  
-    # Delete the temporary file.
-    os.remove(temp_local_filename)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run face detection on the images already in a bucket.")
+    parser.add_argument("bucket")
+    parser.add_argument("--prefix", default="")
+    parser.add_argument("--workers", type=int, default=8, help="images processed at once")
+    parser.add_argument("--rate", type=float, default=None, help="most images a second (default: no limit)")
+    parser.add_argument("--checkpoint", default=None,
+                        help="progress file to resume from (default: backfill-<bucket>.json)")
+    parser.add_argument("--limit", type=int, default=None, help="stop after this many images")
+    args = parser.parse_args()
+    done = backfill(args.bucket, args.prefix, args.workers, args.rate,
+                    args.checkpoint or f"backfill-{args.bucket}.json", args.limit)
+    print(f"{done['images']} images in {done['seconds']:.1f} s, {done['failed']} failed.")
\ No newline at end of file
@@ -2,7 +2,10 @@ import tkinter as tk
 from tkinter import messagebox
 import hashlib
 import re
-from datetime import datetime
+from datetime import date
+
+# Compiled once; much cheaper per call than datetime.strptime
+DATE_PATTERN = re.compile(r'(\d{1,2})/(\d{1,2})/(\d{4})')
 
 class FishingTournamentRegistration:
     def __init__(self, master):
@@ -72,8 +75,12 @@ class FishingTournamentRegistration:
 
     @staticmethod
     def validate_date(date_string):
+        match = DATE_PATTERN.fullmatch(date_string)
+        if not match:
+            return False
+        day, month, year = map(int, match.groups())
         try:
-            datetime.strptime(date_string, "%d/%m/%Y")
+            date(year, month, day)
             return True
         except ValueError:
             return False